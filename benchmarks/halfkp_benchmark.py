@@ -0,0 +1,56 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+import chess
+
+from neural_network.features.halfkp import Features, FactorizedFeatures
+
+
+def random_positions(count: int, max_plies: int) -> list[chess.Board]:
+    """Play random games and collect the positions reached along the way."""
+    boards = []
+    while len(boards) < count:
+        board = chess.Board()
+        for _ in range(random.randint(0, max_plies)):
+            legal_moves = list(board.legal_moves)
+            if not legal_moves:
+                break
+            board.push(random.choice(legal_moves))
+        boards.append(board)
+    return boards
+
+
+def time_per_board(function, boards, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for board in boards:
+            function(board)
+    return (time.perf_counter() - start) / (repeats * len(boards))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the dense and sparse HalfKP feature extraction.")
+    parser.add_argument("--positions", type=int, default=200, help="Random positions to extract features from.")
+    parser.add_argument("--max-plies", type=int, default=80, help="Longest random game a position is taken from.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per measurement.")
+    args = parser.parse_args()
+
+    random.seed(0)
+    boards = random_positions(args.positions, args.max_plies)
+
+    print(f"{'block':>8} {'dense us':>10} {'sparse us':>10} {'speedup':>8}")
+    for block in (Features(), FactorizedFeatures()):
+        # Warm up, the numba kernel is compiled on first use
+        block.get_active_indices(boards[0])
+        dense = time_per_board(block.get_active_features, boards, args.repeats)
+        sparse = time_per_board(block.get_active_indices, boards, args.repeats)
+        print(f"{block.name:>8} {dense * 1e6:>10.1f} {sparse * 1e6:>10.1f} {dense / sparse:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
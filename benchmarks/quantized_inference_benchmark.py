@@ -0,0 +1,92 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+import chess
+import torch
+from torch import nn
+
+from neural_network.model import generate_stockfish_nn
+from neural_network.quantize import QuantizationConfig, calibrate_activation_ranges
+from neural_network.quantized_inference import accuracy_report, calibration_positions
+from tournaments.tournament import convert_board_to_features
+
+
+def random_positions(count: int, max_plies: int) -> list[chess.Board]:
+    """Play random games and collect the positions reached along the way."""
+    boards = []
+    while len(boards) < count:
+        board = chess.Board()
+        for _ in range(random.randint(0, max_plies)):
+            legal_moves = list(board.legal_moves)
+            if not legal_moves:
+                break
+            board.push(random.choice(legal_moves))
+        boards.append(board)
+    return boards
+
+
+def time_call(function, repeats):
+    # The fastest run, the others are slowed down by whatever else runs on the machine
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the quantized inference backend with float inference.")
+    parser.add_argument("--positions", type=int, default=500, help="Random positions to evaluate.")
+    parser.add_argument("--max-plies", type=int, default=80, help="Longest random game a position is taken from.")
+    parser.add_argument("--batch-size", type=int, default=256, help="Positions per batched evaluation.")
+    parser.add_argument("--repeats", type=int, default=5, help="Timed runs per measurement.")
+    parser.add_argument("--threads", type=int, default=1, help="Torch threads, 1 to compare single-core throughput.")
+    args = parser.parse_args()
+
+    random.seed(0)
+    torch.manual_seed(0)
+    torch.set_num_threads(args.threads)
+
+    # Weights like those of generate_population
+    model = generate_stockfish_nn()
+    for layer in model.model:
+        if isinstance(layer, nn.Linear):
+            layer.weight.data = torch.randn_like(layer.weight) * 0.1
+            layer.bias.data = torch.randn_like(layer.bias) * 0.1
+
+    boards = random_positions(args.positions, args.max_plies)
+    # Measured on other positions than the evaluated ones, like main.py does
+    calibration_inputs = torch.tensor([convert_board_to_features(board) for board in calibration_positions()], dtype=torch.float32)
+    calibrated = QuantizationConfig(activation_ranges=calibrate_activation_ranges(model, calibration_inputs))
+    for name, config in (("Stockfish activation ranges", None), ("calibrated activation ranges", calibrated)):
+        print(f"Accuracy of the quantized backend with {name}:")
+        for key, value in accuracy_report(model, boards, convert_board_to_features, config).items():
+            print(f"  {key}: {value:.4f}" if isinstance(value, float) else f"  {key}: {value}")
+
+    features = torch.tensor([convert_board_to_features(board) for board in boards[:args.batch_size]], dtype=torch.float32)
+    print(f"{'backend':>10} {'batch us/pos':>13} {'select_move us':>15}")
+    for inference in ("float", "quantized"):
+        model.set_inference(inference, calibration_inputs=calibration_inputs)
+        # Warm up, the numba kernels are compiled on first use
+        model.evaluate_boards(features[:2])
+        batch_seconds = time_call(lambda: model.evaluate_boards(features), args.repeats)
+
+        accumulators = [model.create_accumulator(board) for board in boards]
+
+        def select_all():
+            for board, accumulator in zip(boards, accumulators):
+                if not board.is_game_over():
+                    model.select_move(board, convert_board_to_features, accumulator=accumulator)
+
+        select_seconds = time_call(select_all, args.repeats)
+        print(f"{inference:>10} {batch_seconds / len(features) * 1e6:>13.2f} {select_seconds / len(boards) * 1e6:>15.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+import torch
+
+from neural_network.selection import SelectionConfig, select
+
+
+class ScoredModel:
+    """Stand-in for PopulationModel, selection only looks at the score."""
+
+    def __init__(self, score):
+        self.score = score
+
+
+def legacy_select_with_softmax(population, num_to_select):
+    """The selection loop previously used by create_new_generation, kept as a baseline."""
+    population = list(population)
+    exp_scores = [math.exp(model.score) for model in population]
+    total = sum(exp_scores)
+    probabilities = [exp_score / total for exp_score in exp_scores]
+
+    selected = []
+    for _ in range(num_to_select):
+        if not population:
+            break
+        chosen = random.choices(population, weights=probabilities, k=1)[0]
+        selected.append(chosen)
+        index = population.index(chosen)
+        population.pop(index)
+        probabilities.pop(index)
+        if population:
+            total = sum(probabilities)
+            probabilities = [p / total for p in probabilities]
+    return selected
+
+
+def time_call(function, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return (time.perf_counter() - start) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the selection operators on large populations.")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 10000, 100000], help="Population sizes to time.")
+    parser.add_argument("--survival-rate", type=float, default=0.4, help="Fraction of the population to select.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per measurement.")
+    parser.add_argument("--legacy-limit", type=int, default=10000, help="Largest population the legacy loop is timed on.")
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    methods = [SelectionConfig(method="softmax", temperature=20.0), SelectionConfig(method="rank"), SelectionConfig(method="tournament")]
+
+    print(f"{'size':>8} {'selected':>8} {'method':>10} {'seconds':>10}")
+    for size in args.sizes:
+        # Scores like those of real tournaments, 10 points per win against an engine ladder
+        population = [ScoredModel(random.randint(0, 600)) for _ in range(size)]
+        num_to_select = max(1, int(args.survival_rate * size))
+
+        for config in methods:
+            seconds = time_call(lambda: select(population, num_to_select, config, generator), args.repeats)
+            print(f"{size:>8} {num_to_select:>8} {config.method:>10} {seconds:>10.4f}")
+
+        if size <= args.legacy_limit:
+            # The legacy loop overflows on real scores, time it on scores scaled into range
+            scaled_population = [ScoredModel(model.score / 20) for model in population]
+            seconds = time_call(lambda: legacy_select_with_softmax(scaled_population, num_to_select), 1)
+            print(f"{size:>8} {num_to_select:>8} {'legacy':>10} {seconds:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "../")))
+
+import chess
+import chess.engine
+
+from engines.load_engine import (
+    debug_print,
+    get_max_index,
+    get_engine_info_by_index,
+    load_engine_by_index,
+    load_engine_profiles,
+    save_engine_profiles,
+    DEFAULT_MOVETIME,
+)
+
+# Opening, middlegame and endgame positions the engines are timed on
+CALIBRATION_FENS = [
+    chess.STARTING_FEN,
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "r2q1rk1/pp2bppp/2n1pn2/3p4/3P4/2NBPN2/PP3PPP/R2Q1RK1 w - - 0 10",
+    "2r3k1/5pp1/p3p2p/1p1r4/3P4/P3RP2/1P4PP/4R1K1 w - - 0 30",
+    "8/5k2/3p4/1p1Pp2p/pP2Pp1P/P4P1K/8/8 b - - 99 50",
+]
+
+
+def measure_nps(index, probe_time=1.0, debug=False):
+    """Measure the search speed of an engine on the calibration positions.
+
+    Args:
+        index (int): The index of the engine in enginelist.csv.
+        probe_time (float): How long to search each position, in seconds.
+        debug (bool): Enable debug mode.
+
+    Returns:
+        float: The nodes searched per second, or None if the engine does not report node counts.
+    """
+    engine = load_engine_by_index(index, debug=debug)
+    total_nodes = 0
+    total_time = 0.0
+    try:
+        for fen in CALIBRATION_FENS:
+            info = engine.analyse(chess.Board(fen), chess.engine.Limit(time=probe_time))
+            nodes = info.get("nodes")
+            if not nodes:
+                continue
+            total_nodes += nodes
+            total_time += info.get("time") or probe_time
+            debug_print(f"{fen}: {nodes} nodes", debug)
+    finally:
+        engine.quit()
+
+    if not total_nodes or not total_time:
+        return None
+    return total_nodes / total_time
+
+
+def calibrate_engines(indices=None, probe_time=1.0, reference_movetime=None, target_movetime=None, dry_run=False, debug=False):
+    """Derive node budgets from the locally measured speed of every engine.
+
+    The node budget of an engine is the number of nodes it searches in the reference move
+    time on this machine, the move time its ELO in enginelist.csv refers to. The engines
+    then play at the strength their ELOs describe, and node budgets keep that strength
+    fixed regardless of machine load.
+
+    A shorter target move time gives faster games, but every engine then plays weaker
+    than its ELO, although the engines keep their order of strength.
+
+    Only the node budget and the measured speed of a profile are replaced. Depth and move
+    time limits already in a profile are kept, and still cap the search.
+
+    Args:
+        indices (list[int], optional): The engines to calibrate. Defaults to all engines.
+        probe_time (float): How long to search each calibration position, in seconds.
+        reference_movetime (float, optional): The move time the engine ELOs refer to, in seconds.
+            Defaults to the reference move time of engineprofiles.json.
+        target_movetime (float, optional): The search time the node budgets are worth, in
+            seconds. Defaults to the reference move time.
+        dry_run (bool): Print the node budgets without saving them.
+        debug (bool): Enable debug mode.
+
+    Raises:
+        ValueError: If the target move time is not positive.
+
+    Returns:
+        dict: The updated profiles.
+    """
+    profiles = load_engine_profiles(debug=debug)
+    if reference_movetime is None:
+        reference_movetime = profiles.get("reference_movetime", DEFAULT_MOVETIME)
+    if target_movetime is None:
+        target_movetime = reference_movetime
+    if target_movetime <= 0:
+        raise ValueError(f"The target move time must be positive, got {target_movetime}s.")
+    if target_movetime < reference_movetime:
+        print(f"Node budgets are worth {target_movetime}s of search, the engines will play weaker than their ELOs at {reference_movetime}s per move.")
+    profiles["reference_movetime"] = reference_movetime
+
+    if indices is None:
+        indices = range(get_max_index() + 1)
+
+    for index in indices:
+        engine_name = get_engine_info_by_index(index, debug=debug)["name"]
+        print(f"Calibrating {engine_name}...")
+        try:
+            nps = measure_nps(index, probe_time, debug=debug)
+        except (OSError, chess.engine.EngineError) as e:
+            print(f"Could not calibrate {engine_name}: {e}")
+            continue
+
+        if nps is None:
+            print(f"{engine_name} does not report node counts, keeping its current profile.")
+            continue
+
+        nodes = max(1, int(nps * target_movetime))
+        profiles["engines"].setdefault(engine_name, {}).update(nodes=nodes, nps=int(nps))
+        print(f"{engine_name}: {int(nps)} nps, {nodes} nodes per move")
+
+    if not dry_run:
+        save_engine_profiles(profiles, debug=debug)
+    return profiles
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Derive per-engine node budgets from the local engine speed.")
+    parser.add_argument("--engines", type=int, nargs="*", help="Indices of the engines to calibrate. Defaults to all engines.")
+    parser.add_argument("--probe-time", type=float, default=1.0, help="Search time per calibration position, in seconds.")
+    parser.add_argument("--reference-movetime", type=float, help="Move time the engine ELOs refer to, in seconds.")
+    parser.add_argument("--target-movetime", type=float, help="Search time the node budgets are worth, in seconds. Defaults to the reference move time.")
+    parser.add_argument("--dry-run", action="store_true", help="Print the node budgets without saving them.")
+    parser.add_argument("--debug", action="store_true", help="Enable debug mode.")
+    args = parser.parse_args()
+
+    calibrate_engines(args.engines, args.probe_time, args.reference_movetime, args.target_movetime, args.dry_run, args.debug)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+
+import chess.engine
+
+from engines.load_engine import load_engine_by_index, get_engine_path_by_index, debug_print
+
+# Errors that mean the engine process is no longer usable
+ENGINE_FAILURES = (chess.engine.EngineError, TimeoutError)
+
+
+class EnginePool:
+    """Keep warm UCI engine processes keyed by engine index and share them between tournaments.
+
+    Engines are checked out by one tournament at a time and returned afterwards, so the
+    process spawn and UCI handshake are only paid when no idle engine of that index is
+    available. The pool is safe to share between the worker threads of a ThreadPoolExecutor.
+
+    Callers should pass a distinct ``game`` key to ``engine.play`` for every game so that
+    python-chess sends ``ucinewgame`` to the engine before the first move of a new game.
+    """
+
+    def __init__(self, debug=False):
+        self.debug = debug
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.restarts = 0
+
+    def checkout(self, index):
+        """Take an engine for the given index out of the pool, starting a new one if none is idle.
+
+        Idle engines are pinged before they are handed out. Engines that crashed while idle
+        are discarded and replaced by a fresh process.
+
+        Args:
+            index (int): The index of the engine in enginelist.csv.
+
+        Returns:
+            chess.engine.SimpleEngine: A running engine, owned by the caller until released.
+        """
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Engine pool is closed.")
+                idle = self._idle.get(index)
+                engine = idle.pop() if idle else None
+
+            if engine is None:
+                break
+
+            try:
+                engine.ping()
+            except ENGINE_FAILURES:
+                debug_print(f"Idle engine at index {index} is not responding. Restarting it...", self.debug)
+                self._discard(engine)
+                continue
+
+            with self._lock:
+                self.hits += 1
+            debug_print(f"Reusing warm engine at index {index}.", self.debug)
+            return engine
+
+        engine = load_engine_by_index(index, debug=self.debug)
+        with self._lock:
+            self.misses += 1
+        return engine
+
+    def release(self, index, engine, crashed=False):
+        """Return an engine to the pool.
+
+        Args:
+            index (int): The index the engine was checked out with.
+            engine (chess.engine.SimpleEngine): The engine to return.
+            crashed (bool): Whether the engine failed while checked out. Crashed engines are
+                shut down instead of being reused, and replaced on the next checkout.
+        """
+        if crashed:
+            debug_print(f"Engine at index {index} crashed. It will be restarted on next use.", self.debug)
+            self._discard(engine)
+            return
+
+        with self._lock:
+            if not self._closed:
+                self._idle.setdefault(index, []).append(engine)
+                return
+
+        self._quit(engine)
+
+    @contextmanager
+    def engine(self, index):
+        """Check out an engine for the duration of a with block and return it afterwards."""
+        engine = self.checkout(index)
+        try:
+            yield engine
+        except ENGINE_FAILURES:
+            self.release(index, engine, crashed=True)
+            raise
+        except BaseException:
+            self.release(index, engine)
+            raise
+        else:
+            self.release(index, engine)
+
+    def stats(self):
+        """Get the pool hit/miss statistics.
+
+        Returns:
+            dict: The number of hits, misses, restarts and idle engines, and the hit rate.
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "restarts": self.restarts,
+                "idle": sum(len(engines) for engines in self._idle.values()),
+                "hit_rate": self.hits / requests if requests else 0.0,
+            }
+
+    def close(self):
+        """Shut down all idle engines. Engines still checked out are shut down when released."""
+        with self._lock:
+            self._closed = True
+            engines = [engine for idle in self._idle.values() for engine in idle]
+            self._idle.clear()
+
+        for engine in engines:
+            self._quit(engine)
+
+    def _discard(self, engine):
+        with self._lock:
+            self.restarts += 1
+        self._quit(engine)
+
+    @staticmethod
+    def _quit(engine):
+        try:
+            engine.quit()
+        except ENGINE_FAILURES:
+            # The process is already gone, make sure nothing is left behind
+            engine.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class AsyncEnginePool:
+    """Keep warm UCI engine protocols keyed by engine index for asyncio tournaments.
+
+    This is the asyncio counterpart of EnginePool. Engines are started with
+    chess.engine.popen_uci and all of them are driven by the running event loop, so no
+    thread is needed per engine. The pool must only be used from that event loop.
+    """
+
+    def __init__(self, debug=False):
+        self.debug = debug
+        self._idle = {}
+        self._closing = set()
+        self._closed = False
+        self.hits = 0
+        self.misses = 0
+        self.restarts = 0
+
+    async def checkout(self, index):
+        """Take an engine for the given index out of the pool, starting a new one if none is idle.
+
+        Args:
+            index (int): The index of the engine in enginelist.csv.
+
+        Returns:
+            chess.engine.UciProtocol: A running engine, owned by the caller until released.
+        """
+        if self._closed:
+            raise RuntimeError("Engine pool is closed.")
+
+        idle = self._idle.get(index)
+        while idle:
+            protocol = idle.pop()
+            if protocol.returncode.done():
+                debug_print(f"Idle engine at index {index} has exited. Restarting it...", self.debug)
+                self.restarts += 1
+                continue
+
+            self.hits += 1
+            return protocol
+
+        self.misses += 1
+        _, protocol = await chess.engine.popen_uci(get_engine_path_by_index(index, debug=self.debug))
+        return protocol
+
+    def release(self, index, protocol, crashed=False):
+        """Return an engine to the pool.
+
+        Args:
+            index (int): The index the engine was checked out with.
+            protocol (chess.engine.UciProtocol): The engine to return.
+            crashed (bool): Whether the engine failed or was interrupted while checked out.
+                Such engines are shut down instead of being reused.
+        """
+        if crashed:
+            debug_print(f"Engine at index {index} crashed. It will be restarted on next use.", self.debug)
+            self.restarts += 1
+        elif not self._closed:
+            self._idle.setdefault(index, []).append(protocol)
+            return
+
+        task = asyncio.ensure_future(self._quit(protocol))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @asynccontextmanager
+    async def engine(self, index):
+        """Check out an engine for the duration of an async with block and return it afterwards."""
+        protocol = await self.checkout(index)
+        try:
+            yield protocol
+        except (*ENGINE_FAILURES, asyncio.CancelledError):
+            self.release(index, protocol, crashed=True)
+            raise
+        except BaseException:
+            self.release(index, protocol)
+            raise
+        else:
+            self.release(index, protocol)
+
+    def stats(self):
+        """Get the pool hit/miss statistics.
+
+        Returns:
+            dict: The number of hits, misses, restarts and idle engines, and the hit rate.
+        """
+        requests = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "restarts": self.restarts,
+            "idle": sum(len(protocols) for protocols in self._idle.values()),
+            "hit_rate": self.hits / requests if requests else 0.0,
+        }
+
+    async def close(self):
+        """Shut down all engines of the pool."""
+        self._closed = True
+        protocols = [protocol for idle in self._idle.values() for protocol in idle]
+        self._idle.clear()
+
+        await asyncio.gather(*(self._quit(protocol) for protocol in protocols), *self._closing)
+
+    @staticmethod
+    async def _quit(protocol):
+        try:
+            await protocol.quit()
+        except ENGINE_FAILURES:
+            # The process is already gone
+            pass
@@ -1,7 +1,11 @@
 import chess.engine
 import csv
+import json
 import os
 
+# Move time used for engines without a profile, in seconds
+DEFAULT_MOVETIME = 1.0
+
 def debug_print(message, debug):
     if debug:
         print(message)
@@ -17,9 +21,9 @@ def get_max_index(debug=False):
         reader = list(csv.DictReader(csvfile))
         return len(reader) - 1
 
-def load_engine_by_index(index, debug=False):
-    """Load a chess engine by its index in the enginelist.csv file."""
-    debug_print(f"Loading engine at index {index}...", debug)
+def get_engine_path_by_index(index, debug=False):
+    """Get the path of the executable of a chess engine by its index in the enginelist.csv file."""
+    debug_print(f"Resolving engine path at index {index}...", debug)
     base_dir = os.path.dirname(os.path.abspath(__file__))
     enginelist_path = os.path.join(base_dir, "enginelist.csv")
     executables_dir = os.path.join(base_dir, "executables")
@@ -35,7 +39,13 @@ def load_engine_by_index(index, debug=False):
 
         debug_print(f"Engine path: {engine_path}", debug)
 
-        return chess.engine.SimpleEngine.popen_uci(engine_path)
+        return engine_path
+
+def load_engine_by_index(index, debug=False):
+    """Load a chess engine by its index in the enginelist.csv file."""
+    debug_print(f"Loading engine at index {index}...", debug)
+    engine_path = get_engine_path_by_index(index, debug=debug)
+    return chess.engine.SimpleEngine.popen_uci(engine_path)
 
 def get_engine_info_by_index(index, debug=False):
     """Get the ELO and name of an engine by its index."""
@@ -54,6 +64,59 @@ def get_engine_info_by_index(index, debug=False):
 
         return {"name": engine["name"], "elo": int(engine["elo"])}
 
+def load_engine_profiles(debug=False):
+    """Load the time-control profiles from the engineprofiles.json file."""
+    debug_print("Reading engineprofiles.json...", debug)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    profiles_path = os.path.join(base_dir, "engineprofiles.json")
+
+    if not os.path.exists(profiles_path):
+        return {"reference_movetime": DEFAULT_MOVETIME, "engines": {}}
+
+    with open(profiles_path, "r") as profiles_file:
+        return json.load(profiles_file)
+
+def save_engine_profiles(profiles, debug=False):
+    """Write the time-control profiles to the engineprofiles.json file."""
+    debug_print("Writing engineprofiles.json...", debug)
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    profiles_path = os.path.join(base_dir, "engineprofiles.json")
+
+    with open(profiles_path, "w") as profiles_file:
+        json.dump(profiles, profiles_file, indent=4)
+        profiles_file.write("\n")
+
+def get_engine_limit_by_index(index, debug=False):
+    """Get the search limit an engine plays with, from its profile in engineprofiles.json.
+
+    A profile can set "nodes", "depth" and "movetime" (in seconds). Engines without a
+    profile search for the reference move time.
+    """
+    engine_name = get_engine_info_by_index(index, debug=debug)["name"]
+    profiles = load_engine_profiles(debug=debug)
+    profile = profiles["engines"].get(engine_name)
+
+    if not profile or not any(key in profile for key in ("nodes", "depth", "movetime")):
+        limit = chess.engine.Limit(time=profiles.get("reference_movetime", DEFAULT_MOVETIME))
+    else:
+        limit = chess.engine.Limit(
+            nodes=profile.get("nodes"),
+            depth=profile.get("depth"),
+            time=profile.get("movetime"),
+        )
+
+    debug_print(f"Search limit for engine {engine_name}: {limit}", debug)
+    return limit
+
+def get_uncacheable_engines(debug=False):
+    """Get the names of the engines whose profile sets "cacheable" to false.
+
+    These engines do not always reply the same way to a position under the same limit,
+    like an engine that plays random moves, so their replies must never be cached.
+    """
+    profiles = load_engine_profiles(debug=debug)
+    return {name for name, profile in profiles["engines"].items() if not profile.get("cacheable", True)}
+
 # Name-based methods
 def load_engine(engine_name, debug=False):
     """Load a chess engine by name from the enginelist.csv file."""
@@ -0,0 +1,158 @@
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import chess
+import chess.polyglot
+
+from engines.load_engine import get_uncacheable_engines
+
+
+def is_cacheable(limit):
+    """Check whether an engine searching with this limit always replies the same way.
+
+    Only node, depth and mate limits are deterministic. Time limits depend on the machine
+    load, so their replies are never cached.
+    """
+    if limit.time is not None or limit.white_clock is not None or limit.black_clock is not None:
+        return False
+    return limit.nodes is not None or limit.depth is not None or limit.mate is not None
+
+
+def _to_sqlite_int(value):
+    # Zobrist hashes are unsigned 64-bit, SQLite integers are signed
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+class EngineReplyCache:
+    """Cache engine replies keyed by engine, position and search limit.
+
+    Recently used replies are kept in an in-memory LRU, backed by an SQLite store on disk
+    so that replies survive across generations and training runs. Positions are keyed by
+    their Zobrist hash. Engines are keyed by name rather than by index, because the index
+    of an engine changes when enginelist.csv is re-sorted. Engines whose profile in
+    engineprofiles.json sets "cacheable" to false are never cached.
+
+    The cache is safe to share between threads. Worker processes should each open their own
+    cache on the same file. Every reply is committed as soon as it is stored, so a writer
+    only holds the database lock for a single insert and never blocks the other workers.
+    """
+
+    def __init__(self, path="engine_cache.sqlite", max_memory_entries=100000, uncacheable_engines=None):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        if uncacheable_engines is None:
+            uncacheable_engines = get_uncacheable_engines()
+        self.uncacheable_engines = set(uncacheable_engines)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # Autocommit mode, every statement runs in its own transaction
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS replies ("
+            "engine TEXT NOT NULL, position INTEGER NOT NULL, search_limit TEXT NOT NULL, "
+            "move TEXT NOT NULL, score INTEGER, "
+            "PRIMARY KEY (engine, position, search_limit))"
+        )
+
+    @staticmethod
+    def key(engine_name, board, limit):
+        """Get the cache key of the engine reply to a position."""
+        return engine_name, chess.polyglot.zobrist_hash(board), repr(limit)
+
+    def is_cacheable(self, engine_name, limit):
+        """Check whether the replies of an engine searching with this limit can be cached."""
+        return engine_name not in self.uncacheable_engines and is_cacheable(limit)
+
+    def get(self, engine_name, board, limit):
+        """Look up the cached reply of an engine to a position.
+
+        Args:
+            engine_name (str): Name of the engine.
+            board (chess.Board): The position the engine has to move in.
+            limit (chess.engine.Limit): The search limit of the engine.
+
+        Returns:
+            tuple: The cached move and engine score (None if not reported), or None on a miss.
+        """
+        if not self.is_cacheable(engine_name, limit):
+            return None
+
+        key = self.key(engine_name, board, limit)
+        with self._lock:
+            reply = self._memory.get(key)
+            if reply is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return reply
+
+            row = self._connection.execute(
+                "SELECT move, score FROM replies WHERE engine = ? AND position = ? AND search_limit = ?",
+                (key[0], _to_sqlite_int(key[1]), key[2]),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            reply = (chess.Move.from_uci(row[0]), row[1])
+            self._remember(key, reply)
+            self.disk_hits += 1
+            return reply
+
+    def put(self, engine_name, board, limit, move, score=None):
+        """Store the reply of an engine to a position.
+
+        Args:
+            engine_name (str): Name of the engine.
+            board (chess.Board): The position the engine moved in, before the move.
+            limit (chess.engine.Limit): The search limit of the engine.
+            move (chess.Move): The move the engine played.
+            score (int, optional): The score the engine reported.
+        """
+        if not self.is_cacheable(engine_name, limit):
+            return
+
+        key = self.key(engine_name, board, limit)
+        with self._lock:
+            self._remember(key, (move, score))
+            self._connection.execute(
+                "INSERT OR REPLACE INTO replies (engine, position, search_limit, move, score) VALUES (?, ?, ?, ?, ?)",
+                (key[0], _to_sqlite_int(key[1]), key[2], move.uci(), score),
+            )
+
+    def _remember(self, key, reply):
+        self._memory[key] = reply
+        self._memory.move_to_end(key)
+        if len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """Get the cache hit statistics.
+
+        Returns:
+            dict: The number of memory hits, disk hits and misses, and the hit rate.
+        """
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        """Close the store."""
+        with self._lock:
+            self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
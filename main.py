@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import os
 from concurrent.futures import ThreadPoolExecutor
@@ -12,13 +13,27 @@ from engines.load_engine import (
     get_engine_elo, 
     get_engine_info_by_index
 )
+from engines.engine_pool import EnginePool, AsyncEnginePool
+from engines.reply_cache import EngineReplyCache
 import tournaments.tournament as tournament
+from tournaments.process_executor import ProcessTournamentExecutor
+from tournaments.async_tournament import run_tournaments_async
+from tournaments.lockstep import run_tournaments_lockstep
+from tournaments.adjudication import AdjudicationConfig
+from tournaments.fitness_cache import FitnessCache
 import random
+import torch
 from neural_network.model import generate_stockfish_nn
 import json
 from neural_network.neural_network import create_new_generation, load_population_from_folder, PopulationModel
 from neural_network.neural_network import generate_population_from_nnue
+from neural_network.selection import SelectionConfig
+from neural_network.lineage import LineageRegistry
+from neural_network.checkpoint_writer import CheckpointWriter
+from neural_network.model_store import ModelStore
+from neural_network.population_store import PopulationStore
 from neural_network.model import generate_nn_from_config
+from neural_network.quantized_inference import calibration_positions
 
 
 
@@ -46,12 +61,22 @@ def main():
     mutation_rate = settings["mutation_rate"]
     temperature = settings["temperature"]
     decay_rate = settings["decay_rate"]
+    crossover = settings.get("crossover", "average")
     generation = 0
     current_level = 0
 
-    # Load initial population or generate a new one
+    # Generation snapshots are written to disk in the background while the next tournaments run
+    checkpoint_writer = CheckpointWriter(settings.get("checkpoint_queue_size", 2))
+
+    # Snapshots store every distinct network once, compressed, with a manifest per generation
+    model_store = ModelStore("models", settings.get("model_compression", "zlib"), checkpoint_writer)
+
+    # Load initial population or generate a new one, from the model store or from a folder of .nnue files
     try:
-        population = load_population_from_folder(f"models/generation{generation}")
+        try:
+            population = model_store.load_generation(generation)
+        except FileNotFoundError:
+            population = load_population_from_folder(f"models/generation{generation}")
         print(f"Loaded population from generation {generation}.")
     except FileNotFoundError:
         print("No existing population found. Generating a new one.")
@@ -85,61 +110,177 @@ def main():
     previous_total_score = float("-inf")
     last_level_up_generation = -1
 
-    while generation < max_generations:
-        print(f"Starting tournament for generation {generation}...")
-        with ThreadPoolExecutor() as executor:
-            results = list(executor.map(
-                lambda model: tournament.run_tournament(model.name, generation, model.model, debug=False),
-                population
-            ))
-
-        for model, (score, level) in zip(population, results):
-            model.score = score
-            model.level = level
-
-        # Calculate the total score of the current generation
-        current_total_score = sum(model.score for model in population)
-        print(f"Total score for generation {generation}: {current_total_score:.2f}")
-
-        # Check for stagnation
-        if current_total_score <= previous_total_score and generation - last_level_up_generation > stagnation_limit:
-            stagnation_counter += 1
-            print(f"No improvement detected. Stagnation counter: {stagnation_counter}")
-        else:
-            stagnation_counter = 0
-            print("Improvement detected or recent level-up. Resetting stagnation counter.")
-
-        previous_total_score = current_total_score
-
-        if stagnation_counter >= stagnation_limit:
-            print("Stagnation limit reached. Stopping training.")
-            break
-
-        # Check if max generations reached
-        if generation >= max_generations:
-            print("Maximum generations reached. Stopping training.")
-            break
-
-        # Check if any model has beaten all engines
-        max_engine_score = get_max_index() * 20
-        best_model = max(population, key=lambda m: m.score)
-        if best_model.score >= max_engine_score:
-            print(f"Model {best_model.name} has beaten all engines. Stopping training.")
-            break
-
-        # Check if level-up condition is met
-        level_up_threshold = settings.get("level_up_threshold", 5)
-        new_level = level_up(population, current_level, level_up_threshold)
-        if new_level > current_level:
-            last_level_up_generation = generation
-            print(f"Level-up detected! New level: {new_level}")
-        current_level = new_level
-
-        print("Creating new generation...")
-        population, survival_rate, temperature = create_new_generation(
-            population, survival_rate, mutation_rate, population_size, temperature, decay_rate, generation
+    # A seed makes the mutated and bred children reproducible
+    generator = None
+    if settings.get("seed") is not None:
+        generator = torch.Generator()
+        generator.manual_seed(settings["seed"])
+
+    # The population can live in stacked weight tensors, so generations are built in bulk
+    population_store = None
+    if settings.get("population_store", False):
+        population_store = PopulationStore.from_population(population)
+        population = population_store.population()
+
+    # New models get compact names that are never reused across generations
+    lineage = LineageRegistry.from_population(population)
+
+    # How survivors and parents are picked from the population
+    selection = SelectionConfig(**settings["selection"]) if "selection" in settings else None
+
+    # Rules to stop games whose outcome is already decided
+    adjudication = AdjudicationConfig(**settings["adjudication"]) if "adjudication" in settings else None
+
+    # Models play with float32 layers or with the integer arithmetic of their quantized Stockfish export
+    inference = settings.get("inference", "float")
+    calibration_inputs = None
+    if inference == "quantized":
+        # The activation ranges of every quantized model are measured on the same random positions
+        calibration_inputs = torch.tensor(
+            [tournament.convert_board_to_features(board) for board in calibration_positions()], dtype=torch.float32
         )
-        generation += 1
+
+    # Tournament results of unchanged survivors are reused, optionally re-evaluating them a few times to average out noise
+    fitness_cache = FitnessCache(settings.get("fitness_reevaluations", 0))
+
+    # Warm engine processes are shared by all models and generations
+    engine_pool = EnginePool()
+
+    # Deterministic engine replies are cached across models and generations
+    reply_cache_settings = settings.get("engine_reply_cache")
+    reply_cache = None
+
+    # Tournaments run in threads by default, in worker processes to escape the GIL,
+    # as asyncio tasks that multiplex many games onto a few threads,
+    # or in lockstep so that the moves of all models are evaluated together
+    executor_mode = settings.get("executor", "thread")
+    if executor_mode == "lockstep" and inference != "float":
+        raise ValueError("Lockstep tournaments only support float inference.")
+    process_executor = None
+    if executor_mode == "process":
+        process_executor = ProcessTournamentExecutor(
+            max_workers=settings.get("max_workers"),
+            adjudication=adjudication,
+            reply_cache_settings=reply_cache_settings,
+        )
+    elif reply_cache_settings is not None:
+        reply_cache = EngineReplyCache(**reply_cache_settings)
+
+    # Async tournaments keep one event loop, so that their warm engines serve every generation
+    async_loop = None
+    async_engine_pool = None
+    if executor_mode == "async":
+        async_loop = asyncio.new_event_loop()
+        async_engine_pool = AsyncEnginePool()
+
+    try:
+        while generation < max_generations:
+            print(f"Starting tournament for generation {generation}...")
+            # Survivors with unchanged weights reuse their previous results
+            models_to_evaluate, weights_hashes = fitness_cache.split(population)
+            to_evaluate = list(models_to_evaluate.values())
+            for model in to_evaluate:
+                if model.model.inference != inference:
+                    model.model.set_inference(inference, calibration_inputs=calibration_inputs)
+            print(f"{len(to_evaluate)} of {len(population)} models play their tournament.")
+            if not to_evaluate:
+                results = []
+            elif process_executor is not None:
+                results = process_executor.run_tournaments(to_evaluate, generation)
+            elif executor_mode == "async":
+                results = run_tournaments_async(
+                    to_evaluate,
+                    generation,
+                    max_concurrency=settings.get("max_concurrency", 32),
+                    game_timeout=settings.get("game_timeout"),
+                    adjudication=adjudication,
+                    reply_cache=reply_cache,
+                    engine_pool=async_engine_pool,
+                    loop=async_loop,
+                )
+                print(f"Engine pool statistics: {async_engine_pool.stats()}")
+            elif executor_mode == "lockstep":
+                results = run_tournaments_lockstep(
+                    to_evaluate,
+                    generation,
+                    engine_pool=engine_pool,
+                    adjudication=adjudication,
+                    reply_cache=reply_cache,
+                    max_workers=settings.get("max_workers"),
+                )
+                print(f"Engine pool statistics: {engine_pool.stats()}")
+            else:
+                with ThreadPoolExecutor(max_workers=settings.get("max_workers")) as executor:
+                    results = list(executor.map(
+                        lambda model: tournament.run_tournament(model.name, generation, model.model, debug=False, engine_pool=engine_pool, adjudication=adjudication, reply_cache=reply_cache),
+                        to_evaluate
+                    ))
+                print(f"Engine pool statistics: {engine_pool.stats()}")
+            if reply_cache is not None:
+                print(f"Engine reply cache statistics: {reply_cache.stats()}")
+
+            for weights_hash, (score, level) in zip(models_to_evaluate, results):
+                fitness_cache.record(weights_hash, score, level)
+            for model, weights_hash in zip(population, weights_hashes):
+                model.score, model.level = fitness_cache.fitness(weights_hash)
+            print(f"Fitness cache statistics: {fitness_cache.stats()}")
+
+            # Calculate the total score of the current generation
+            current_total_score = sum(model.score for model in population)
+            print(f"Total score for generation {generation}: {current_total_score:.2f}")
+
+            # Check for stagnation
+            if current_total_score <= previous_total_score and generation - last_level_up_generation > stagnation_limit:
+                stagnation_counter += 1
+                print(f"No improvement detected. Stagnation counter: {stagnation_counter}")
+            else:
+                stagnation_counter = 0
+                print("Improvement detected or recent level-up. Resetting stagnation counter.")
+
+            previous_total_score = current_total_score
+
+            if stagnation_counter >= stagnation_limit:
+                print("Stagnation limit reached. Stopping training.")
+                break
+
+            # Check if max generations reached
+            if generation >= max_generations:
+                print("Maximum generations reached. Stopping training.")
+                break
+
+            # Check if any model has beaten all engines
+            max_engine_score = get_max_index() * 20
+            best_model = max(population, key=lambda m: m.score)
+            if best_model.score >= max_engine_score:
+                print(f"Model {best_model.name} has beaten all engines. Stopping training.")
+                break
+
+            # Check if level-up condition is met
+            level_up_threshold = settings.get("level_up_threshold", 5)
+            new_level = level_up(population, current_level, level_up_threshold)
+            if new_level > current_level:
+                last_level_up_generation = generation
+                print(f"Level-up detected! New level: {new_level}")
+            current_level = new_level
+
+            print("Creating new generation...")
+            population, survival_rate, temperature = create_new_generation(
+                population, survival_rate, mutation_rate, population_size, temperature, decay_rate, generation,
+                crossover=crossover, generator=generator, selection=selection, lineage=lineage,
+                checkpoint_writer=checkpoint_writer, model_store=model_store, population_store=population_store,
+            )
+            generation += 1
+    finally:
+        if process_executor is not None:
+            process_executor.shutdown()
+        if reply_cache is not None:
+            reply_cache.close()
+        engine_pool.close()
+        if async_loop is not None:
+            async_loop.run_until_complete(async_engine_pool.close())
+            async_loop.close()
+        # Wait for the last snapshots to reach the disk
+        checkpoint_writer.close()
 
     print("Training stopped.")
 def level_up(population, current_level, level_up_threshold):
@@ -0,0 +1,127 @@
+import chess
+import torch
+from torch import nn, Tensor
+
+# The board encoding only uses the first 64 inputs, one per square
+NUM_SQ = 64
+
+
+def piece_feature(piece: chess.Piece) -> int:
+    """Get the input feature value of a piece: its piece type, negated for Black pieces."""
+    return piece.piece_type * (1 if piece.color == chess.WHITE else -1)
+
+
+def feature_at(board: chess.Board, square: int) -> int:
+    """Get the input feature value of a square, 0 if the square is empty."""
+    piece = board.piece_at(square)
+    return piece_feature(piece) if piece else 0
+
+
+class Accumulator:
+    """First-layer output of an NNUEModel, updated incrementally as moves are played.
+
+    The network input has one feature per square holding the piece on it (see
+    piece_feature), so a move only changes the features of the few squares it touches. The
+    accumulator applies the matching weight rows instead of recomputing the whole first
+    layer. The features are absolute, not relative to a king or a side to move, so there is
+    only one perspective and a king move needs no refresh.
+    """
+
+    def __init__(self, weight: Tensor, bias: Tensor, board: chess.Board):
+        """Create the accumulator of a board from first-layer weights of any numeric dtype.
+
+        Args:
+            weight (Tensor): The [hidden, inputs] weights of the first layer.
+            bias (Tensor): The [hidden] biases of the first layer.
+            board (chess.Board): The board to accumulate.
+        """
+        with torch.no_grad():
+            # One row of first-layer weights per square, so that a square is a row lookup
+            self.weight = weight.detach()[:, :NUM_SQ].t().contiguous()
+            self.bias = bias.detach().clone()
+        self.stack = []
+        self.refresh(board)
+
+    @staticmethod
+    def from_layer(layer: nn.Linear, board: chess.Board) -> "Accumulator":
+        """Create the accumulator of a board from a float first layer."""
+        return Accumulator(layer.weight, layer.bias, board)
+
+    def refresh(self, board: chess.Board):
+        """Recompute the first-layer output of the board from scratch."""
+        piece_map = board.piece_map()
+        squares = torch.tensor(list(piece_map.keys()), dtype=torch.long)
+        features = torch.tensor([piece_feature(piece) for piece in piece_map.values()], dtype=self.weight.dtype)
+        self.value = self.bias + features @ self.weight[squares]
+        self.stack.clear()
+
+    @staticmethod
+    def move_changes(board: chess.Board, move: chess.Move) -> tuple[list[int], list[int]]:
+        """Get the squares a move changes and how much the feature of each square changes.
+
+        Args:
+            board (chess.Board): The board before the move.
+            move (chess.Move): A legal move.
+
+        Returns:
+            tuple[list[int], list[int]]: The changed squares and their feature deltas.
+        """
+        if board.is_castling(move):
+            # King and rook both move along the back rank, read the result off the board
+            rank = chess.square_rank(move.from_square)
+            squares = [chess.square(file, rank) for file in range(8)]
+            before = [feature_at(board, square) for square in squares]
+            board.push(move)
+            after = [feature_at(board, square) for square in squares]
+            board.pop()
+            changes = [(square, new - old) for square, old, new in zip(squares, before, after) if new != old]
+            return [square for square, _ in changes], [delta for _, delta in changes]
+
+        mover = board.piece_at(move.from_square)
+        moved_feature = piece_feature(mover)
+        placed_feature = moved_feature if move.promotion is None else piece_feature(chess.Piece(move.promotion, mover.color))
+
+        squares = [move.from_square, move.to_square]
+        deltas = [-moved_feature, placed_feature - feature_at(board, move.to_square)]
+
+        if board.is_en_passant(move):
+            captured_square = chess.square(chess.square_file(move.to_square), chess.square_rank(move.from_square))
+            squares.append(captured_square)
+            deltas.append(-feature_at(board, captured_square))
+
+        return squares, deltas
+
+    def push(self, board: chess.Board, move: chess.Move):
+        """Play a move on the board and update the first-layer output to match."""
+        squares, deltas = self.move_changes(board, move)
+        self.stack.append(self.value)
+        self.value = self.value + torch.tensor(deltas, dtype=self.weight.dtype) @ self.weight[squares]
+        board.push(move)
+
+    def pop(self, board: chess.Board) -> chess.Move:
+        """Take back the last move on the board and restore the matching first-layer output."""
+        self.value = self.stack.pop()
+        return board.pop()
+
+    def children(self, board: chess.Board, moves: list[chess.Move]) -> Tensor:
+        """Get the first-layer outputs of the child positions reached by each move.
+
+        All weight-row deltas are applied with a single index_add, so no child position is
+        featurized or pushed on the board.
+
+        Returns:
+            Tensor: A [len(moves), hidden] matrix, one row per child position.
+        """
+        child_rows = []
+        squares = []
+        deltas = []
+        for i, move in enumerate(moves):
+            move_squares, move_deltas = self.move_changes(board, move)
+            child_rows.extend([i] * len(move_squares))
+            squares.extend(move_squares)
+            deltas.extend(move_deltas)
+
+        deltas = torch.tensor(deltas, dtype=self.weight.dtype).unsqueeze(1)
+        children = self.value.expand(len(moves), -1).clone()
+        children.index_add_(0, torch.tensor(child_rows, dtype=torch.long), self.weight[squares] * deltas)
+        return children
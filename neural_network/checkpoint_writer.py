@@ -0,0 +1,106 @@
+import os
+import queue
+import threading
+
+
+def _fsync_directory(directory: str):
+    # Makes the renames in a directory durable, directories cannot be opened on Windows
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_file_atomically(file_path: str, data: bytes):
+    """Write a file so that it is either fully written or left untouched, even on a crash.
+
+    The data is written and fsynced to a temporary file next to the target, which is then
+    renamed over the target.
+    """
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+
+class CheckpointWriter:
+    """Write snapshots to disk on a background thread.
+
+    Snapshots are lists of files. The content of a file is either bytes or a function that
+    returns the bytes, called on the writer thread, so that serializing a snapshot of the
+    weights does not hold up the caller. Every file is written atomically and
+    fsynced. The queue of pending snapshots is bounded: submit blocks when the writer falls
+    that far behind, rather than holding an unbounded number of snapshots in memory.
+    """
+
+    def __init__(self, max_pending: int = 2, debug: bool = False):
+        self.debug = debug
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, files: list[tuple[str, bytes]]):
+        """Queue a snapshot for writing.
+
+        Args:
+            files (list[tuple[str, bytes | Callable[[], bytes]]]): The path and content of every
+                file of the snapshot. A callable content must not depend on state the caller
+                changes afterwards, such as the weights of a model still in training.
+        """
+        self._raise_error()
+        self._queue.put(files)
+
+    def flush(self):
+        """Wait until every queued snapshot is on disk."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        """Write the queued snapshots and stop the writer thread."""
+        self._queue.join()
+        self._queue.put(None)
+        self._thread.join()
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("Writing a checkpoint failed.") from error
+
+    def _run(self):
+        while True:
+            files = self._queue.get()
+            try:
+                if files is None:
+                    return
+                self._write_snapshot(files)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write_snapshot(self, files):
+        directories = set()
+        for file_path, data in files:
+            directory = os.path.dirname(file_path) or "."
+            os.makedirs(directory, exist_ok=True)
+            write_file_atomically(file_path, data() if callable(data) else data)
+            directories.add(directory)
+
+        for directory in directories:
+            _fsync_directory(directory)
+
+        if self.debug:
+            print(f"Wrote {len(files)} checkpoint files to {', '.join(sorted(directories))}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
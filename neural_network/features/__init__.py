@@ -4,6 +4,7 @@ from typing import Callable
 
 from .feature_block import FeatureBlock
 from .feature_set import FeatureSet
+from .bulk import CSRFeatures, extract_sparse_features
 
 """
 Each module that defines feature blocks must be imported here and
@@ -11,9 +12,9 @@ added to the _feature_modules list. Each such module must define a
 function `get_feature_block_clss` at module scope that returns the list
 of feature block classes in that module.
 """
-from . import halfkp
+from . import halfka_v2_hm, halfkp
 
-_feature_modules: list[types.ModuleType] = [halfkp]
+_feature_modules: list[types.ModuleType] = [halfkp, halfka_v2_hm]
 
 _feature_blocks_by_name: dict[str, FeatureBlock] = dict()
 
@@ -67,7 +68,9 @@ _init()
 
 
 __all__ = [
+    "CSRFeatures",
     "FeatureSet",
+    "extract_sparse_features",
     "add_feature_args",
     "get_available_feature_blocks_names",
 ]
\ No newline at end of file
@@ -0,0 +1,200 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import islice
+import io
+import multiprocessing
+import os
+from typing import Iterable, Union
+
+import chess
+import numpy as np
+import torch
+
+from .feature_set import FeatureSet
+
+# Heavy modules imported once by the forkserver so that every worker starts with them loaded
+PRELOADED_MODULES = ["numpy", "torch", "chess", "neural_network.features"]
+
+# Inputs smaller than this are featurized in the calling process, a pool would not pay off
+DEFAULT_PARALLEL_THRESHOLD = 20000
+
+# Bytes reserved for the header of the .npy files, enough for any length
+NPY_HEADER_SIZE = 128
+
+
+@dataclass
+class CSRFeatures:
+    """Sparse features of many positions from one perspective, in CSR layout.
+
+    The active features of position i are indices[offsets[i]:offsets[i + 1]], with the
+    matching values. SparseLinear.forward_sparse takes indices, offsets[:-1] and values.
+    """
+
+    indices: np.ndarray  # int64 feature indices of all positions, concatenated
+    offsets: np.ndarray  # int64, one more than there are positions
+    values: np.ndarray  # float32 feature values
+
+
+def _extract_chunk(feature_set: FeatureSet, positions: list) -> tuple[np.ndarray, ...]:
+    """Featurize a chunk of positions.
+
+    Returns:
+        tuple[np.ndarray, ...]: The indices, counts and values of the white perspective,
+            then the same for the black perspective.
+    """
+    parts = ([], [], [], [], [], [])
+    for position in positions:
+        board = chess.Board(position) if isinstance(position, str) else position
+        (w_indices, w_values), (b_indices, b_values) = feature_set.get_active_indices(board)
+        for part, tensor in zip(parts, (w_indices, w_values, b_indices, b_values)):
+            part.append(tensor.numpy())
+        parts[4].append(len(w_indices))
+        parts[5].append(len(b_indices))
+
+    def concatenate(arrays, dtype):
+        return np.concatenate(arrays).astype(dtype, copy=False) if arrays else np.empty(0, dtype=dtype)
+
+    return (
+        concatenate(parts[0], np.int64), np.array(parts[4], dtype=np.int64), concatenate(parts[1], np.float32),
+        concatenate(parts[2], np.int64), np.array(parts[5], dtype=np.int64), concatenate(parts[3], np.float32),
+    )
+
+
+def _init_worker():
+    # Every worker featurizes its own chunk, intra-op threads would only oversubscribe the cores
+    torch.set_num_threads(1)
+
+
+def _get_mp_context():
+    # forkserver is not available on Windows, fall back to spawn there
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(PRELOADED_MODULES)
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class _ArrayWriter:
+    """Append arrays of one dtype to memory, or to a .npy file whose header is written on close."""
+
+    def __init__(self, dtype, path: str = None):
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.length = 0
+        self.parts = []
+        self.file = None
+        if path is not None:
+            self.file = open(path, "wb")
+            self.file.write(bytes(NPY_HEADER_SIZE))
+
+    def append(self, array: np.ndarray):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        self.length += len(array)
+        if self.file is not None:
+            self.file.write(array.data)
+        else:
+            self.parts.append(array)
+
+    def close(self) -> np.ndarray:
+        """Finish the array and return it, memory-mapped read-only when it was written to a file."""
+        if self.file is None:
+            return np.concatenate(self.parts) if self.parts else np.empty(0, dtype=self.dtype)
+
+        header = io.BytesIO()
+        np.lib.format.write_array_header_1_0(header, {"descr": np.lib.format.dtype_to_descr(self.dtype), "fortran_order": False, "shape": (self.length,)})
+        if header.tell() != NPY_HEADER_SIZE:
+            raise RuntimeError(f"Unexpected .npy header size {header.tell()} for {self.path}")
+        self.file.seek(0)
+        self.file.write(header.getvalue())
+        self.file.close()
+        return np.load(self.path, mmap_mode="r")
+
+
+def _chunks(positions: Iterable, chunk_size: int):
+    iterator = iter(positions)
+    while chunk := list(islice(iterator, chunk_size)):
+        yield chunk
+
+
+def extract_sparse_features(
+    feature_set: FeatureSet,
+    positions: Iterable[Union[str, chess.Board]],
+    output_dir: str = None,
+    max_workers: int = None,
+    chunk_size: int = 4096,
+    parallel_threshold: int = DEFAULT_PARALLEL_THRESHOLD,
+) -> tuple[CSRFeatures, CSRFeatures]:
+    """Featurize many positions into CSR arrays, one set per perspective.
+
+    Positions are featurized a chunk at a time with FeatureSet.get_active_indices. Once
+    more than parallel_threshold positions have been seen, the chunks are spread over a
+    pool of worker processes; boards are then sent to the workers as FENs. Results are
+    written in input order, and only a few chunks are in flight at a time, so the input can
+    be a lazy iterable of any length.
+
+    Args:
+        feature_set (FeatureSet): The features to extract.
+        positions (Iterable[Union[str, chess.Board]]): FENs or boards.
+        output_dir (str, optional): Write the arrays to .npy files in this folder and return
+            them memory-mapped, instead of keeping them in memory.
+        max_workers (int, optional): The number of worker processes. 1 never starts a pool.
+            Defaults to the number of CPUs.
+        chunk_size (int): The number of positions featurized at a time.
+        parallel_threshold (int): The number of positions from which a pool is used.
+
+    Returns:
+        tuple[CSRFeatures, CSRFeatures]: The features of the white and the black perspective.
+    """
+    # The arrays returned by _extract_chunk. The counts stay in memory, they become the offsets.
+    arrays = [
+        ("white_indices", np.int64), ("white_counts", np.int64), ("white_values", np.float32),
+        ("black_indices", np.int64), ("black_counts", np.int64), ("black_values", np.float32),
+    ]
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+    writers = [
+        _ArrayWriter(dtype, os.path.join(output_dir, f"{name}.npy") if output_dir is not None and not name.endswith("_counts") else None)
+        for name, dtype in arrays
+    ]
+
+    def write(results):
+        for writer, array in zip(writers, results):
+            writer.append(array)
+
+    max_workers = max_workers or os.cpu_count()
+    executor = None
+    try:
+        pending = deque()
+        seen = 0
+        for chunk in _chunks(positions, chunk_size):
+            seen += len(chunk)
+            if executor is None and max_workers > 1 and seen > parallel_threshold:
+                executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=_get_mp_context(), initializer=_init_worker)
+            if executor is None:
+                write(_extract_chunk(feature_set, chunk))
+                continue
+
+            chunk = [position.fen() if isinstance(position, chess.Board) else position for position in chunk]
+            pending.append(executor.submit(_extract_chunk, feature_set, chunk))
+            # Bound the chunks in flight, results are written in input order
+            if len(pending) > 2 * max_workers:
+                write(pending.popleft().result())
+        while pending:
+            write(pending.popleft().result())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    results = [writer.close() for writer in writers]
+    perspectives = []
+    for indices, counts, values, offsets_name in (results[0:3] + ["white_offsets"], results[3:6] + ["black_offsets"]):
+        offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        if output_dir is not None:
+            offsets_path = os.path.join(output_dir, f"{offsets_name}.npy")
+            np.save(offsets_path, offsets)
+            offsets = np.load(offsets_path, mmap_mode="r")
+        perspectives.append(CSRFeatures(indices, offsets, values))
+
+    return perspectives[0], perspectives[1]
@@ -1,5 +1,9 @@
 from collections import OrderedDict
 
+import chess
+import numpy as np
+import torch
+
 def _get_main_factor_name(full_name: str) -> str:
     return full_name.replace("^", "")
 
@@ -46,6 +50,9 @@ class FeatureBlock:
     get_active_features (def get_active_features(self, board: chess.Board)),
     which takes the board and returns the list of indices of the features
     that are active for this board.
+
+    get_active_indices is the sparse form of get_active_features. Blocks with many
+    features should override it with an extraction that never builds the dense vectors.
     """
 
     def __init__(self, name: str, hash: int, factors: OrderedDict[str, int]):
@@ -59,6 +66,21 @@ class FeatureBlock:
         self.num_features = sum(v for n, v in factors.items())
         self.num_virtual_features = self.num_features - self.num_real_features
 
+    def get_active_indices(
+        self, board: chess.Board
+    ) -> tuple[tuple[torch.Tensor, torch.Tensor], tuple[torch.Tensor, torch.Tensor]]:
+        """
+        This method returns, for the white and the black perspective, the indices of the
+        non-zero features (int64) and their values (float32). The default implementation
+        derives them from the dense features of get_active_features.
+        """
+        def sparse(dense):
+            indices = torch.nonzero(dense).view(-1)
+            return indices, dense[indices].float()
+
+        white, black = self.get_active_features(board)
+        return sparse(white), sparse(black)
+
     def get_main_factor_name(self) -> str:
         return _get_main_factor_name(self.name)
 
@@ -70,6 +92,17 @@ class FeatureBlock:
         """
         return [idx]
 
+    def get_feature_factors_array(self) -> np.ndarray:
+        """
+        This method does what get_feature_factors does for all the real features at once.
+        It returns a [num_real_features, num_factors] int64 array whose ith row holds the
+        factors of the ith real feature. Factorized feature blocks should override it with
+        a vectorized computation, the default calls get_feature_factors per feature.
+        """
+        if self.num_virtual_features == 0:
+            return np.arange(self.num_real_features, dtype=np.int64).reshape(-1, 1)
+        return np.array([self.get_feature_factors(i) for i in range(self.num_real_features)], dtype=np.int64)
+
     def get_factor_base_feature(self, name: str) -> int:
         """
         This method takes a string name of a factor and returns the offset of the
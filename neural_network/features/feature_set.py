@@ -1,8 +1,13 @@
 import chess
+import numpy as np
 import torch
 
 from .feature_block import FeatureBlock
 
+# Gather indices of every feature set seen so far, by feature set hash and name. The name
+# is part of the key because a factorized block shares the hash of its real block.
+_gather_indices_cache: dict[tuple[int, str], np.ndarray] = dict()
+
 
 def _calculate_features_hash(features):
     if len(features) == 1:
@@ -71,19 +76,33 @@ class FeatureSet:
         blocks will never have the same index here. Basically the thing you would expect
         to happen after concatenating many feature blocks.
         """
-        w = torch.zeros(0)
-        b = torch.zeros(0)
+        w = []
+        b = []
+        for feature in self.features:
+            w_local, b_local = feature.get_active_features(board)
+            w.append(w_local)
+            b.append(b_local)
 
+        return torch.cat(w), torch.cat(b)
+
+    def get_active_indices(
+        self, board: chess.Board
+    ) -> tuple[tuple[torch.Tensor, torch.Tensor], tuple[torch.Tensor, torch.Tensor]]:
+        """
+        Sparse form of get_active_features: for the white and the black perspective, the
+        indices and values of the non-zero features of all blocks, with every block
+        offset into its own index space.
+        """
+        perspectives = ([], [], [], [])
         offset = 0
         for feature in self.features:
-            w_local, b_local = feature.get_active_features(board)
-            w_local += offset
-            b_local += offset
-            w = torch.cat([w, w_local])
-            b = torch.cat([b, b_local])
+            (w_local, w_values), (b_local, b_values) = feature.get_active_indices(board)
+            for perspective, part in zip(perspectives, (w_local + offset, w_values, b_local + offset, b_values)):
+                perspective.append(part)
             offset += feature.num_features
 
-        return w, b
+        w_indices, w_values, b_indices, b_values = (torch.cat(parts) for parts in perspectives)
+        return (w_indices, w_values), (b_indices, b_values)
 
     def get_feature_factors(self, idx: int) -> list[int]:
         """
@@ -105,21 +124,58 @@ class FeatureSet:
         valid features at the same time. It returns a list of length
         self.num_real_features with ith element being a list of factors
         of the ith feature.
-        This method is technically redundant but it allows to perform the operation
-        slightly faster when there's many feature blocks. It might be worth
-        to add a similar method to the FeatureBlock itself - to make it faster
-        for feature blocks with many factors.
         """
-        indices = []
-        real_offset = 0
-        offset = 0
-        for feature in self.features:
-            for i_real in range(feature.num_real_features):
-                i_fact = feature.get_feature_factors(i_real)
-                indices.append([offset + i for i in i_fact])
-            real_offset += feature.num_real_features
-            offset += feature.num_features
-        return indices
+        return [[i for i in row if i >= 0] for row in self.get_virtual_to_real_features_gather_array().tolist()]
+
+    def get_virtual_to_real_features_gather_array(self) -> np.ndarray:
+        """
+        Array form of get_virtual_to_real_features_gather_indices: a read-only
+        [num_real_features, max_factors] int64 array of the factors of every real feature,
+        padded with -1 where a block has fewer factors. It is computed with the vectorized
+        get_feature_factors_array of every block and cached per feature set.
+        """
+        key = (self.hash, self.name)
+        if key not in _gather_indices_cache:
+            blocks = []
+            offset = 0
+            for feature in self.features:
+                blocks.append(feature.get_feature_factors_array() + offset)
+                offset += feature.num_features
+
+            max_factors = max(block.shape[1] for block in blocks)
+            indices = np.full((self.num_real_features, max_factors), -1, dtype=np.int64)
+            real_offset = 0
+            for block in blocks:
+                indices[real_offset:real_offset + len(block), :block.shape[1]] = block
+                real_offset += len(block)
+            indices.setflags(write=False)
+            _gather_indices_cache[key] = indices
+
+        return _gather_indices_cache[key]
+
+    def coalesce_ft_weights(self, weight: torch.Tensor) -> torch.Tensor:
+        """
+        Fold the weights of the virtual features into the real features they factorize,
+        so that a network trained with factorized features can be exported with only the
+        real ones. The sum is a single sparse matrix product.
+
+        Args:
+            weight (torch.Tensor): The [out, num_features] weights of the feature transformer.
+
+        Returns:
+            torch.Tensor: The [out, num_real_features] coalesced weights.
+        """
+        indices = self.get_virtual_to_real_features_gather_array()
+        rows = np.repeat(np.arange(len(indices)), indices.shape[1])
+        columns = indices.reshape(-1)
+        factors = columns >= 0
+        coalescing = torch.sparse_coo_tensor(
+            torch.from_numpy(np.stack([rows[factors], columns[factors]])),
+            torch.ones(int(factors.sum()), dtype=weight.dtype),
+            (self.num_real_features, self.num_features),
+            check_invariants=False,
+        )
+        return torch.sparse.mm(coalescing, weight.t()).t()
 
     def get_initial_psqt_features(self) -> list[int]:
         init = []
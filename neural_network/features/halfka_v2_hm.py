@@ -0,0 +1,183 @@
+from collections import OrderedDict
+
+import chess
+import numpy as np
+import torch
+
+from .feature_block import FeatureBlock
+from .halfkp import _halfkp_active_indices
+
+
+NUM_SQ = 64
+NUM_PT_REAL = 11
+NUM_PT_VIRTUAL = 12
+NUM_PLANES_REAL = NUM_SQ * NUM_PT_REAL
+NUM_PLANES_VIRTUAL = NUM_SQ * NUM_PT_VIRTUAL
+NUM_INPUTS = NUM_PLANES_REAL * NUM_SQ // 2
+
+# Bucket of the oriented king square. Orientation always puts the king on files e-h, so
+# only those squares have a bucket.
+# fmt: off
+KING_BUCKETS = np.array([
+    -1, -1, -1, -1, 31, 30, 29, 28,
+    -1, -1, -1, -1, 27, 26, 25, 24,
+    -1, -1, -1, -1, 23, 22, 21, 20,
+    -1, -1, -1, -1, 19, 18, 17, 16,
+    -1, -1, -1, -1, 15, 14, 13, 12,
+    -1, -1, -1, -1, 11, 10, 9, 8,
+    -1, -1, -1, -1, 7, 6, 5, 4,
+    -1, -1, -1, -1, 3, 2, 1, 0,
+], dtype=np.int64)
+# fmt: on
+
+# Initial piece-square values of the pieces, in internal units as in Stockfish
+PIECE_VALUES = {
+    chess.PAWN: 126,
+    chess.KNIGHT: 781,
+    chess.BISHOP: 825,
+    chess.ROOK: 1276,
+    chess.QUEEN: 2538,
+}
+
+
+def orient(is_white_pov: bool, sq: int, ksq: int) -> int:
+    # ksq must not be oriented. Mirrors the board horizontally when the king is on files a-d.
+    kfile = ksq % 8
+    return (7 * (kfile < 4)) ^ (56 * (not is_white_pov)) ^ sq
+
+
+def halfka_idx(is_white_pov: bool, king_sq: int, sq: int, p: chess.Piece) -> int:
+    p_idx = (p.piece_type - 1) * 2 + (p.color != is_white_pov)
+    # Both kings share a plane, the own king can only be on the squares of its bucket
+    if p_idx == 11:
+        p_idx -= 1
+    o_ksq = orient(is_white_pov, king_sq, king_sq)
+    return orient(is_white_pov, sq, king_sq) + p_idx * NUM_SQ + int(KING_BUCKETS[o_ksq]) * NUM_PLANES_REAL
+
+
+def _build_index_table() -> np.ndarray:
+    """
+    Precompute halfka_idx for every perspective, king square, piece and square.
+    The table is indexed like HALFKP_INDEX_TABLE, by [perspective, king_sq, piece, sq],
+    with kings as the sixth piece type.
+    """
+    perspective = np.arange(2).reshape(2, 1, 1, 1)
+    king_sq = np.arange(NUM_SQ).reshape(1, NUM_SQ, 1, 1)
+    piece = np.arange(NUM_PT_VIRTUAL).reshape(1, 1, NUM_PT_VIRTUAL, 1)
+    sq = np.arange(NUM_SQ).reshape(1, 1, 1, NUM_SQ)
+
+    flip = (7 * (king_sq % 8 < 4)) ^ (56 * perspective)
+    p_idx = np.minimum((piece // 2) * 2 + (piece % 2 != perspective), NUM_PT_REAL - 1)
+    return ((flip ^ sq) + p_idx * NUM_SQ + KING_BUCKETS[flip ^ king_sq] * NUM_PLANES_REAL).astype(np.int64)
+
+
+HALFKA_V2_HM_INDEX_TABLE = _build_index_table()
+
+
+def get_halfka_v2_hm_indices(board: chess.Board) -> np.ndarray:
+    """Get the [2, num_pieces] active HalfKAv2_hm indices of the white and the black perspective of a board."""
+    piece_bitboards = np.array([board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings], dtype=np.uint64)
+    color_bitboards = np.array([board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]], dtype=np.uint64)
+    king_squares = np.array([board.king(chess.WHITE), board.king(chess.BLACK)], dtype=np.int64)
+    out = np.empty((2, NUM_SQ), dtype=np.int64)
+    count = _halfkp_active_indices(piece_bitboards, color_bitboards, king_squares, HALFKA_V2_HM_INDEX_TABLE, out)
+    return out[:, :count]
+
+
+def get_a_factors(indices: np.ndarray) -> np.ndarray:
+    """
+    Get the A factor, the piece and oriented square without the king bucket, of HalfKAv2_hm
+    indices. The virtual planes tell the kings apart: a king that is not on a square of
+    the bucket is the opponent's, and goes to the twelfth plane.
+    """
+    a_idx = indices % NUM_PLANES_REAL
+    k_idx = indices // NUM_PLANES_REAL
+    opponent_king = (a_idx // NUM_SQ == NUM_PT_REAL - 1) & (k_idx != KING_BUCKETS[a_idx % NUM_SQ])
+    return a_idx + NUM_SQ * opponent_king
+
+
+def _densify(indices: np.ndarray, num_features: int) -> torch.Tensor:
+    features = torch.zeros(num_features)
+    features[torch.from_numpy(indices)] = 1.0
+    return features
+
+
+def get_initial_psqt_features() -> list[int]:
+    # The value of every piece from the white perspective, negated for black pieces
+    values = np.zeros(NUM_INPUTS, dtype=np.int64)
+    for piece_type, value in PIECE_VALUES.items():
+        piece = (piece_type - 1) * 2
+        values[HALFKA_V2_HM_INDEX_TABLE[0, :, piece, :]] = value
+        values[HALFKA_V2_HM_INDEX_TABLE[0, :, piece + 1, :]] = -value
+    return values.tolist()
+
+
+class Features(FeatureBlock):
+    def __init__(self):
+        super().__init__(
+            "HalfKAv2_hm", 0x7F234CB8, OrderedDict([("HalfKAv2_hm", NUM_INPUTS)])
+        )
+
+    def get_active_features(
+        self, board: chess.Board
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        white, black = get_halfka_v2_hm_indices(board)
+        return (_densify(white, self.num_features), _densify(black, self.num_features))
+
+    def get_active_indices(
+        self, board: chess.Board
+    ) -> tuple[tuple[torch.Tensor, torch.Tensor], tuple[torch.Tensor, torch.Tensor]]:
+        white, black = torch.from_numpy(get_halfka_v2_hm_indices(board))
+        values = torch.ones(len(white))
+        return (white, values), (black, values)
+
+    def get_initial_psqt_features(self) -> list[int]:
+        return get_initial_psqt_features()
+
+
+class FactorizedFeatures(FeatureBlock):
+    def __init__(self):
+        super().__init__(
+            "HalfKAv2_hm^",
+            0x7F234CB8,
+            OrderedDict([("HalfKAv2_hm", NUM_INPUTS), ("A", NUM_PLANES_VIRTUAL)]),
+        )
+
+    def _get_indices(self, board: chess.Board) -> np.ndarray:
+        base = get_halfka_v2_hm_indices(board)
+        return np.concatenate([base, self.get_factor_base_feature("A") + get_a_factors(base)], axis=1)
+
+    def get_active_features(
+        self, board: chess.Board
+    ) -> tuple[torch.Tensor, torch.Tensor]:
+        white, black = self._get_indices(board)
+        return (_densify(white, self.num_features), _densify(black, self.num_features))
+
+    def get_active_indices(
+        self, board: chess.Board
+    ) -> tuple[tuple[torch.Tensor, torch.Tensor], tuple[torch.Tensor, torch.Tensor]]:
+        white, black = torch.from_numpy(self._get_indices(board))
+        values = torch.ones(len(white))
+        return (white, values), (black, values)
+
+    def get_feature_factors(self, idx: int) -> list[int]:
+        if idx >= self.num_real_features:
+            raise Exception("Feature must be real")
+
+        return [idx, self.get_factor_base_feature("A") + int(get_a_factors(np.int64(idx)))]
+
+    def get_feature_factors_array(self) -> np.ndarray:
+        idx = np.arange(self.num_real_features, dtype=np.int64)
+        return np.stack([idx, self.get_factor_base_feature("A") + get_a_factors(idx)], axis=1)
+
+    def get_initial_psqt_features(self) -> list[int]:
+        return get_initial_psqt_features() + [0] * NUM_PLANES_VIRTUAL
+
+
+"""
+This is used by the features module for discovery of feature blocks.
+"""
+
+
+def get_feature_block_clss() -> list[type[FeatureBlock]]:
+    return [Features, FactorizedFeatures]
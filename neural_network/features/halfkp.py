@@ -1,6 +1,8 @@
 from collections import OrderedDict
 
 import chess
+import numpy as np
+from numba import njit
 import torch
 
 from .feature_block import FeatureBlock
@@ -20,6 +22,56 @@ def halfkp_idx(is_white_pov: bool, king_sq: int, sq: int, p: chess.Piece) -> int
     return 1 + orient(is_white_pov, sq) + p_idx * NUM_SQ + king_sq * NUM_PLANES
 
 
+def _build_index_table() -> np.ndarray:
+    """
+    Precompute halfkp_idx for every perspective, king square, piece and square.
+    The table is indexed by [perspective, king_sq, piece, sq], with perspective 0 for
+    White and 1 for Black, piece = (piece_type - 1) * 2 + (0 for White, 1 for Black),
+    and king_sq the square of the perspective's own king, not oriented.
+    """
+    perspective = np.arange(2).reshape(2, 1, 1, 1)
+    king_sq = np.arange(NUM_SQ).reshape(1, NUM_SQ, 1, 1)
+    piece = np.arange(NUM_PT).reshape(1, 1, NUM_PT, 1)
+    sq = np.arange(NUM_SQ).reshape(1, 1, 1, NUM_SQ)
+
+    flip = 63 * perspective
+    p_idx = (piece // 2) * 2 + (piece % 2 != perspective)
+    return (1 + (flip ^ sq) + p_idx * NUM_SQ + (flip ^ king_sq) * NUM_PLANES).astype(np.int64)
+
+
+HALFKP_INDEX_TABLE = _build_index_table()
+
+
+@njit(cache=True)
+def _halfkp_active_indices(piece_bitboards, color_bitboards, king_squares, table, out):
+    # Walks the set bits of every piece bitboard, writing one index per perspective per piece.
+    # Also used by the HalfKA blocks, whose tables have kings as a sixth piece type.
+    count = 0
+    for piece_type in range(piece_bitboards.shape[0]):
+        for color in range(2):
+            bitboard = piece_bitboards[piece_type] & color_bitboards[color]
+            piece = piece_type * 2 + color
+            sq = 0
+            while bitboard:
+                while not (bitboard >> np.uint64(sq)) & np.uint64(1):
+                    sq += 1
+                for perspective in range(2):
+                    out[perspective, count] = table[perspective, king_squares[perspective], piece, sq]
+                count += 1
+                bitboard &= bitboard - np.uint64(1)
+    return count
+
+
+def get_halfkp_indices(board: chess.Board) -> np.ndarray:
+    """Get the [2, num_pieces] active HalfKP indices of the white and the black perspective of a board."""
+    piece_bitboards = np.array([board.pawns, board.knights, board.bishops, board.rooks, board.queens], dtype=np.uint64)
+    color_bitboards = np.array([board.occupied_co[chess.WHITE], board.occupied_co[chess.BLACK]], dtype=np.uint64)
+    king_squares = np.array([board.king(chess.WHITE), board.king(chess.BLACK)], dtype=np.int64)
+    out = np.empty((2, NUM_SQ), dtype=np.int64)
+    count = _halfkp_active_indices(piece_bitboards, color_bitboards, king_squares, HALFKP_INDEX_TABLE, out)
+    return out[:, :count]
+
+
 class Features(FeatureBlock):
     def __init__(self):
         super().__init__(
@@ -41,6 +93,13 @@ class Features(FeatureBlock):
 
         return (piece_features(chess.WHITE), piece_features(chess.BLACK))
 
+    def get_active_indices(
+        self, board: chess.Board
+    ) -> tuple[tuple[torch.Tensor, torch.Tensor], tuple[torch.Tensor, torch.Tensor]]:
+        white, black = torch.from_numpy(get_halfkp_indices(board))
+        values = torch.ones(len(white))
+        return (white, values), (black, values)
+
     def get_initial_psqt_features(self):
         raise Exception("Not supported yet. See HalfKA")
 
@@ -79,6 +138,27 @@ class FactorizedFeatures(FeatureBlock):
 
         return (piece_features(white, chess.WHITE), piece_features(black, chess.BLACK))
 
+    def get_active_indices(
+        self, board: chess.Board
+    ) -> tuple[tuple[torch.Tensor, torch.Tensor], tuple[torch.Tensor, torch.Tensor]]:
+        base = get_halfkp_indices(board)
+        num_pieces = base.shape[1]
+
+        # The P factor of a piece is its HalfKP index without the king, the HalfK factor of
+        # the king counts the pieces
+        p_indices = self.get_factor_base_feature("P") + (base - 1) % NUM_PLANES
+        king_indices = np.array([
+            [self.get_factor_base_feature("HalfK") + orient(color, board.king(color))]
+            for color in (chess.WHITE, chess.BLACK)
+        ])
+        indices = np.concatenate([base, p_indices, king_indices] if num_pieces else [base, p_indices], axis=1)
+        values = torch.ones(indices.shape[1])
+        if num_pieces:
+            values[-1] = num_pieces
+
+        white, black = torch.from_numpy(indices)
+        return (white, values), (black, values)
+
     def get_feature_factors(self, idx: int) -> list[int]:
         if idx >= self.num_real_features:
             raise Exception("Feature must be real")
@@ -92,6 +172,17 @@ class FactorizedFeatures(FeatureBlock):
             self.get_factor_base_feature("P") + p_idx,
         ]
 
+    def get_feature_factors_array(self) -> np.ndarray:
+        idx = np.arange(self.num_real_features, dtype=np.int64)
+        k_idx = idx // NUM_PLANES
+        p_idx = idx % NUM_PLANES - 1
+
+        return np.stack([
+            idx,
+            self.get_factor_base_feature("HalfK") + k_idx,
+            self.get_factor_base_feature("P") + p_idx,
+        ], axis=1)
+
     def get_initial_psqt_features(self):
         raise Exception("Not supported yet. See HalfKA^")
 
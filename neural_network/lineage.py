@@ -0,0 +1,102 @@
+import csv
+import io
+import os
+import re
+
+import torch
+
+# Names assigned by the registry, model1, model2, ...
+MODEL_NAME_PATTERN = re.compile(r"model(\d+)")
+
+# Draws of an already used parent pair before a breeding falls back to a mutation
+MAX_PAIR_ATTEMPTS = 16
+
+
+class LineageRegistry:
+    """Assign compact model names and record the genealogy of every generation.
+
+    Every new model gets the next free name model{n}, so names stay short however many
+    generations a lineage spans. The parent pairs bred in the current generation are kept
+    in a set, so a repeated pair is found in O(1). The offspring of a generation are
+    written to a genealogy file next to the parent models.
+    """
+
+    def __init__(self, next_id: int = 1):
+        self.next_id = next_id
+        self.used_pairs = set()
+        self.records = []
+
+    @staticmethod
+    def from_population(population: list) -> "LineageRegistry":
+        """Create a registry whose new names do not clash with the names in a population."""
+        ids = [int(match.group(1)) for match in (MODEL_NAME_PATTERN.fullmatch(model.name) for model in population) if match]
+        return LineageRegistry(max(ids, default=0) + 1)
+
+    def new_name(self) -> str:
+        """Get a name that was never given out before."""
+        name = f"model{self.next_id}"
+        self.next_id += 1
+        return name
+
+    def start_generation(self):
+        """Forget the parent pairs and records of the previous generation."""
+        self.used_pairs.clear()
+        self.records.clear()
+
+    @staticmethod
+    def plan_offspring(num_children: int, mutation_rate: float, num_parents: int, generator: torch.Generator = None) -> list[str]:
+        """Decide up front which children are mutations and which are bred.
+
+        Each child is a mutation with probability mutation_rate. Because a parent pair is
+        only bred once per generation, no more children are bred than there are pairs of
+        parents; the others become mutations.
+
+        Args:
+            num_children (int): The number of children to plan.
+            mutation_rate (float): The probability that a child is a mutation.
+            num_parents (int): The number of parents the children are made from.
+            generator (torch.Generator, optional): Random number generator, to make the plan reproducible.
+
+        Returns:
+            list[str]: "mutation" or "breeding" for every child.
+        """
+        num_pairs = num_parents * (num_parents - 1) // 2
+        operators = []
+        num_breedings = 0
+        for draw in torch.rand(num_children, generator=generator, dtype=torch.float64).tolist():
+            if draw < mutation_rate or num_breedings >= num_pairs:
+                operators.append("mutation")
+            else:
+                operators.append("breeding")
+                num_breedings += 1
+        return operators
+
+    def claim_pair(self, parent1: str, parent2: str) -> bool:
+        """Mark a parent pair as bred in this generation.
+
+        Returns:
+            bool: False if the pair, in either order, was already bred in this generation.
+        """
+        pair = (parent1, parent2) if parent1 < parent2 else (parent2, parent1)
+        if pair in self.used_pairs:
+            return False
+        self.used_pairs.add(pair)
+        return True
+
+    def record(self, child: str, operator: str, parents: list[str]):
+        """Record how a child of the current generation was made."""
+        self.records.append((child, operator, *parents))
+
+    def serialize(self) -> bytes:
+        """Get the genealogy of the current generation as CSV rows of child, operator and parents."""
+        buffer = io.StringIO(newline="")
+        writer = csv.writer(buffer)
+        writer.writerow(["child", "operator", "parent1", "parent2"])
+        writer.writerows(self.records)
+        return buffer.getvalue().encode("utf-8")
+
+    def save(self, file_path: str):
+        """Write the genealogy of the current generation to a CSV file."""
+        os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+        with open(file_path, "wb") as genealogy_file:
+            genealogy_file.write(self.serialize())
@@ -11,7 +11,7 @@ def load_model(
     filename: str,
     feature_set: FeatureSet,
     config: ModelConfig,
-    quantize_config: QuantizationConfig,
+    quantize_config: QuantizationConfig = None,
 ) -> NNUEModel:
     if filename.endswith(".pt"):
         model = torch.load(filename, weights_only=False)
@@ -31,9 +31,9 @@ def load_model(
         return model.model
 
     elif filename.endswith(".nnue"):
-        with open(filename, "rb") as f:
-            reader = NNUEReader(f, feature_set, config, quantize_config)
-        return reader.model
+        model = NNUEReader(filename).read()
+        model.feature_set = feature_set
+        return model
 
     else:
         raise Exception("Invalid filetype: " + str(filename))
\ No newline at end of file
@@ -1,10 +1,20 @@
-from typing import Generator
+import dataclasses
+import hashlib
+from collections import OrderedDict
+from typing import Callable
 
+import chess
 import torch
 from torch import nn, Tensor
 import torch.nn.functional as F
+from neural_network.accumulator import Accumulator, NUM_SQ
 from neural_network.features.feature_set import FeatureSet
 from neural_network.serialize import NNUEWriter, NNUEReader
+from neural_network.quantize import QuantizationConfig, QuantizedNNUEWriter, calibrate_activation_ranges
+from neural_network.quantized_inference import QuantizedNetwork
+
+# How an NNUEModel evaluates positions: float32 layers, or the integer arithmetic of Stockfish
+INFERENCE_BACKENDS = ("float", "quantized")
 
 class StackedLinear(nn.Module):
     def __init__(self, in_features: int, out_features: int, count: int):
@@ -45,6 +55,113 @@ class StackedLinear(nn.Module):
 
         return selected_output
 
+class SparseLinear(nn.Linear):
+    """Linear layer that can also take its input as the indices and values of its non-zero features.
+
+    The weights keep the [out, in] shape of nn.Linear, so the layer serializes, hashes and
+    evaluates dense inputs exactly like nn.Linear. They are stored column-major: weight.t()
+    is the contiguous [in, out] table of F.embedding_bag, which sums the weight columns of
+    the active features, so the cost scales with the number of active features instead of
+    the input width.
+    """
+
+    def __init__(self, in_features: int, out_features: int, bias: bool = True, device=None, dtype=None):
+        super().__init__(in_features, out_features, bias, device="meta", dtype=dtype)
+        self.weight = nn.Parameter(torch.empty((in_features, out_features), device=device, dtype=dtype).t())
+        if bias:
+            self.bias = nn.Parameter(torch.empty(out_features, device=device, dtype=dtype))
+        self.reset_parameters()
+
+    def forward_sparse(self, indices: Tensor, offsets: Tensor, values: Tensor = None) -> Tensor:
+        """Evaluate a batch of sparse inputs.
+
+        Args:
+            indices (Tensor): The indices of the active features of all inputs, concatenated.
+            offsets (Tensor): The position in indices where the features of each input start.
+            values (Tensor, optional): The value of every active feature. Defaults to 1.
+
+        Returns:
+            Tensor: A [len(offsets), out_features] matrix, one row per input.
+        """
+        output = F.embedding_bag(indices, self.weight.t(), offsets, mode="sum", per_sample_weights=values)
+        return output + self.bias if self.bias is not None else output
+
+
+def sparse_batch(feature_set: FeatureSet, boards: list[chess.Board]) -> tuple[tuple, tuple]:
+    """Gather the sparse features of a batch of boards for NNUEModel.evaluate_sparse.
+
+    Returns:
+        tuple: The indices, offsets and values of the white perspective, then the same for
+            the black perspective.
+    """
+    perspectives = ([], []), ([], [])
+    for board in boards:
+        for (indices, values), perspective in zip(feature_set.get_active_indices(board), perspectives):
+            perspective[0].append(indices)
+            perspective[1].append(values)
+
+    def concatenate(indices, values):
+        offsets = torch.tensor([0] + [len(part) for part in indices[:-1]]).cumsum(0)
+        return torch.cat(indices), offsets, torch.cat(values)
+
+    return concatenate(*perspectives[0]), concatenate(*perspectives[1])
+
+
+def position_key(board: chess.Board) -> tuple:
+    """Get a key identifying a position in the evaluation cache.
+
+    The key is the exact piece placement, side to move, castling rights and en passant
+    square, so two different positions never share a key. It is built from the board's
+    bitboards, which is an order of magnitude faster than chess.polyglot.zobrist_hash and
+    matters when every child position is looked up.
+    """
+    return (
+        board.pawns, board.knights, board.bishops, board.rooks, board.queens, board.kings,
+        board.occupied_co[chess.WHITE], board.turn, board.castling_rights, board.ep_square,
+    )
+
+
+class EvalCache:
+    """Bounded LRU cache of position evaluations keyed by position_key."""
+
+    def __init__(self, max_entries: int = 16384):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> float:
+        """Get the cached evaluation of a position, or None if it is not cached."""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: tuple, value: float):
+        """Store the evaluation of a position, evicting the least recently used one when full."""
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """Get the hit, miss and eviction counters and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
 class NNUEModel(nn.Module):
     def __init__(
         self,
@@ -52,6 +169,7 @@ class NNUEModel(nn.Module):
         hidden_sizes: list[int],
         output_size: int,
         feature_set: FeatureSet = None,
+        sparse_input: bool = False,
     ):
         super().__init__()
 
@@ -60,19 +178,87 @@ class NNUEModel(nn.Module):
         current_size = input_size
 
         for hidden_size in hidden_sizes:
-            layers.append(nn.Linear(current_size, hidden_size))
+            # A sparse first layer also takes the indices of the active features, see SparseLinear
+            linear = SparseLinear if sparse_input and not layers else nn.Linear
+            layers.append(linear(current_size, hidden_size))
             layers.append(nn.ReLU())
             current_size = hidden_size
 
         layers.append(nn.Linear(current_size, output_size))
 
         self.model = nn.Sequential(*layers)
+        self.eval_cache = EvalCache()
+        self.inference = "float"
+        self.quantization_config = None
+        self.calibration_inputs = None
+        self.quantized_network = None
 
     def forward(self, x: Tensor) -> Tensor:
         if self.feature_set:
             x = self.feature_set.get_active_features(x)
         return self.model(x)
 
+    @torch.no_grad()
+    def evaluate_sparse(self, indices: Tensor, offsets: Tensor, values: Tensor = None) -> Tensor:
+        """Evaluate a batch of positions given as the indices and values of their non-zero features.
+
+        The model must have been built with sparse_input, see SparseLinear.forward_sparse.
+
+        Returns:
+            Tensor: A [len(offsets)] tensor with the evaluation score of every position.
+        """
+        return self.model[1:](self.model[0].forward_sparse(indices, offsets, values)).view(-1)
+
+    def invalidate_eval_cache(self):
+        """Drop all cached evaluations. Must be called whenever the weights change."""
+        self.eval_cache = EvalCache(self.eval_cache.max_entries)
+        self.quantized_network = None
+
+    def set_inference(self, inference: str, config: QuantizationConfig = None, calibration_inputs: Tensor = None):
+        """Choose how the model evaluates positions.
+
+        Args:
+            inference (str): "float" for the float32 layers, or "quantized" for the integer
+                arithmetic of the exported Stockfish network, see QuantizedNetwork.
+            config (QuantizationConfig, optional): The scales of the quantized network.
+            calibration_inputs (Tensor, optional): A [N, input_size] batch of typical network
+                inputs. When given, the activation ranges of the config are measured on them
+                every time the weights are quantized, see calibrate_activation_ranges.
+        """
+        if inference not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend: {inference}. Expected one of {INFERENCE_BACKENDS}.")
+        self.inference = inference
+        self.quantization_config = config
+        self.calibration_inputs = calibration_inputs
+        self.invalidate_eval_cache()
+
+    def get_quantized_network(self) -> QuantizedNetwork:
+        """Get the quantized network of the current weights, quantizing them on first use."""
+        if self.quantized_network is None:
+            config = self.quantization_config or QuantizationConfig()
+            if self.calibration_inputs is not None:
+                config = dataclasses.replace(config, activation_ranges=calibrate_activation_ranges(self, self.calibration_inputs))
+            self.quantized_network = QuantizedNetwork(self, config)
+        return self.quantized_network
+
+    def load_state_dict(self, *args, **kwargs):
+        result = super().load_state_dict(*args, **kwargs)
+        self.invalidate_eval_cache()
+        return result
+
+    def architecture(self) -> tuple[int, list[int], int]:
+        """Get the input size, hidden layer sizes and output size of the model."""
+        linear_layers = [layer for layer in self.model if isinstance(layer, nn.Linear)]
+        hidden_sizes = [layer.out_features for layer in linear_layers[:-1]]
+        return linear_layers[0].in_features, hidden_sizes, linear_layers[-1].out_features
+
+    def weights_hash(self) -> str:
+        """Get a content hash of the architecture and weights, equal for models with identical weights."""
+        digest = hashlib.blake2b(repr(self.architecture()).encode(), digest_size=16)
+        for parameter in self.parameters():
+            digest.update(parameter.detach().cpu().contiguous().numpy())
+        return digest.hexdigest()
+
     def initialize_weights(self):
         """Initialize weights to match Stockfish NNUE expectations."""
         for layer in self.model:
@@ -91,11 +277,32 @@ class NNUEModel(nn.Module):
         model.load_state_dict(torch.load(file_path))
         return model
 
-    def save_stockfish_format(self, file_path: str):
-        """Save the model in Stockfish-compatible .nnue format."""
+    def save_stockfish_format(self, file_path: str, coalesce_factors: bool = False):
+        """Save the model in Stockfish-compatible .nnue format.
+
+        Args:
+            file_path (str): The path of the .nnue file.
+            coalesce_factors (bool): Fold the virtual features of a factorized feature set into
+                the real ones, for a network that only takes the real features.
+        """
+        NNUEWriter(self, coalesce_factors=coalesce_factors).write(file_path)
+
+    def state_snapshot(self) -> dict[str, Tensor]:
+        """Get a copy of the weights that stays unchanged while the model keeps changing, see serialize_state_dict."""
+        return {name: tensor.detach().clone() for name, tensor in self.state_dict().items()}
+
+    def serialize_stockfish_format(self) -> bytearray:
+        """Get the content of the Stockfish-compatible .nnue file of the model."""
         writer = NNUEWriter(self)
         writer.serialize()
-        writer.write(file_path)
+        return writer.buffer
+
+    def save_quantized_stockfish_format(self, file_path: str, config: QuantizationConfig = None):
+        """Save the model as a quantized .nnue file, with the int16 and int8 weights of Stockfish.
+
+        Stockfish itself cannot load the file, see QuantizedNNUEWriter.
+        """
+        QuantizedNNUEWriter(self, config).write(file_path)
 
     @staticmethod
     def load_stockfish_format(file_path: str):
@@ -116,12 +323,133 @@ class NNUEModel(nn.Module):
             # Extract active features from the board features
             board_features = self.feature_set.get_active_features(board_features)
 
+        if self.inference == "quantized":
+            return float(self.get_quantized_network().evaluate(board_features.view(1, -1).numpy())[0])
+
         # Pass the features through the model to get the evaluation score
         output = self.model(board_features)
 
         # Convert the output tensor to a scalar value
         return output.item()
 
+    @torch.no_grad()
+    def evaluate_boards(self, boards_features: Tensor) -> Tensor:
+        """Evaluate a batch of chess board positions in a single forward pass.
+
+        Args:
+            boards_features (Tensor): A [N, input_size] matrix with one row of features per position.
+
+        Returns:
+            Tensor: A [N] tensor with the evaluation score of every position.
+        """
+        if self.inference == "quantized":
+            return torch.from_numpy(self.get_quantized_network().evaluate(boards_features.numpy())).float()
+        return self.model(boards_features).view(-1)
+
+    def score_moves(self, board: chess.Board, moves: list[chess.Move], board_to_features: Callable[[chess.Board], list]) -> Tensor:
+        """Score the child positions reached by playing each move on the board.
+
+        Child positions found in the evaluation cache are not evaluated again. The features
+        of the remaining child positions are stacked into one matrix so that they are all
+        evaluated with a single forward pass. The cache assumes board_to_features is the
+        same for every call on this model.
+
+        Args:
+            board (chess.Board): The current board position. It is left unchanged.
+            moves (list[chess.Move]): The candidate moves to score.
+            board_to_features (Callable): Converts a board into its list of input features.
+
+        Returns:
+            Tensor: A [len(moves)] tensor with the evaluation score of every child position.
+        """
+        scores = [None] * len(moves)
+        missing_indices = []
+        missing_keys = []
+        missing_features = []
+        for i, move in enumerate(moves):
+            board.push(move)
+            key = position_key(board)
+            scores[i] = self.eval_cache.get(key)
+            if scores[i] is None:
+                missing_indices.append(i)
+                missing_keys.append(key)
+                missing_features.append(board_to_features(board))
+            board.pop()
+
+        if missing_features:
+            evaluations = self.evaluate_boards(torch.tensor(missing_features, dtype=torch.float32)).tolist()
+            for i, key, evaluation in zip(missing_indices, missing_keys, evaluations):
+                scores[i] = evaluation
+                self.eval_cache.put(key, evaluation)
+
+        return torch.tensor(scores)
+
+    def supports_accumulator(self) -> bool:
+        """Whether the model takes the square encoding of tournament.convert_board_to_features.
+
+        Only such models can be updated incrementally with an Accumulator. A model with a
+        feature set or a sparse first layer takes other inputs, and must be evaluated with
+        score_moves instead.
+        """
+        return self.feature_set is None and not isinstance(self.model[0], SparseLinear) and self.model[0].in_features >= NUM_SQ
+
+    def create_accumulator(self, board: chess.Board) -> Accumulator:
+        """Create an accumulator holding the first-layer output of the board.
+
+        The accumulator assumes the square encoding of tournament.convert_board_to_features.
+        With the quantized backend it holds int32 sums.
+
+        Raises:
+            ValueError: If the model does not take that encoding, see supports_accumulator.
+        """
+        if not self.supports_accumulator():
+            raise ValueError("Accumulators need a model that takes the square encoding, without a feature set or sparse first layer.")
+        if self.inference == "quantized":
+            return self.get_quantized_network().create_accumulator(board)
+        return Accumulator.from_layer(self.model[0], board)
+
+    @torch.no_grad()
+    def score_moves_incremental(self, board: chess.Board, moves: list[chess.Move], accumulator: Accumulator) -> Tensor:
+        """Score the child positions reached by playing each move on the board.
+
+        The first-layer outputs of the child positions are derived from the accumulator of
+        the current position, so only the layers after the first one are evaluated. This is
+        cheaper than looking the child positions up in the evaluation cache, which is not used.
+
+        Args:
+            board (chess.Board): The current board position. It is left unchanged.
+            moves (list[chess.Move]): The candidate moves to score.
+            accumulator (Accumulator): The accumulator of the current board position.
+
+        Returns:
+            Tensor: A [len(moves)] tensor with the evaluation score of every child position.
+        """
+        children = accumulator.children(board, moves)
+        if self.inference == "quantized":
+            return torch.from_numpy(self.get_quantized_network().propagate(children.numpy()))
+        return self.model[1:](children).view(-1)
+
+    def select_move(self, board: chess.Board, board_to_features: Callable[[chess.Board], list], legal_moves: list[chess.Move] = None, accumulator: Accumulator = None) -> chess.Move:
+        """Pick the legal move whose child position gets the highest evaluation.
+
+        Args:
+            board (chess.Board): The current board position. It is left unchanged.
+            board_to_features (Callable): Converts a board into its list of input features.
+            legal_moves (list[chess.Move], optional): The legal moves of the board, if already generated.
+            accumulator (Accumulator, optional): The accumulator of the board. When given, the
+                moves are scored incrementally and board_to_features is not used.
+
+        Returns:
+            chess.Move: The best scoring legal move. Ties go to the first move in generation order.
+        """
+        if legal_moves is None:
+            legal_moves = list(board.legal_moves)
+        if accumulator is not None:
+            scores = self.score_moves_incremental(board, legal_moves, accumulator)
+        else:
+            scores = self.score_moves(board, legal_moves, board_to_features)
+        return legal_moves[int(torch.argmax(scores))]
+
 
 def generate_stockfish_nn():
     """Generate a Stockfish-compatible NNUE model with predefined hidden layers."""
@@ -152,59 +480,108 @@ def generate_nn_from_config(config_path: str):
 
     return NNUEModel(input_size, hidden_layers, output_size)
 
-def mutate_model(model: NNUEModel, temperature: float) -> NNUEModel:
+# Ways breed_models combines the weights of two parents
+CROSSOVER_MODES = ("average", "uniform", "layer", "neuron")
+
+
+def allocate_model_like(model: NNUEModel) -> NNUEModel:
+    """Create a model with the architecture of another one, without initializing its weights.
+
+    The model is built on the meta device and its parameter buffers are allocated once,
+    uninitialized, so the caller must overwrite every parameter.
+    """
+    input_size, hidden_sizes, output_size = model.architecture()
+    with torch.device("meta"):
+        new_model = NNUEModel(input_size, hidden_sizes, output_size, model.feature_set, isinstance(model.model[0], SparseLinear))
+
+    device = model.model[0].weight.device
+    for name, parameter in list(new_model.named_parameters()):
+        module_name, parameter_name = name.rsplit(".", 1)
+        # Keep the strides, so that a SparseLinear keeps its column-major weights
+        new_parameter = nn.Parameter(torch.empty_strided(parameter.shape, parameter.stride(), device=device))
+        setattr(new_model.get_submodule(module_name), parameter_name, new_parameter)
+    return new_model
+
+
+@torch.no_grad()
+def mutate_model(model: NNUEModel, temperature: float, generator: torch.Generator = None) -> NNUEModel:
     """Mutate a model by slightly tuning a few nodes based on a temperature variable.
 
     Args:
         model (NNUEModel): The base model to mutate.
         temperature (float): Controls the extent of mutation. Higher values increase the number of nodes changed and the magnitude of changes.
+        generator (torch.Generator, optional): Random number generator, to make the mutation reproducible.
 
     Returns:
         NNUEModel: A new mutated model.
     """
-    import copy
-
-    # Clone the model to avoid modifying the original
-    mutated_model = copy.deepcopy(model)
+    mutated_model = allocate_model_like(model)
 
-    for layer in mutated_model.model:
+    for layer, mutated_layer in zip(model.model, mutated_model.model):
         if isinstance(layer, nn.Linear):
             # Determine the number of nodes to mutate based on temperature
-            num_nodes_to_mutate = max(1, int(temperature * layer.weight.size(0)))
+            out_features = layer.weight.size(0)
+            num_nodes_to_mutate = max(1, int(temperature * out_features))
 
             # Randomly select nodes to mutate
-            node_indices = torch.randperm(layer.weight.size(0))[:num_nodes_to_mutate]
+            node_indices = torch.randperm(out_features, generator=generator)[:num_nodes_to_mutate]
 
-            # Apply mutations to the selected nodes
-            for idx in node_indices:
-                layer.weight.data[idx] += torch.randn_like(layer.weight.data[idx]) * temperature
-                layer.bias.data[idx] += torch.randn_like(layer.bias.data[idx]) * temperature
+            # Copy the parent into the new buffers and add one noise tensor over the selected nodes
+            mutated_layer.weight.copy_(layer.weight)
+            mutated_layer.bias.copy_(layer.bias)
+            weight_noise = torch.randn(len(node_indices), layer.weight.size(1), generator=generator)
+            bias_noise = torch.randn(len(node_indices), generator=generator)
+            mutated_layer.weight.index_add_(0, node_indices, weight_noise, alpha=temperature)
+            mutated_layer.bias.index_add_(0, node_indices, bias_noise, alpha=temperature)
 
     return mutated_model
 
-def breed_models(parent1: NNUEModel, parent2: NNUEModel) -> NNUEModel:
-    """Breed two parent models by averaging their weights and biases.
+@torch.no_grad()
+def breed_models(parent1: NNUEModel, parent2: NNUEModel, crossover: str = "average", generator: torch.Generator = None) -> NNUEModel:
+    """Breed two parent models by combining their weights and biases.
 
     Args:
         parent1 (NNUEModel): The first parent model.
         parent2 (NNUEModel): The second parent model.
+        crossover (str): How the parents are combined. "average" averages every weight,
+            "uniform" takes every weight from a random parent, "layer" takes every layer from a
+            random parent and "neuron" takes every node, with its weights and bias, from a random parent.
+        generator (torch.Generator, optional): Random number generator, to make the crossover reproducible.
 
     Returns:
-        NNUEModel: A new model created by averaging the weights and biases of the parents.
+        NNUEModel: A new model created from the weights and biases of the parents.
     """
-    import copy
-
     # Ensure both parents have the same architecture
-    if len(parent1.model) != len(parent2.model):
+    if parent1.architecture() != parent2.architecture():
         raise ValueError("Parent models must have the same architecture.")
+    if crossover not in CROSSOVER_MODES:
+        raise ValueError(f"Unknown crossover mode: {crossover}. Expected one of {CROSSOVER_MODES}.")
 
-    # Clone the first parent to create the child model
-    child_model = copy.deepcopy(parent1)
+    child_model = allocate_model_like(parent1)
 
     for layer1, layer2, child_layer in zip(parent1.model, parent2.model, child_model.model):
-        if isinstance(layer1, nn.Linear) and isinstance(layer2, nn.Linear):
-            # Average the weights and biases of the two parents
-            child_layer.weight.data = (layer1.weight.data + layer2.weight.data) / 2
-            child_layer.bias.data = (layer1.bias.data + layer2.bias.data) / 2
+        if not isinstance(layer1, nn.Linear):
+            continue
 
-    return child_model
\ No newline at end of file
+        if crossover == "average":
+            # Average the weights and biases of the two parents
+            torch.add(layer1.weight, layer2.weight, out=child_layer.weight).div_(2)
+            torch.add(layer1.bias, layer2.bias, out=child_layer.bias).div_(2)
+            continue
+
+        # Masks are True where the child takes the weight of the first parent
+        if crossover == "uniform":
+            weight_mask = torch.rand(layer1.weight.shape, generator=generator) < 0.5
+            bias_mask = torch.rand(layer1.bias.shape, generator=generator) < 0.5
+        elif crossover == "layer":
+            take_first = torch.rand(1, generator=generator) < 0.5
+            weight_mask = take_first.expand(layer1.weight.shape)
+            bias_mask = take_first.expand(layer1.bias.shape)
+        else:
+            bias_mask = torch.rand(layer1.bias.shape, generator=generator) < 0.5
+            weight_mask = bias_mask.unsqueeze(1).expand(layer1.weight.shape)
+
+        torch.where(weight_mask, layer1.weight, layer2.weight, out=child_layer.weight)
+        torch.where(bias_mask, layer1.bias, layer2.bias, out=child_layer.bias)
+
+    return child_model
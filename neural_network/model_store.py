@@ -0,0 +1,149 @@
+import json
+import lzma
+import os
+import zlib
+from functools import partial
+
+from neural_network.checkpoint_writer import CheckpointWriter, write_file_atomically
+from neural_network.model import NNUEModel
+from neural_network.neural_network import PopulationModel
+from neural_network.serialize import NNUEReader, serialize_state_dict
+
+# Compressors of the model blobs, by name: file extension, compress and decompress functions
+COMPRESSORS = {
+    "zlib": (".z", lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (".xz", lzma.compress, lzma.decompress),
+}
+
+MANIFEST_FILE = "manifest.json"
+
+
+class ModelStore:
+    """Content-addressed store of models, with one small manifest per generation.
+
+    Every distinct network is stored once, as a compressed .nnue blob named after the hash
+    of its weights, so survivors carried over to the next generation take no extra space.
+    A generation is a manifest listing the name, blob, score, level and metadata of each of
+    its models.
+
+    Layout under the root folder:
+        blobs/<hash[:2]>/<hash>.nnue.<ext>    compressed Stockfish-format networks
+        generation<n>/manifest.json           the models of generation n
+    """
+
+    def __init__(self, root: str = "models", compression: str = "zlib", checkpoint_writer: CheckpointWriter = None):
+        if compression not in COMPRESSORS:
+            raise ValueError(f"Unknown compression: {compression}. Expected one of {tuple(COMPRESSORS)}.")
+        self.root = root
+        self.compression = compression
+        self.checkpoint_writer = checkpoint_writer
+        # Blobs known to be on disk or queued for writing
+        self._known_blobs = set()
+
+    def generation_folder(self, generation: int) -> str:
+        return os.path.join(self.root, f"generation{generation}")
+
+    def blob_path(self, weights_hash: str, compression: str = None) -> str:
+        """Get the path of the blob holding the network with the given weights hash, relative to the root."""
+        extension = COMPRESSORS[compression or self.compression][0]
+        return os.path.join("blobs", weights_hash[:2], f"{weights_hash}.nnue{extension}")
+
+    def save_generation(self, generation: int, population: list[PopulationModel]):
+        """Store the models of a generation, writing only the networks not stored yet.
+
+        The files are written in the background when the store has a checkpoint writer. The
+        weights are then copied on the calling thread, and serialized and compressed on the
+        writer thread.
+
+        Args:
+            generation (int): Generation number.
+            population (list[PopulationModel]): The models of the generation.
+        """
+        files = []
+        entries = []
+        for model in population:
+            weights_hash = model.model.weights_hash()
+            blob_path = self.blob_path(weights_hash)
+            if blob_path not in self._known_blobs and not os.path.exists(os.path.join(self.root, blob_path)):
+                files.append((os.path.join(self.root, blob_path), partial(self._compressed_blob, model.model.state_snapshot())))
+            self._known_blobs.add(blob_path)
+
+            entries.append({
+                "name": model.name,
+                "blob": blob_path.replace(os.sep, "/"),
+                "architecture": model.model.architecture(),
+                "score": model.score,
+                "level": model.level,
+                "metadata": model.metadata,
+            })
+
+        manifest = {"generation": generation, "models": entries}
+        # The manifest goes last, so it never refers to a blob that is not written yet
+        files.append((os.path.join(self.generation_folder(generation), MANIFEST_FILE), json.dumps(manifest, indent=1).encode("utf-8")))
+
+        if self.checkpoint_writer is not None:
+            self.checkpoint_writer.submit(files)
+            return
+
+        for file_path, data in files:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            write_file_atomically(file_path, data() if callable(data) else data)
+
+    def _compressed_blob(self, state_dict: dict) -> bytes:
+        return COMPRESSORS[self.compression][1](serialize_state_dict(state_dict))
+
+    def load_generation(self, generation: int) -> list[PopulationModel]:
+        """Load the models of a generation.
+
+        Raises:
+            FileNotFoundError: If the generation was not stored in this store.
+
+        Returns:
+            list[PopulationModel]: The models with their scores, levels and metadata.
+        """
+        with open(os.path.join(self.generation_folder(generation), MANIFEST_FILE), "r") as manifest_file:
+            manifest = json.load(manifest_file)
+
+        population = []
+        for entry in manifest["models"]:
+            model = self.load_blob(entry["blob"])
+            if list(model.architecture()) != entry["architecture"]:
+                raise ValueError(f"The blob of {entry['name']} does not have the architecture listed in the manifest.")
+            population.append(PopulationModel(model, entry["name"], entry["score"], entry["level"], entry["metadata"]))
+        return population
+
+    def load_blob(self, blob_path: str) -> NNUEModel:
+        """Load the network stored in a blob.
+
+        Args:
+            blob_path (str): The path of the blob relative to the root, as found in a manifest.
+
+        Raises:
+            ValueError: If the blob is corrupted: it does not decompress, is not a valid network,
+                or its weights do not match the hash in its name.
+
+        Returns:
+            NNUEModel: The stored network.
+        """
+        decompress = next(decompress for extension, _, decompress in COMPRESSORS.values() if blob_path.endswith(extension))
+        with open(os.path.join(self.root, blob_path), "rb") as blob_file:
+            try:
+                data = decompress(blob_file.read())
+            except (zlib.error, lzma.LZMAError) as e:
+                raise ValueError(f"Corrupted blob: {blob_path}") from e
+        # The tensors view the buffer, which must be writable
+        model = NNUEReader(buffer=bytearray(data)).read()
+
+        weights_hash = os.path.basename(blob_path).split(".")[0]
+        if model.weights_hash() != weights_hash:
+            raise ValueError(f"Corrupted blob: the weights in {blob_path} do not match its hash")
+        return model
+
+    def disk_usage(self) -> int:
+        """Get the size of all stored blobs and manifests, in bytes."""
+        total = 0
+        for directory, _, file_names in os.walk(self.root):
+            for file_name in file_names:
+                if file_name == MANIFEST_FILE or ".nnue." in file_name:
+                    total += os.path.getsize(os.path.join(directory, file_name))
+        return total
@@ -2,10 +2,18 @@
 # This module will handle the integration of a neural network for evaluating chess positions.
 
 from neural_network.model import generate_stockfish_nn, generate_nn_from_config
+from neural_network.selection import SelectionConfig, select, softmax_select
+from neural_network.lineage import LineageRegistry, MAX_PAIR_ATTEMPTS
+from neural_network.checkpoint_writer import CheckpointWriter
+from neural_network.serialize import serialize_state_dict
 import torch
 from torch import nn
 import random
 import os
+from functools import partial
+
+# Genealogy of the children of a generation, written to the generation folder
+GENEALOGY_FILE = "genealogy.csv"
 
 class PopulationModel:
     """Class to represent a model in the population with its name, score, level, and metadata."""
@@ -88,7 +96,7 @@ def generate_population_from_nnue(base_nnue_path: str, population_size: int):
 
     return population
 
-def create_new_generation(population: list[PopulationModel], survival_rate: float, mutation_rate: float, population_size: int, temperature: float, decay_rate: float, generation: int):
+def create_new_generation(population: list[PopulationModel], survival_rate: float, mutation_rate: float, population_size: int, temperature: float, decay_rate: float, generation: int, crossover: str = "average", generator: torch.Generator = None, selection: SelectionConfig = None, lineage: LineageRegistry = None, checkpoint_writer: CheckpointWriter = None, model_store=None, population_store=None):
     """Create a new generation of models based on survival, mutation, and breeding.
 
     Args:
@@ -99,6 +107,17 @@ def create_new_generation(population: list[PopulationModel], survival_rate: floa
         temperature (float): The temperature for mutation randomness.
         decay_rate (float): The rate at which survival rate and temperature decay.
         generation (int): The current generation number.
+        crossover (str): How bred children combine the weights of their parents, see model.breed_models.
+        generator (torch.Generator, optional): Random number generator for selection, mutation and breeding.
+        selection (SelectionConfig, optional): How survivors and parents are selected. Defaults to softmax selection.
+        lineage (LineageRegistry, optional): Names the new models and records their genealogy. Keep the same
+            registry across generations so that names are never reused.
+        checkpoint_writer (CheckpointWriter, optional): Writes the snapshot of the current population in the
+            background. When omitted, the snapshot is written before the new generation is built.
+        model_store (ModelStore, optional): Stores the snapshot as a manifest of deduplicated, compressed
+            networks instead of one .nnue file per model.
+        population_store (PopulationStore, optional): The store the population is a view of. The new
+            generation is then built in the store with bulk operations, see PopulationStore.advance.
 
     Returns:
         list[PopulationModel]: The new generation of models.
@@ -108,64 +127,95 @@ def create_new_generation(population: list[PopulationModel], survival_rate: floa
     # Sort population by score in descending order
     population.sort(key=lambda x: x.score, reverse=True)
 
-    # Serialize the current population to files
+    # Serialize the current population to files, in the background when a checkpoint writer is given
     generation_folder = f"models/generation{generation}"
     os.makedirs(generation_folder, exist_ok=True)
-    for model in population:
-        model_path = os.path.join(generation_folder, f"{model.name}_{model.score:.2f}.nnue")
-        model.model.save_stockfish_format(model_path)
+    if model_store is not None:
+        model_store.save_generation(generation, population)
+    elif checkpoint_writer is not None:
+        # Only the copy of the weights is taken here, the writer thread serializes it
+        checkpoint_writer.submit([
+            (os.path.join(generation_folder, f"{model.name}_{model.score:.2f}.nnue"), partial(serialize_state_dict, model.model.state_snapshot()))
+            for model in population
+        ])
+    else:
+        for model in population:
+            model_path = os.path.join(generation_folder, f"{model.name}_{model.score:.2f}.nnue")
+            model.model.save_stockfish_format(model_path)
 
     # Determine the number of survivors
     num_survivors = max(1, int(survival_rate * population_size))
 
-    # Select survivors using the softmax-based selection function
-    survivors = select_with_softmax(population, num_survivors)
+    # Select survivors with the configured selection operator
+    survivors = select(population, num_survivors, selection, generator)
 
     # Initialize the new generation with survivors
-    new_generation = [PopulationModel(s.model, s.name, s.score, s.metadata) for s in survivors]
+    new_generation = [PopulationModel(s.model, s.name, s.score, s.level, s.metadata) for s in survivors]
+    # With a population store, the children are only planned here and made in bulk afterwards
+    mutation_children = []
+    breeding_children = []
 
-    # Fill the rest of the population
-    while len(new_generation) < population_size:
-        if random.random() < mutation_rate:
-            # Select a top model to mutate using softmax-scaled probabilities
-            top_models = select_with_softmax(population[:num_survivors], 1)
-            parent = top_models[0]
-            mutated_model = mutate_model(parent.model, temperature=temperature)
-
-            # Generate a new name for the mutated model
-            existing_names = {m.name for m in new_generation}
-            mutation_count = parent.metadata.get("mutations", 0) + 1
-            name = f"{parent.name}.{mutation_count}"
-
-            # Ensure the name is unique
-            while name in existing_names:
-                mutation_count += 1
-                name = f"{parent.name}.{mutation_count}"
-
-            # Update metadata
-            metadata = parent.metadata.copy()
-            metadata["mutations"] = mutation_count
+    # Plan the offspring up front, never breeding more children than there are parent pairs
+    lineage = lineage or LineageRegistry.from_population(population)
+    lineage.start_generation()
+    parents = population[:num_survivors]
+    operators = lineage.plan_offspring(population_size - len(new_generation), mutation_rate, len(parents), generator)
 
-            new_generation.append(PopulationModel(mutated_model, name, score=0.0, metadata=metadata))
+    # Fill the rest of the population
+    for operator in operators:
+        if operator == "breeding":
+            # Select two top models to breed with weighted probability based on scores,
+            # redrawing pairs that already bred in this generation a bounded number of times
+            for _ in range(MAX_PAIR_ATTEMPTS):
+                parent1, parent2 = select(parents, 2, selection, generator)
+                if lineage.claim_pair(parent1.name, parent2.name):
+                    break
+            else:
+                operator = "mutation"
+
+        name = lineage.new_name()
+        if operator == "breeding":
+            metadata = {"parents": [parent1.name, parent2.name]}
+            lineage.record(name, operator, [parent1.name, parent2.name])
+            if population_store is not None:
+                breeding_children.append(((parent1, parent2), name, metadata))
+                continue
+            child_model = breed_models(parent1.model, parent2.model, crossover=crossover, generator=generator)
         else:
-            # Select two top models to breed with weighted probability based on scores
-            top_models = select_with_softmax(population[:num_survivors], 2)
-            parent1, parent2 = top_models
-
-            # Ensure the parent combination hasn't already bred
-            existing_combinations = {(m.metadata.get("parents", [None, None])[0], m.metadata.get("parents", [None, None])[1]) for m in new_generation if "parents" in m.metadata}
-            if (parent1.name, parent2.name) in existing_combinations or (parent2.name, parent1.name) in existing_combinations:
+            # Select a top model to mutate
+            parent = select(parents, 1, selection, generator)[0]
+            metadata = parent.metadata.copy()
+            metadata["parent"] = parent.name
+            metadata["mutations"] = parent.metadata.get("mutations", 0) + 1
+            lineage.record(name, operator, [parent.name])
+            if population_store is not None:
+                mutation_children.append((parent, name, metadata))
                 continue
+            child_model = mutate_model(parent.model, temperature=temperature, generator=generator)
 
-            child_model = breed_models(parent1.model, parent2.model)
-
-            # Generate a new name for the child model
-            name = f"{parent1.name}-{parent2.name}"
+        new_generation.append(PopulationModel(child_model, name, score=0.0, metadata=metadata))
 
-            # Update metadata
-            metadata = {"parents": [parent1.name, parent2.name]}
-
-            new_generation.append(PopulationModel(child_model, name, score=0.0, metadata=metadata))
+    if population_store is not None:
+        new_generation += [PopulationModel(None, name, score=0.0, metadata=metadata) for _, name, metadata in mutation_children + breeding_children]
+        population_store.advance(
+            [population_store.slot(model.model) for model in survivors],
+            [population_store.slot(parent.model) for parent, _, _ in mutation_children],
+            [(population_store.slot(parent1.model), population_store.slot(parent2.model)) for (parent1, parent2), _, _ in breeding_children],
+            temperature, crossover, generator,
+        )
+        for slot, model in enumerate(new_generation):
+            population_store.names[slot] = model.name
+            population_store.scores[slot] = model.score
+            population_store.levels[slot] = model.level
+            population_store.metadata[slot] = model.metadata
+        new_generation = population_store.population()
+
+    # Keep the genealogy of the new models next to their parents
+    genealogy_path = os.path.join(generation_folder, GENEALOGY_FILE)
+    if checkpoint_writer is not None:
+        checkpoint_writer.submit([(genealogy_path, lineage.serialize())])
+    else:
+        lineage.save(genealogy_path)
 
     # Decay survival rate and temperature
     survival_rate = max(0.01, survival_rate * (1 - decay_rate))
@@ -177,39 +227,13 @@ def select_with_softmax(population: list[PopulationModel], num_to_select: int) -
     """Select unique models from the population using softmax-scaled probabilities.
 
     Args:
-        population (list[PopulationModel]): The population of models to select from.
+        population (list[PopulationModel]): The population of models to select from. It is left unchanged.
         num_to_select (int): The number of models to select.
 
     Returns:
         list[PopulationModel]: The selected models.
     """
-    import math
-
-    # Extract scores and compute softmax probabilities
-    scores = [model.score for model in population]
-    exp_scores = [math.exp(score) for score in scores]
-    total = sum(exp_scores)
-    probabilities = [exp_score / total for exp_score in exp_scores]
-
-    # Select unique models by picking one at a time and removing it from the list
-    selected = []
-    for _ in range(num_to_select):
-        if not population:
-            break  # Stop if the population is empty
-
-        chosen = random.choices(population, weights=probabilities, k=1)[0]
-        selected.append(chosen)
-
-        # Remove the chosen model from the population and update probabilities
-        index = population.index(chosen)
-        population.pop(index)
-        probabilities.pop(index)
-
-        if population:  # Recalculate probabilities only if there are remaining elements
-            total = sum(probabilities)
-            probabilities = [p / total for p in probabilities]
-
-    return selected
+    return softmax_select(population, num_to_select)
 
 def load_population_from_folder(folder_path: str) -> list[PopulationModel]:
     """Load a population of models from a folder.
@@ -0,0 +1,287 @@
+import torch
+from torch import nn, Tensor
+
+from neural_network.features import get_feature_set_from_name
+from neural_network.features.feature_set import FeatureSet
+from neural_network.model import CROSSOVER_MODES, NNUEModel, SparseLinear
+from neural_network.neural_network import PopulationModel
+
+
+class PopulationStore:
+    """Population of models with one architecture, stored as one [N, ...] tensor per parameter.
+
+    Every parameter of every model lives in a row of a single stacked tensor, so copying,
+    mutating, breeding, measuring and saving the whole population takes one tensor
+    operation per parameter instead of one per model. Models handed out by model() are
+    views on their row: writes to the store show up in them, and their evaluation caches
+    are invalidated when their row is overwritten.
+
+    Set "population_store" in appsettings.json to let create_new_generation build every
+    generation in the store with advance.
+    """
+
+    def __init__(self, input_size: int, hidden_sizes: list[int], output_size: int, size: int, feature_set: FeatureSet = None, sparse_input: bool = False):
+        self.input_size = input_size
+        self.hidden_sizes = list(hidden_sizes)
+        self.output_size = output_size
+        self.size = size
+        self.feature_set = feature_set
+        self.sparse_input = sparse_input
+
+        template = self._empty_model()
+        self.parameters = {name: torch.zeros(size, *parameter.shape) for name, parameter in template.named_parameters()}
+        # Weight and bias of each linear layer, mutated with the same row mask
+        self.layers = [
+            (f"{name}.weight", f"{name}.bias")
+            for name, module in template.named_modules()
+            if isinstance(module, nn.Linear)
+        ]
+
+        self.names = [f"model{slot + 1}" for slot in range(size)]
+        self.scores = [0.0] * size
+        self.levels = [0] * size
+        self.metadata = [{} for _ in range(size)]
+        self._views = {}
+        self._slots = {}
+
+    def _empty_model(self) -> NNUEModel:
+        # Parameters on the meta device take no memory, they are replaced by views on the store
+        with torch.device("meta"):
+            return NNUEModel(self.input_size, self.hidden_sizes, self.output_size, self.feature_set, self.sparse_input)
+
+    @staticmethod
+    def from_population(population: list[PopulationModel]) -> "PopulationStore":
+        """Copy a list-based population into a new store.
+
+        Args:
+            population (list[PopulationModel]): The models to copy. They must share one architecture.
+
+        Returns:
+            PopulationStore: The store holding the weights, names, scores, levels and metadata of the population.
+        """
+        architectures = {
+            (repr(model.model.architecture()), model.model.feature_set.name if model.model.feature_set is not None else None, isinstance(model.model.model[0], SparseLinear))
+            for model in population
+        }
+        if len(architectures) != 1:
+            raise ValueError("A population store needs models with the same architecture and feature set.")
+
+        first_model = population[0].model
+        input_size, hidden_sizes, output_size = first_model.architecture()
+        store = PopulationStore(input_size, hidden_sizes, output_size, len(population), first_model.feature_set, isinstance(first_model.model[0], SparseLinear))
+        with torch.no_grad():
+            for name, stack in store.parameters.items():
+                torch.stack([model.model.get_parameter(name).detach() for model in population], out=stack)
+
+        for slot, model in enumerate(population):
+            store.names[slot] = model.name
+            store.scores[slot] = model.score
+            store.levels[slot] = model.level
+            store.metadata[slot] = dict(model.metadata)
+        return store
+
+    def model(self, slot: int) -> NNUEModel:
+        """Get the model stored in a slot, as a view on its row of the store."""
+        view = self._views.get(slot)
+        if view is not None:
+            return view
+
+        view = self._empty_model()
+        for name, stack in self.parameters.items():
+            module_name, parameter_name = name.rsplit(".", 1)
+            setattr(view.get_submodule(module_name), parameter_name, nn.Parameter(stack[slot], requires_grad=False))
+        self._views[slot] = view
+        self._slots[id(view)] = slot
+        return view
+
+    def slot(self, model: NNUEModel) -> int:
+        """Get the slot of a model handed out by model() or population().
+
+        Raises:
+            ValueError: If the model is not a view on the current generation of the store.
+        """
+        slot = self._slots.get(id(model))
+        if slot is None or self._views.get(slot) is not model:
+            raise ValueError("The model is not a view on this population store.")
+        return slot
+
+    def population(self) -> list[PopulationModel]:
+        """Get the stored models as a list-based population of views, e.g. to run their tournaments."""
+        return [
+            PopulationModel(self.model(slot), self.names[slot], self.scores[slot], self.levels[slot], self.metadata[slot])
+            for slot in range(self.size)
+        ]
+
+    def _invalidate(self, slots: Tensor):
+        for slot in slots.tolist():
+            view = self._views.get(slot)
+            if view is not None:
+                view.invalidate_eval_cache()
+
+    @torch.no_grad()
+    def copy(self, source_slots: Tensor, target_slots: Tensor):
+        """Copy the weights of the models in source_slots into target_slots."""
+        for stack in self.parameters.values():
+            stack[target_slots] = stack[source_slots]
+        self._invalidate(target_slots)
+
+    @torch.no_grad()
+    def mutate(self, parent_slots: Tensor, child_slots: Tensor, temperature: float, generator: torch.Generator = None):
+        """Write mutated copies of parents into child slots, like model.mutate_model in bulk.
+
+        For every layer of every child, max(1, temperature * out_features) random nodes get
+        Gaussian noise scaled by temperature added to their weights and bias.
+
+        Args:
+            parent_slots (Tensor): The slots of the parents, one per child.
+            child_slots (Tensor): The slots to write the children to. They may overlap the parents.
+            temperature (float): Controls the number of mutated nodes and the magnitude of the noise.
+            generator (torch.Generator, optional): Random number generator, to make the mutation reproducible.
+        """
+        for weight_name, bias_name in self.layers:
+            weights = self.parameters[weight_name][parent_slots]
+            biases = self.parameters[bias_name][parent_slots]
+
+            # Pick the mutated nodes of every child with a random ranking of its nodes
+            num_children, out_features = biases.shape
+            num_nodes_to_mutate = max(1, int(temperature * out_features))
+            mask = torch.rand(num_children, out_features, generator=generator).argsort(dim=1) < num_nodes_to_mutate
+            child_indices, node_indices = mask.nonzero(as_tuple=True)
+
+            # Only draw noise for the mutated nodes
+            weights[child_indices, node_indices] += torch.randn(len(child_indices), weights.shape[2], generator=generator) * temperature
+            biases[child_indices, node_indices] += torch.randn(len(child_indices), generator=generator) * temperature
+            self.parameters[weight_name][child_slots] = weights
+            self.parameters[bias_name][child_slots] = biases
+        self._invalidate(child_slots)
+
+    @torch.no_grad()
+    def breed(self, parent1_slots: Tensor, parent2_slots: Tensor, child_slots: Tensor, crossover: str = "average", generator: torch.Generator = None):
+        """Write children of pairs of parents into child slots, like model.breed_models in bulk.
+
+        Args:
+            parent1_slots (Tensor): The slots of the first parents, one per child.
+            parent2_slots (Tensor): The slots of the second parents, one per child.
+            child_slots (Tensor): The slots to write the children to. They may overlap the parents.
+            crossover (str): How the parents are combined, see model.breed_models.
+            generator (torch.Generator, optional): Random number generator, to make the crossover reproducible.
+        """
+        # Every child is made before any slot is overwritten, so children never read a sibling
+        children = self._crossover(parent1_slots, parent2_slots, crossover, generator)
+        for name, stack in self.parameters.items():
+            stack[child_slots] = children[name]
+        self._invalidate(child_slots)
+
+    def _crossover(self, parent1_slots: Tensor, parent2_slots: Tensor, crossover: str, generator: torch.Generator = None) -> dict[str, Tensor]:
+        """Get the [K, ...] parameters of the children of K pairs of parents, see breed."""
+        if crossover not in CROSSOVER_MODES:
+            raise ValueError(f"Unknown crossover mode: {crossover}. Expected one of {CROSSOVER_MODES}.")
+
+        children = {}
+        for weight_name, bias_name in self.layers:
+            # Indexing with the slots gathers copies, the children are written over the first parents
+            weights = self.parameters[weight_name][parent1_slots]
+            biases = self.parameters[bias_name][parent1_slots]
+            other_weights = self.parameters[weight_name][parent2_slots]
+            other_biases = self.parameters[bias_name][parent2_slots]
+            children[weight_name] = weights
+            children[bias_name] = biases
+
+            if crossover == "average":
+                weights.add_(other_weights).div_(2)
+                biases.add_(other_biases).div_(2)
+                continue
+
+            # Masks are True where a child takes the weight of its first parent
+            num_children, out_features = biases.shape
+            if crossover == "uniform":
+                weight_mask = torch.rand(weights.shape, generator=generator) < 0.5
+                bias_mask = torch.rand(biases.shape, generator=generator) < 0.5
+            elif crossover == "layer":
+                take_first = torch.rand(num_children, 1, generator=generator) < 0.5
+                bias_mask = take_first.expand(num_children, out_features)
+                weight_mask = take_first.unsqueeze(2).expand(weights.shape)
+            else:
+                bias_mask = torch.rand(num_children, out_features, generator=generator) < 0.5
+                weight_mask = bias_mask.unsqueeze(2).expand(weights.shape)
+
+            torch.where(weight_mask, weights, other_weights, out=weights)
+            torch.where(bias_mask, biases, other_biases, out=biases)
+        return children
+
+    @torch.no_grad()
+    def advance(self, survivor_slots: list[int], mutation_parents: list[int], breeding_parents: list[tuple[int, int]],
+                temperature: float, crossover: str = "average", generator: torch.Generator = None):
+        """Replace the population by the next generation, built from the slots of the current one.
+
+        The next generation holds the survivors, then one mutated child per mutation parent,
+        then one bred child per pair of breeding parents, in that order. Its names, scores,
+        levels and metadata are reset and must be filled in by the caller. Survivors keep their
+        evaluation cache, and models handed out before keep the weights of the previous generation.
+
+        Args:
+            survivor_slots (list[int]): The slots of the models that survive unchanged.
+            mutation_parents (list[int]): The slot of the parent of every mutated child.
+            breeding_parents (list[tuple[int, int]]): The slots of the parents of every bred child.
+            temperature (float): The mutation temperature, see mutate.
+            crossover (str): How bred children combine the weights of their parents, see model.breed_models.
+            generator (torch.Generator, optional): Random number generator, to make the children reproducible.
+        """
+        # Bred children read both parents, so they are made before the current generation is replaced
+        if breeding_parents:
+            parent1_slots, parent2_slots = torch.tensor(breeding_parents, dtype=torch.long).unbind(1)
+            bred_children = self._crossover(parent1_slots, parent2_slots, crossover, generator)
+        survivors = [self._views.get(slot) for slot in survivor_slots]
+
+        # One gather per parameter copies the survivors and the mutation parents, then the bred children are appended
+        sources = torch.tensor(survivor_slots + mutation_parents, dtype=torch.long)
+        if breeding_parents:
+            self.parameters = {name: torch.cat([stack[sources], bred_children[name]]) for name, stack in self.parameters.items()}
+        else:
+            self.parameters = {name: stack[sources] for name, stack in self.parameters.items()}
+        self.size = len(sources) + len(breeding_parents)
+        self.names = [f"model{slot + 1}" for slot in range(self.size)]
+        self.scores = [0.0] * self.size
+        self.levels = [0] * self.size
+        self.metadata = [{} for _ in range(self.size)]
+        self._views = {}
+        self._slots = {}
+
+        if mutation_parents:
+            mutation_slots = torch.arange(len(survivor_slots), len(sources))
+            self.mutate(mutation_slots, mutation_slots, temperature, generator)
+
+        for slot, survivor in enumerate(survivors):
+            if survivor is not None:
+                self.model(slot).eval_cache = survivor.eval_cache
+
+    def memory_bytes(self) -> int:
+        """Get the memory taken by the weights of the whole population, in bytes."""
+        return sum(stack.element_size() * stack.nelement() for stack in self.parameters.values())
+
+    def save(self, file_path: str):
+        """Save the whole population to a single file."""
+        torch.save({
+            "architecture": (self.input_size, self.hidden_sizes, self.output_size),
+            "feature_set": self.feature_set.name if self.feature_set is not None else None,
+            "sparse_input": self.sparse_input,
+            "parameters": self.parameters,
+            "names": self.names,
+            "scores": self.scores,
+            "levels": self.levels,
+            "metadata": self.metadata,
+        }, file_path)
+
+    @staticmethod
+    def load(file_path: str) -> "PopulationStore":
+        """Load a population saved with save."""
+        state = torch.load(file_path)
+        input_size, hidden_sizes, output_size = state["architecture"]
+        feature_set = get_feature_set_from_name(state["feature_set"]) if state["feature_set"] is not None else None
+        store = PopulationStore(input_size, hidden_sizes, output_size, len(state["names"]), feature_set, state["sparse_input"])
+        store.parameters = state["parameters"]
+        store.names = state["names"]
+        store.scores = state["scores"]
+        store.levels = state["levels"]
+        store.metadata = state["metadata"]
+        return store
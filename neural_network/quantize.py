@@ -0,0 +1,220 @@
+from dataclasses import dataclass
+import math
+import struct
+from typing import BinaryIO
+
+import numpy as np
+import torch
+from torch import nn
+
+from neural_network.features.halfkp import Features as HalfKPFeatures
+from neural_network.serialize import VERSION, DEFAULT_DESCRIPTION, export_layers
+
+# Hashes of the Stockfish layer types, combined into the network hash like the engine does
+INPUT_SLICE_HASH = 0xEC42E90D
+AFFINE_TRANSFORM_HASH = 0xCC03DAE4
+CLIPPED_RELU_HASH = 0x538D24C7
+
+# Stockfish pads the inputs of every affine transform to a multiple of this size
+AFFINE_INPUT_PADDING = 32
+
+# Input features of the feature transformer quantized and written at a time
+FEATURE_CHUNK_SIZE = 4096
+
+
+# Fixed-point scales of the exported network, as in the nnue-pytorch trainer
+@dataclass
+class QuantizationConfig:
+    ft_quantized_one: float = 127.0  # feature transformer scale, its clipped activations span [0, ft_quantized_one]
+    hidden_quantized_one: float = 127.0  # hidden activations span [0, hidden_quantized_one]
+    weight_scale_hidden: float = 64.0  # int8 weight scale of the hidden layers, a power of two so it is a shift
+    weight_scale_out: float = 16.0  # int8 weight scale of the output layer
+    nnue2score: float = 600.0  # centipawns per unit of network output
+    hidden_weight_scales: list[float] = None  # per hidden layer weight scales, overriding weight_scale_hidden
+    activation_ranges: list[float] = None  # float activation of every ReLU mapped to the top of the clipped range, 1.0 when None
+
+    def __post_init__(self):
+        for scale in self.hidden_weight_scales or [self.weight_scale_hidden]:
+            if scale <= 0 or not math.log2(scale).is_integer():
+                raise ValueError(f"Hidden weight scales must be powers of two, got {scale}.")
+        for activation_range in self.activation_ranges or []:
+            if activation_range <= 0:
+                raise ValueError(f"Activation ranges must be positive, got {activation_range}.")
+
+    def layer_scales(self, num_layers: int) -> list[tuple[float, float]]:
+        """Get the weight and bias scale of every linear layer, feature transformer first.
+
+        Args:
+            num_layers (int): The number of linear layers, including the feature transformer and output layer.
+
+        Returns:
+            list[tuple[float, float]]: The factor applied to the weights and to the biases of each layer.
+        """
+        hidden_scales = self.hidden_weight_scales or [self.weight_scale_hidden] * (num_layers - 2)
+        if len(hidden_scales) != num_layers - 2:
+            raise ValueError(f"Expected {num_layers - 2} hidden weight scales, got {len(hidden_scales)}.")
+
+        scales = [(self.ft_quantized_one, self.ft_quantized_one)]
+        scales += [(scale, scale * self.hidden_quantized_one) for scale in hidden_scales]
+        output_scale = self.nnue2score * self.weight_scale_out
+        scales.append((output_scale / self.hidden_quantized_one, output_scale))
+        return scales
+
+
+def _linear_layers(model) -> list[nn.Linear]:
+    return [layer for layer in model.model if isinstance(layer, nn.Linear)]
+
+
+@torch.no_grad()
+def calibrate_activation_ranges(model, inputs: torch.Tensor, percentile: float = 0.999) -> list[float]:
+    """Measure the activation range of every ReLU of a model, for QuantizationConfig.activation_ranges.
+
+    Stockfish clips activations to [0, 1]. Networks trained with a plain ReLU go well past
+    that, so their quantized evaluations differ from the float ones. Rescaling a layer's
+    outputs by 1 / r and the next layer's weights by r leaves a ReLU network unchanged, and
+    brings activations up to r into the clipped range.
+
+    Args:
+        model (NNUEModel): The model to calibrate.
+        inputs (torch.Tensor): A [N, input_size] batch of typical network inputs.
+        percentile (float): The fraction of the activations of a layer that must not be clipped.
+
+    Returns:
+        list[float]: The activation range of every hidden layer.
+    """
+    ranges = []
+    x = inputs
+    for layer in _linear_layers(model)[:-1]:
+        x = torch.relu(layer(x))
+        ranges.append(max(float(torch.quantile(x.flatten().double(), percentile)), 1e-3))
+    return ranges
+
+
+def _scaled_layers(model, config: QuantizationConfig, coalesce_factors: bool) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Get the float weight and bias of every linear layer, with the activation ranges of the config folded in."""
+    layers = [(weight.cpu().numpy(), bias.cpu().numpy()) for weight, bias in export_layers(model, coalesce_factors)]
+    if config.activation_ranges is None:
+        return layers
+    if len(config.activation_ranges) != len(layers) - 1:
+        raise ValueError(f"Expected {len(layers) - 1} activation ranges, got {len(config.activation_ranges)}.")
+
+    for i, activation_range in enumerate(config.activation_ranges):
+        weight, bias = layers[i]
+        layers[i] = (weight / activation_range, bias / activation_range)
+        layers[i + 1] = (layers[i + 1][0] * activation_range, layers[i + 1][1])
+    return layers
+
+
+def _quantize(array: np.ndarray, scale: float, dtype: type) -> np.ndarray:
+    limits = np.iinfo(dtype)
+    # int8 weights stay symmetric like in Stockfish, -128 is never used
+    low = -limits.max if dtype == np.int8 else limits.min
+    return np.clip(np.rint(array * scale), low, limits.max).astype(dtype)
+
+
+def quantize_model(model, config: QuantizationConfig = None, coalesce_factors: bool = False) -> list[tuple[np.ndarray, np.ndarray]]:
+    """Convert the weights of a model to the integer types of a Stockfish network.
+
+    The feature transformer gets int16 weights and biases, the other layers int8 weights
+    and int32 biases. Weights that do not fit their type are clipped. The activation ranges
+    of the config are folded into the weights first, see calibrate_activation_ranges.
+
+    Args:
+        model (NNUEModel): The model to quantize.
+        config (QuantizationConfig, optional): The scales of the layers. Defaults to the Stockfish scales.
+        coalesce_factors (bool): Fold the virtual features into the real ones first, see export_layers.
+
+    Returns:
+        list[tuple[np.ndarray, np.ndarray]]: The weight [out, in] and bias [out] of every linear layer.
+    """
+    config = config or QuantizationConfig()
+    layers = _scaled_layers(model, config, coalesce_factors)
+    quantized = []
+    for index, ((weight, bias), (weight_scale, bias_scale)) in enumerate(zip(layers, config.layer_scales(len(layers)))):
+        if index == 0:
+            quantized.append((_quantize(weight, weight_scale, np.int16), _quantize(bias, bias_scale, np.int16)))
+        else:
+            quantized.append((_quantize(weight, weight_scale, np.int8), _quantize(bias, bias_scale, np.int32)))
+    return quantized
+
+
+def feature_transformer_hash(model) -> int:
+    """Get the hash of the feature transformer: the feature set hash and its output size.
+
+    This is how Stockfish hashes its feature transformer, but the layouts differ. Stockfish
+    has two perspectives of out / 2 outputs, side to move first, while these networks have
+    a single perspective of out outputs. So a file with the hash of a Stockfish network
+    still holds twice as many feature transformer outputs as Stockfish reads.
+    """
+    features_hash = model.feature_set.hash if model.feature_set is not None else HalfKPFeatures().hash
+    return features_hash ^ _linear_layers(model)[0].out_features
+
+
+def network_hash(model) -> int:
+    """Get the hash of the layers after the feature transformer, computed like Stockfish does."""
+    layers = _linear_layers(model)[1:]
+    previous_hash = INPUT_SLICE_HASH ^ layers[0].in_features
+    for layer in layers:
+        layer_hash = (AFFINE_TRANSFORM_HASH + layer.out_features) & 0xFFFFFFFF
+        layer_hash ^= previous_hash >> 1
+        layer_hash ^= (previous_hash << 31) & 0xFFFFFFFF
+        if layer is not layers[-1]:
+            layer_hash = (layer_hash + CLIPPED_RELU_HASH) & 0xFFFFFFFF
+        previous_hash = layer_hash
+    return previous_hash
+
+
+class QuantizedNNUEWriter:
+    """
+    Serialize NNUE models into quantized .nnue files, with the integer types of Stockfish.
+
+    The file holds the version, the network hash and the description, then the feature
+    transformer hash, int16 biases and int16 weights stored feature by feature, then the
+    network hash and, for every following layer, its int32 biases and int8 weights with
+    the inputs padded to a multiple of 32. The weights are quantized and written piece by
+    piece, so the whole file is never held in memory. The virtual features of a factorized
+    feature set are folded into the real ones.
+
+    The feature transformer has a single perspective, so Stockfish cannot load these
+    files, see feature_transformer_hash.
+    """
+
+    def __init__(self, model, config: QuantizationConfig = None, description: str = DEFAULT_DESCRIPTION):
+        self.model = model
+        self.config = config or QuantizationConfig()
+        self.description = description
+
+    def write(self, file_path: str):
+        """Write the quantized model to a file."""
+        with open(file_path, "wb") as f:
+            self.serialize(f)
+
+    def serialize(self, stream: BinaryIO):
+        """Write the quantized model to a binary stream."""
+        ft_hash = feature_transformer_hash(self.model)
+        fc_hash = network_hash(self.model)
+        layers = _scaled_layers(self.model, self.config, coalesce_factors=True)
+        scales = self.config.layer_scales(len(layers))
+
+        description = self.description.encode("utf-8")
+        stream.write(struct.pack("<III", VERSION, ft_hash ^ fc_hash, len(description)))
+        stream.write(description)
+
+        stream.write(struct.pack("<I", ft_hash))
+        weight_scale, bias_scale = scales[0]
+        stream.write(_quantize(layers[0][1], bias_scale, np.int16).astype("<i2").tobytes())
+        # One row of weights per input feature, a chunk of features at a time
+        ft_weight = layers[0][0].T
+        for start in range(0, len(ft_weight), FEATURE_CHUNK_SIZE):
+            chunk = ft_weight[start:start + FEATURE_CHUNK_SIZE]
+            stream.write(_quantize(chunk, weight_scale, np.int16).astype("<i2").tobytes())
+
+        stream.write(struct.pack("<I", fc_hash))
+        for (weight, bias), (weight_scale, bias_scale) in zip(layers[1:], scales[1:]):
+            stream.write(_quantize(bias, bias_scale, np.int32).astype("<i4").tobytes())
+            weight = _quantize(weight, weight_scale, np.int8)
+            out_features, in_features = weight.shape
+            padded_inputs = -(-in_features // AFFINE_INPUT_PADDING) * AFFINE_INPUT_PADDING
+            padded = np.zeros((out_features, padded_inputs), dtype=np.int8)
+            padded[:, :in_features] = weight
+            stream.write(padded.tobytes())
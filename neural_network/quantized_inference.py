@@ -0,0 +1,201 @@
+import math
+import random
+
+import chess
+import numpy as np
+from numba import njit
+import torch
+from torch import nn
+
+from neural_network.accumulator import Accumulator
+from neural_network.quantize import QuantizationConfig, quantize_model
+
+# Positions played out at random from the start position to calibrate activation ranges
+CALIBRATION_POSITIONS = 256
+CALIBRATION_MAX_PLIES = 80
+
+# Integers up to this magnitude are exact in float32
+FLOAT32_EXACT_LIMIT = 2 ** 24
+
+
+@njit(cache=True)
+def _accumulate(features, weight_rows, bias):
+    # First-layer sums, adding the weight row of every non-zero feature like Stockfish's feature transformer
+    sums = np.empty((features.shape[0], weight_rows.shape[1]), dtype=np.int32)
+    for row in range(features.shape[0]):
+        sums[row] = bias
+        for feature in range(features.shape[1]):
+            value = features[row, feature]
+            if value != 0:
+                for out in range(weight_rows.shape[1]):
+                    sums[row, out] += value * weight_rows[feature, out]
+    return sums
+
+
+@njit(cache=True)
+def _affine(inputs, weight, bias):
+    # int32 dot products of uint8 activations with int8 weights, like Stockfish's AffineTransform
+    outputs = np.empty((inputs.shape[0], weight.shape[0]), dtype=np.int32)
+    for row in range(inputs.shape[0]):
+        for out in range(weight.shape[0]):
+            total = np.int32(bias[out])
+            for i in range(weight.shape[1]):
+                total += np.int32(weight[out, i]) * np.int32(inputs[row, i])
+            outputs[row, out] = total
+    return outputs
+
+
+@njit(cache=True)
+def _clipped_relu(values, shift, clip):
+    # Scales the int32 outputs back down to activations and clamps them, like Stockfish's ClippedReLU
+    activations = np.empty(values.shape, dtype=np.uint8)
+    for row in range(values.shape[0]):
+        for i in range(values.shape[1]):
+            activations[row, i] = min(max(values[row, i] >> shift, 0), clip)
+    return activations
+
+
+class QuantizedNetwork:
+    """Integer inference of an NNUEModel, mirroring the arithmetic of Stockfish.
+
+    The model is quantized with quantize_model. The first layer accumulates int16 weights
+    into int32 sums, which are clamped to [0, ft_quantized_one]. Every hidden layer takes
+    uint8 activations and int8 weights into int32 sums, shifted right by the log2 of its
+    weight scale and clamped to [0, hidden_quantized_one]. The activations are clipped, so
+    the results follow the exported network rather than the ReLU of the float model, unless
+    the config has activation ranges covering the float activations.
+
+    Hidden layers whose int32 sums cannot exceed the float32 mantissa are multiplied with
+    float32 BLAS, which gives the same integers as the int32 kernel much faster.
+    """
+
+    def __init__(self, model, config: QuantizationConfig = None):
+        self.config = config or QuantizationConfig()
+        layers = quantize_model(model, self.config)
+        scales = self.config.layer_scales(len(layers))
+
+        # int32 first layer, so that the accumulated sums cannot overflow
+        self.ft_weight = torch.from_numpy(layers[0][0].astype(np.int32))
+        self.ft_bias = torch.from_numpy(layers[0][1].astype(np.int32))
+        self.ft_weight_rows = np.ascontiguousarray(self.ft_weight.numpy().T)
+        self.hidden_layers = [
+            (self._affine_weight(weight), bias, int(math.log2(weight_scale)))
+            for (weight, bias), (weight_scale, _) in zip(layers[1:-1], scales[1:-1])
+        ]
+        self.output_weight = self._affine_weight(layers[-1][0])
+        self.output_bias = layers[-1][1]
+        self.output_scale = self.config.nnue2score * self.config.weight_scale_out
+
+    def _affine_weight(self, weight: np.ndarray) -> np.ndarray:
+        """Get the weights of a layer as float32 when every sum of its products fits in the float32 mantissa."""
+        largest_input = max(self.config.ft_quantized_one, self.config.hidden_quantized_one)
+        if np.abs(weight.astype(np.int64)).sum(axis=1).max() * largest_input < FLOAT32_EXACT_LIMIT:
+            return np.ascontiguousarray(weight.T, dtype=np.float32)
+        return np.ascontiguousarray(weight)
+
+    @staticmethod
+    def _affine_transform(activations: np.ndarray, weight: np.ndarray, bias: np.ndarray) -> np.ndarray:
+        if weight.dtype == np.float32:
+            return (activations.astype(np.float32) @ weight).astype(np.int32) + bias
+        return _affine(activations, weight, bias)
+
+    def create_accumulator(self, board: chess.Board) -> Accumulator:
+        """Create an accumulator of the int32 first-layer sums of the board."""
+        return Accumulator(self.ft_weight, self.ft_bias, board)
+
+    def accumulate(self, features: np.ndarray) -> np.ndarray:
+        """Compute the first-layer sums of a [N, input_size] matrix of integer features."""
+        return _accumulate(np.asarray(features, dtype=np.int32), self.ft_weight_rows, self.ft_bias.numpy())
+
+    def propagate(self, accumulated: np.ndarray) -> np.ndarray:
+        """Evaluate positions from their [N, hidden] first-layer sums.
+
+        Returns:
+            np.ndarray: The [N] evaluations in the units of the float model's output.
+        """
+        activations = np.clip(accumulated, 0, int(self.config.ft_quantized_one)).astype(np.uint8)
+        clip = int(self.config.hidden_quantized_one)
+        for weight, bias, shift in self.hidden_layers:
+            activations = _clipped_relu(self._affine_transform(activations, weight, bias), shift, clip)
+        return self._affine_transform(activations, self.output_weight, self.output_bias)[:, 0] / self.output_scale
+
+    def evaluate(self, features: np.ndarray) -> np.ndarray:
+        """Evaluate a [N, input_size] matrix of integer features, one row per position."""
+        return self.propagate(self.accumulate(features))
+
+
+def calibration_positions(count: int = CALIBRATION_POSITIONS, max_plies: int = CALIBRATION_MAX_PLIES, seed: int = 0) -> list[chess.Board]:
+    """Get positions reached by random play, to calibrate the activation ranges of quantized networks."""
+    rng = random.Random(seed)
+    boards = []
+    while len(boards) < count:
+        board = chess.Board()
+        for _ in range(rng.randint(0, max_plies)):
+            legal_moves = list(board.legal_moves)
+            if not legal_moves:
+                break
+            board.push(rng.choice(legal_moves))
+        boards.append(board)
+    return boards
+
+
+def clipped_float_forward(model, inputs: torch.Tensor, config: QuantizationConfig = None) -> torch.Tensor:
+    """Evaluate a model in float with the activations clipped like the quantized network.
+
+    The activations are clipped to [0, 1], or to the activation ranges of the config.
+    Comparing with this reference isolates the rounding error of the quantization from the
+    difference between ReLU and clipped ReLU.
+    """
+    layers = [layer for layer in model.model if isinstance(layer, nn.Linear)]
+    activation_ranges = config.activation_ranges if config is not None and config.activation_ranges else [1.0] * (len(layers) - 1)
+    for layer, activation_range in zip(layers[:-1], activation_ranges):
+        inputs = torch.clamp(layer(inputs), 0.0, activation_range)
+    return layers[-1](inputs)
+
+
+def accuracy_report(model, boards: list[chess.Board], board_to_features, config: QuantizationConfig = None) -> dict:
+    """Compare the quantized evaluations of a model with its float evaluations.
+
+    Args:
+        model (NNUEModel): The model to compare.
+        boards (list[chess.Board]): The positions to evaluate. Positions with legal moves are
+            also used to compare the moves picked by both backends.
+        board_to_features (Callable): Converts a board into its list of input features.
+        config (QuantizationConfig, optional): The scales of the quantized network.
+
+    Returns:
+        dict: The mean and max absolute error in centipawns and the correlation of the
+            evaluations, against the float model and against its clipped float reference
+            (see clipped_float_forward), and the fraction of positions where the float model
+            and the quantized backend pick the same move.
+    """
+    network = QuantizedNetwork(model, config)
+    features = np.array([board_to_features(board) for board in boards], dtype=np.float32)
+    with torch.no_grad():
+        float_scores = model.model(torch.from_numpy(features)).view(-1).double().numpy()
+        clipped_scores = clipped_float_forward(model, torch.from_numpy(features), network.config).view(-1).double().numpy()
+    quantized_scores = network.evaluate(features)
+
+    report = {"positions": len(boards)}
+    for name, reference in (("float", float_scores), ("clipped_float", clipped_scores)):
+        errors = np.abs(quantized_scores - reference) * network.config.nnue2score
+        report[f"mean_abs_error_cp_vs_{name}"] = float(errors.mean())
+        report[f"max_abs_error_cp_vs_{name}"] = float(errors.max())
+        report[f"correlation_vs_{name}"] = float(np.corrcoef(reference, quantized_scores)[0, 1])
+
+    same_moves = 0
+    positions_with_moves = 0
+    for board in boards:
+        legal_moves = list(board.legal_moves)
+        if not legal_moves:
+            continue
+        positions_with_moves += 1
+        float_children = Accumulator.from_layer(model.model[0], board).children(board, legal_moves)
+        with torch.no_grad():
+            float_best = int(torch.argmax(model.model[1:](float_children)))
+        quantized_children = network.create_accumulator(board).children(board, legal_moves)
+        quantized_best = int(np.argmax(network.propagate(quantized_children.numpy())))
+        same_moves += float_best == quantized_best
+
+    report["same_move_rate"] = same_moves / positions_with_moves if positions_with_moves else 1.0
+    return report
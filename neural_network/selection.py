@@ -0,0 +1,145 @@
+from dataclasses import dataclass
+
+import torch
+from torch import Tensor
+
+# Selection operators available to create_new_generation
+SELECTION_METHODS = ("softmax", "tournament", "rank")
+
+
+# How parents and survivors are picked from a population
+@dataclass
+class SelectionConfig:
+    method: str = "softmax"  # one of SELECTION_METHODS
+    temperature: float = 1.0  # softmax temperature in score points, higher is more uniform
+    tournament_size: int = 3  # contestants per tournament, higher is greedier
+
+
+def gumbel_top_k(log_weights: Tensor, k: int, generator: torch.Generator = None) -> Tensor:
+    """Sample k distinct indices with probabilities proportional to exp(log_weights).
+
+    Adding Gumbel noise to the log-weights and keeping the k largest keys draws k items
+    without replacement from the softmax of the log-weights. No exponential is taken, so
+    large scores cannot overflow.
+
+    Args:
+        log_weights (Tensor): The unnormalized log-probability of every item.
+        k (int): The number of items to draw. Clamped to the number of items.
+        generator (torch.Generator, optional): Random number generator, to make the draw reproducible.
+
+    Returns:
+        Tensor: The indices of the drawn items, in draw order.
+    """
+    uniform = torch.rand(log_weights.shape, generator=generator, dtype=torch.float64)
+    gumbel = -torch.log(-torch.log(uniform.clamp_(min=torch.finfo(torch.float64).tiny)))
+    return torch.topk(log_weights.double() + gumbel, min(k, len(log_weights))).indices
+
+
+def _scores(population: list) -> Tensor:
+    return torch.tensor([model.score for model in population], dtype=torch.float64)
+
+
+def softmax_select(population: list, num_to_select: int, temperature: float = 1.0, generator: torch.Generator = None) -> list:
+    """Select distinct models with probabilities given by the softmax of their scores.
+
+    Args:
+        population (list[PopulationModel]): The population of models to select from. It is left unchanged.
+        num_to_select (int): The number of models to select.
+        temperature (float): Divides the scores before the softmax. Higher values make the selection more uniform.
+        generator (torch.Generator, optional): Random number generator, to make the selection reproducible.
+
+    Returns:
+        list[PopulationModel]: The selected models.
+    """
+    if not population:
+        return []
+    indices = gumbel_top_k(_scores(population) / temperature, num_to_select, generator)
+    return [population[i] for i in indices.tolist()]
+
+
+def rank_select(population: list, num_to_select: int, generator: torch.Generator = None) -> list:
+    """Select distinct models with probabilities proportional to their rank.
+
+    The worst model has weight 1 and the best weight len(population), so the selection
+    pressure does not depend on how far apart the scores are.
+
+    Args:
+        population (list[PopulationModel]): The population of models to select from. It is left unchanged.
+        num_to_select (int): The number of models to select.
+        generator (torch.Generator, optional): Random number generator, to make the selection reproducible.
+
+    Returns:
+        list[PopulationModel]: The selected models.
+    """
+    if not population:
+        return []
+    ranks = torch.empty(len(population), dtype=torch.float64)
+    ranks[torch.argsort(_scores(population), stable=True)] = torch.arange(1, len(population) + 1, dtype=torch.float64)
+    indices = gumbel_top_k(torch.log(ranks), num_to_select, generator)
+    return [population[i] for i in indices.tolist()]
+
+
+def tournament_select(population: list, num_to_select: int, tournament_size: int = 3, generator: torch.Generator = None) -> list:
+    """Select distinct models as the winners of random tournaments.
+
+    Every round holds one tournament per missing model among the models not selected yet.
+    Contestants are drawn uniformly with replacement and the best score wins. Winners of
+    several tournaments in the same round are selected once.
+
+    Args:
+        population (list[PopulationModel]): The population of models to select from. It is left unchanged.
+        num_to_select (int): The number of models to select.
+        tournament_size (int): The number of contestants per tournament.
+        generator (torch.Generator, optional): Random number generator, to make the selection reproducible.
+
+    Returns:
+        list[PopulationModel]: The selected models.
+    """
+    num_to_select = min(num_to_select, len(population))
+    scores = _scores(population)
+    available = torch.arange(len(population))
+    selected = []
+
+    while len(selected) < num_to_select:
+        missing = num_to_select - len(selected)
+        contestants = available[torch.randint(len(available), (missing, tournament_size), generator=generator)]
+        winners = contestants.gather(1, scores[contestants].argmax(dim=1, keepdim=True)).view(-1)
+
+        # Keep the first win of every model, in tournament order
+        selected.extend(_unique_in_order(winners).tolist())
+
+        is_available = torch.ones(len(population), dtype=torch.bool)
+        is_available[torch.tensor(selected)] = False
+        available = torch.nonzero(is_available).view(-1)
+
+    return [population[i] for i in selected]
+
+
+def _unique_in_order(values: Tensor) -> Tensor:
+    unique, inverse = torch.unique(values, return_inverse=True)
+    first_positions = torch.full((len(unique),), len(values), dtype=torch.long).scatter_reduce_(
+        0, inverse, torch.arange(len(values)), reduce="amin"
+    )
+    return unique[torch.argsort(first_positions)]
+
+
+def select(population: list, num_to_select: int, config: SelectionConfig = None, generator: torch.Generator = None) -> list:
+    """Select distinct models with the operator chosen in the selection config.
+
+    Args:
+        population (list[PopulationModel]): The population of models to select from. It is left unchanged.
+        num_to_select (int): The number of models to select.
+        config (SelectionConfig, optional): The selection operator and its parameters. Defaults to softmax selection.
+        generator (torch.Generator, optional): Random number generator, to make the selection reproducible.
+
+    Returns:
+        list[PopulationModel]: The selected models.
+    """
+    config = config or SelectionConfig()
+    if config.method == "softmax":
+        return softmax_select(population, num_to_select, config.temperature, generator)
+    if config.method == "rank":
+        return rank_select(population, num_to_select, generator)
+    if config.method == "tournament":
+        return tournament_select(population, num_to_select, config.tournament_size, generator)
+    raise ValueError(f"Unknown selection method: {config.method}. Expected one of {SELECTION_METHODS}.")
@@ -1,6 +1,9 @@
 from functools import reduce
+import mmap
 import operator
+import os
 import struct
+import zlib
 from typing import BinaryIO, Sequence
 
 import numpy as np
@@ -14,83 +17,219 @@ from neural_network.features.feature_set import FeatureSet
 VERSION = 0x7AF32F20
 DEFAULT_DESCRIPTION = "Network trained with the https://github.com/official-stockfish/nnue-pytorch trainer."
 
+# The tensors start at a multiple of this offset, so they can be viewed in place once the file is mapped
+TENSOR_ALIGNMENT = 64
+
+
+def layout_hash(layout: Sequence[tuple[int, int]]) -> int:
+    """Get the hash identifying a layer layout, stored in the header like Stockfish's network hash.
+
+    Args:
+        layout (Sequence[tuple[int, int]]): The output and input size of every linear layer.
+    """
+    return zlib.crc32(struct.pack(f"<{2 * len(layout)}I", *(size for layer in layout for size in layer)))
+
+
+def _aligned(offset: int) -> int:
+    return -(-offset // TENSOR_ALIGNMENT) * TENSOR_ALIGNMENT
+
+
+def export_layers(model, coalesce_factors: bool = False) -> list[tuple[torch.Tensor, torch.Tensor]]:
+    """Get the weight and bias of every linear layer of a model, as they are exported.
+
+    Args:
+        model (NNUEModel): The model to export.
+        coalesce_factors (bool): Fold the weights of the virtual features of a factorized
+            feature set into the real features, see FeatureSet.coalesce_ft_weights. The first
+            layer then only takes the real features, like the networks Stockfish loads.
+
+    Returns:
+        list[tuple[torch.Tensor, torch.Tensor]]: The weight [out, in] and bias [out] of every linear layer.
+    """
+    layers = [(layer.weight.detach(), layer.bias.detach()) for layer in model.model if isinstance(layer, nn.Linear)]
+    feature_set: FeatureSet = model.feature_set
+    if coalesce_factors and feature_set is not None and feature_set.num_virtual_features > 0 and layers[0][0].shape[1] == feature_set.num_features:
+        layers[0] = (feature_set.coalesce_ft_weights(layers[0][0]), layers[0][1])
+    return layers
+
+
+def layers_from_state_dict(state_dict: dict[str, torch.Tensor]) -> list[tuple[torch.Tensor, torch.Tensor]]:
+    """Get the weight and bias of every linear layer from the state_dict of an NNUEModel.
+
+    Every weight in the state_dict is followed by the bias of the same layer, in the order
+    of the layers, so this matches export_layers without coalescing.
+    """
+    tensors = list(state_dict.values())
+    return list(zip(tensors[0::2], tensors[1::2]))
+
+
+def serialize_state_dict(state_dict: dict[str, torch.Tensor], description: str = DEFAULT_DESCRIPTION) -> bytearray:
+    """Get the content of the .nnue file of a model from its state_dict.
+
+    This lets a snapshot of the weights be serialized on another thread while the model
+    itself keeps changing.
+    """
+    writer = NNUEWriter(None, description)
+    writer.serialize_layers(layers_from_state_dict(state_dict))
+    return writer.buffer
+
+
 class NNUEWriter:
     """
     Serialize NNUE models into Stockfish-compatible .nnue format.
+
+    The file holds the version, the hash of the layer layout, the description, the output
+    and input size of every linear layer, then every weight and bias as little-endian
+    float32 starting at an aligned offset. With coalesce_factors, the virtual features of a
+    factorized feature set are folded into the real ones, see export_layers.
     """
 
-    def __init__(self, model, description: str = DEFAULT_DESCRIPTION):
+    def __init__(self, model, description: str = DEFAULT_DESCRIPTION, coalesce_factors: bool = False):
         self.model = model
         self.description = description
+        self.coalesce_factors = coalesce_factors
         self.buffer = bytearray()
+        self.stream = None
+        self.offset = 0
 
     def write(self, file_path: str):
-        """Write the serialized model to a file."""
+        """Serialize the model straight into a file, without building the whole file in memory."""
         with open(file_path, "wb") as f:
-            f.write(self.buffer)
+            self.serialize(f)
+
+    def serialize(self, stream: BinaryIO = None):
+        """Serialize the model into a binary stream, or into the buffer when no stream is given."""
+        self.serialize_layers(export_layers(self.model, self.coalesce_factors), stream)
 
-    def serialize(self):
-        """Serialize the model into the buffer."""
-        self._write_header()
-        self._write_layers()
+    def serialize_layers(self, layers: list[tuple[torch.Tensor, torch.Tensor]], stream: BinaryIO = None):
+        """Serialize exported layers into a binary stream, or into the buffer when no stream is given."""
+        self.stream = stream
+        self.offset = 0
+        self._write_header(layers)
+        self._write_layers(layers)
 
-    def _write_header(self):
+    def _write_header(self, layers: list[tuple[torch.Tensor, torch.Tensor]]):
         """Write the header information."""
+        layout = [tuple(weight.shape) for weight, _ in layers]
         self._write_int32(VERSION)
+        self._write_int32(layout_hash(layout))
         self._write_string(self.description)
+        self._write_int32(len(layout))
+        for out_features, in_features in layout:
+            self._write_int32(out_features)
+            self._write_int32(in_features)
+        self._write_bytes(bytes(_aligned(self.offset) - self.offset))
 
-    def _write_layers(self):
+    def _write_layers(self, layers: list[tuple[torch.Tensor, torch.Tensor]]):
         """Write the layers of the model."""
-        for layer in self.model.model:
-            if isinstance(layer, nn.Linear):
-                self._write_tensor(layer.weight.data)
-                self._write_tensor(layer.bias.data)
+        for weight, bias in layers:
+            self._write_tensor(weight)
+            self._write_tensor(bias)
+
+    def _write_bytes(self, data):
+        if self.stream is not None:
+            self.stream.write(data)
+        else:
+            self.buffer += memoryview(data)
+        self.offset += memoryview(data).nbytes
 
     def _write_int32(self, value: int):
-        self.buffer.extend(struct.pack("<I", value))
+        self._write_bytes(struct.pack("<I", value))
 
     def _write_string(self, value: str):
         encoded = value.encode("utf-8")
         self._write_int32(len(encoded))
-        self.buffer.extend(encoded)
+        self._write_bytes(encoded)
 
     def _write_tensor(self, tensor: torch.Tensor):
-        """Write a tensor to the buffer."""
-        array = tensor.cpu().numpy()
-        self.buffer.extend(array.tobytes())
+        """Write a tensor without copying it when it is already contiguous little-endian float32."""
+        array = np.ascontiguousarray(tensor.detach().cpu().numpy(), dtype="<f4")
+        self._write_bytes(array.reshape(-1).view(np.uint8))
 
 
 class NNUEReader:
     """
     Deserialize Stockfish-compatible .nnue models.
+
+    Files are mapped into memory copy-on-write and the weights are tensors viewing the
+    mapping, so nothing is copied: pages are read from disk when first used, and changing
+    the weights never changes the file.
     """
 
-    def __init__(self, file_path: str):
+    def __init__(self, file_path: str = None, buffer=None):
+        """Read from a file, or from a writable buffer such as a bytearray already in memory."""
         self.file_path = file_path
+        self.buffer = buffer
+        self.offset = 0
+        self.description = None
 
     def read(self):
-        """Read and deserialize the model from a file."""
-        with open(self.file_path, "rb") as f:
-            self.buffer = f.read()
+        """Read and deserialize the model from the file or buffer.
+
+        Raises:
+            ValueError: If the data is not a complete network written by NNUEWriter.
+
+        Returns:
+            NNUEModel: The model, with the weights stored in the file.
+        """
+        if self.buffer is None:
+            with open(self.file_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    raise ValueError(f"Empty network file: {self.file_path}")
+                self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
         return self._deserialize()
 
     def _deserialize(self):
         """Deserialize the model from the buffer."""
-        version = self._read_int32()
-        if version != VERSION:
-            raise ValueError("Unsupported version: {}".format(version))
-        description = self._read_string()
-        print("Model description:", description)
-        # Placeholder: Reconstruct the NNUE model here.
-        return None  # Update this line to reconstruct the model as needed
+        from neural_network.model import NNUEModel
+
+        try:
+            version = self._read_int32()
+            if version != VERSION:
+                raise ValueError("Unsupported version: {}".format(version))
+            stored_hash = self._read_int32()
+            self.description = self._read_string()
+            layout = [(self._read_int32(), self._read_int32()) for _ in range(self._read_int32())]
+        except struct.error as e:
+            raise ValueError("Truncated network header") from e
+
+        if not layout:
+            raise ValueError("The network has no layers")
+        if stored_hash != layout_hash(layout):
+            raise ValueError(f"Network hash mismatch: {stored_hash:#010x} stored, {layout_hash(layout):#010x} for the layer layout")
+        for (previous_out, _), (_, in_features) in zip(layout, layout[1:]):
+            if in_features != previous_out:
+                raise ValueError(f"Layer with {in_features} inputs follows a layer with {previous_out} outputs")
+
+        self.offset = _aligned(self.offset)
+        expected_size = self.offset + 4 * sum(out_features * in_features + out_features for out_features, in_features in layout)
+        if len(self.buffer) != expected_size:
+            raise ValueError(f"Network size mismatch: {len(self.buffer)} bytes, {expected_size} expected for the layer layout")
+
+        # Build on the meta device, the parameters are then replaced by views of the buffer
+        with torch.device("meta"):
+            model = NNUEModel(layout[0][1], [out_features for out_features, _ in layout[:-1]], layout[-1][0])
+        linear_layers = [layer for layer in model.model if isinstance(layer, nn.Linear)]
+        for layer, (out_features, in_features) in zip(linear_layers, layout):
+            layer.weight = nn.Parameter(self._read_tensor((out_features, in_features)))
+            layer.bias = nn.Parameter(self._read_tensor((out_features,)))
+        return model
 
     def _read_int32(self) -> int:
-        value = struct.unpack("<I", self.buffer[:4])[0]
-        self.buffer = self.buffer[4:]
+        value = struct.unpack_from("<I", self.buffer, self.offset)[0]
+        self.offset += 4
         return value
 
     def _read_string(self) -> str:
         length = self._read_int32()
-        value = self.buffer[:length].decode("utf-8")
-        self.buffer = self.buffer[length:]
-        return value
\ No newline at end of file
+        if self.offset + length > len(self.buffer):
+            raise struct.error("string past the end of the buffer")
+        value = bytes(self.buffer[self.offset:self.offset + length]).decode("utf-8")
+        self.offset += length
+        return value
+
+    def _read_tensor(self, shape: tuple[int, ...]) -> torch.Tensor:
+        count = reduce(operator.mul, shape, 1)
+        tensor = torch.frombuffer(self.buffer, dtype=torch.float32, count=count, offset=self.offset)
+        self.offset += 4 * count
+        return tensor.view(shape)
@@ -0,0 +1,76 @@
+import unittest
+
+import chess
+
+from tournaments.adjudication import AdjudicationConfig, Adjudicator
+
+
+def disabled(**rules) -> AdjudicationConfig:
+    """An adjudication config with every rule disabled except the given ones."""
+    return AdjudicationConfig(**{"claim_draw": False, **rules})
+
+
+class TestAdjudicator(unittest.TestCase):
+    def test_checkmate_is_not_adjudicated(self):
+        # Ra8# with a halfmove clock past the no-progress threshold, and Black far behind
+        board = chess.Board("6k1/5ppp/8/8/8/8/8/R5K1 w - - 69 80")
+        board.push_san("Ra8#")
+        config = AdjudicationConfig(max_plies=100, no_progress_plies=60, resign_material=1, resign_plies=1)
+        self.assertIsNone(Adjudicator(config).adjudicate(board))
+        self.assertEqual(board.result(), "1-0")
+
+    def test_checkmated_side_ahead_in_material_does_not_win(self):
+        # Black is two pawns up but mated, the material rule must not give Black the win
+        board = chess.Board("6k1/5ppp/8/8/1pppp3/8/8/R5K1 w - - 0 1")
+        board.push_san("Ra8#")
+        self.assertIsNone(Adjudicator(disabled(resign_material=2, resign_plies=1)).adjudicate(board))
+
+    def test_fifty_move_rule(self):
+        board = chess.Board("4k3/8/8/8/8/8/8/R3K3 w - - 99 80")
+        board.push_san("Ra2")
+        self.assertEqual(Adjudicator(AdjudicationConfig()).adjudicate(board), ("1/2-1/2", "50-move rule"))
+        self.assertIsNone(Adjudicator(disabled()).adjudicate(board))
+
+    def test_threefold_repetition(self):
+        board = chess.Board()
+        for move in ["Nf3", "Nf6", "Ng1", "Ng8"] * 2:
+            board.push_san(move)
+        self.assertEqual(Adjudicator(AdjudicationConfig()).adjudicate(board), ("1/2-1/2", "threefold repetition"))
+
+    def test_move_cap(self):
+        board = chess.Board("4k3/8/8/8/8/8/8/R3K3 w - - 0 50")
+        adjudicator = Adjudicator(disabled(max_plies=99))
+        self.assertIsNone(Adjudicator(disabled(max_plies=100)).adjudicate(board))
+        board.push_san("Ra2")
+        self.assertEqual(adjudicator.adjudicate(board), ("1/2-1/2", "move cap"))
+
+    def test_no_progress(self):
+        board = chess.Board("4k3/8/8/8/8/8/8/R3K3 w - - 58 80")
+        adjudicator = Adjudicator(disabled(no_progress_plies=60))
+        board.push_san("Ra2")
+        self.assertIsNone(adjudicator.adjudicate(board))
+        board.push_san("Kd7")
+        self.assertEqual(adjudicator.adjudicate(board), ("1/2-1/2", "no progress"))
+
+    def test_material_must_hold_for_resign_plies(self):
+        board = chess.Board("4k3/8/8/8/8/8/8/R3K3 b - - 0 1")
+        adjudicator = Adjudicator(disabled(resign_material=5, resign_plies=3))
+        verdicts = []
+        for move in ["Kd7", "Ra2", "Ke8"]:
+            board.push_san(move)
+            verdicts.append(adjudicator.adjudicate(board))
+        self.assertEqual(verdicts, [None, None, ("1-0", "material")])
+
+    def test_engine_score_streak_resets_when_the_sign_changes(self):
+        board = chess.Board()
+        adjudicator = Adjudicator(disabled(resign_score=500, resign_plies=2))
+        self.assertIsNone(adjudicator.adjudicate(board, 600))
+        self.assertIsNone(adjudicator.adjudicate(board, -600))
+        self.assertIsNone(adjudicator.adjudicate(board, 700))
+        # The network's moves come without a score and do not break the streak
+        self.assertIsNone(adjudicator.adjudicate(board, None))
+        self.assertEqual(adjudicator.adjudicate(board, 800), ("1-0", "engine score"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import unittest
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+from unittest import mock
+
+import chess
+import chess.engine
+import torch
+
+from neural_network.model import NNUEModel
+from neural_network.neural_network import PopulationModel
+from tournaments.adjudication import AdjudicationConfig
+from tournaments.async_tournament import AsyncTournamentRunner, run_tournaments_async
+from tournaments.tournament import play_game
+
+
+def first_legal_move(board):
+    return SimpleNamespace(move=next(iter(board.legal_moves)), info={})
+
+
+class FakeEngine:
+    def play(self, board, limit, game=None, info=None):
+        return first_legal_move(board)
+
+
+class FakeAsyncEngine:
+    async def play(self, board, limit, game=None, info=None):
+        return first_legal_move(board)
+
+
+class FakeAsyncEnginePool:
+    def __init__(self):
+        self.started = 0
+        self.idle = []
+        self.closed = False
+
+    @asynccontextmanager
+    async def engine(self, index):
+        if not self.idle:
+            self.started += 1
+            self.idle.append(FakeAsyncEngine())
+        engine = self.idle.pop()
+        try:
+            yield engine
+        finally:
+            self.idle.append(engine)
+
+    async def close(self):
+        self.closed = True
+
+
+class RecordingReplyCache:
+    """Reply cache that never hits and records the threads it is called from."""
+
+    def __init__(self):
+        self.threads = set()
+
+    def get(self, engine_name, board, limit):
+        self.threads.add(threading.current_thread())
+        return None
+
+    def put(self, engine_name, board, limit, move, score=None):
+        self.threads.add(threading.current_thread())
+
+
+class TestAsyncTournament(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = NNUEModel(512, [16, 8], 1)
+        self.adjudication = AdjudicationConfig(max_plies=30)
+        self.limit = chess.engine.Limit(nodes=1)
+
+    def play_async_game(self, color, reply_cache=None):
+        async def play():
+            runner = AsyncTournamentRunner(adjudication=self.adjudication, reply_cache=reply_cache)
+            try:
+                return await runner.play_game("model0", 0, self.model, FakeAsyncEngine(), "fake", 0, color, self.limit)
+            finally:
+                await runner.close()
+
+        return asyncio.run(play())
+
+    def test_plays_like_the_threaded_tournament(self):
+        for color in (chess.WHITE, chess.BLACK):
+            board, result, reason = self.play_async_game(color)
+            expected_board, expected_result, expected_reason = play_game(self.model, FakeEngine(), self.limit, color, None, self.adjudication)
+            self.assertEqual(board.move_stack, expected_board.move_stack)
+            self.assertEqual((result, reason), (expected_result, expected_reason))
+
+    def test_reply_cache_is_used_off_the_event_loop(self):
+        reply_cache = RecordingReplyCache()
+        self.play_async_game(chess.WHITE, reply_cache)
+        self.assertTrue(reply_cache.threads)
+        self.assertNotIn(threading.main_thread(), reply_cache.threads)
+
+    def test_engine_pool_is_shared_between_generations(self):
+        engine_pool = FakeAsyncEnginePool()
+        population = [PopulationModel(self.model, "model0")]
+        loop = asyncio.new_event_loop()
+        try:
+            with mock.patch("tournaments.async_tournament.get_max_index", return_value=0), \
+                    mock.patch("tournaments.async_tournament.get_engine_info_by_index", return_value={"name": "fake"}), \
+                    mock.patch("tournaments.async_tournament.get_engine_limit_by_index", return_value=self.limit), \
+                    mock.patch("tournaments.async_tournament.record_finished_game"):
+                for generation in range(2):
+                    results = run_tournaments_async(population, generation, adjudication=self.adjudication, engine_pool=engine_pool, loop=loop)
+                    self.assertEqual(len(results), 1)
+        finally:
+            loop.close()
+
+        self.assertEqual(engine_pool.started, 1)
+        self.assertFalse(engine_pool.closed)
+
+    def test_shared_engine_pool_needs_a_loop(self):
+        with self.assertRaises(ValueError):
+            run_tournaments_async([], 0, engine_pool=FakeAsyncEnginePool())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import random
+import tempfile
+import unittest
+
+import chess
+import numpy as np
+
+from neural_network.features import get_feature_set_from_name
+from neural_network.features.bulk import extract_sparse_features
+
+
+class TestExtractSparseFeatures(unittest.TestCase):
+    def setUp(self):
+        self.feature_set = get_feature_set_from_name("HalfKP")
+        rng = random.Random(0)
+        self.boards = []
+        for _ in range(6):
+            board = chess.Board()
+            for _ in range(rng.randint(10, 60)):
+                legal_moves = list(board.legal_moves)
+                if not legal_moves:
+                    break
+                board.push(rng.choice(legal_moves))
+                self.boards.append(board.copy(stack=False))
+        # Boards and FENs can be mixed
+        self.positions = [board.fen() if i % 2 else board for i, board in enumerate(self.boards)]
+
+    def assertMatchesGetActiveIndices(self, white, black):
+        for i, board in enumerate(self.boards):
+            for csr, (indices, values) in zip((white, black), self.feature_set.get_active_indices(board)):
+                start, end = csr.offsets[i], csr.offsets[i + 1]
+                np.testing.assert_array_equal(csr.indices[start:end], indices.numpy())
+                np.testing.assert_array_equal(csr.values[start:end], values.numpy())
+
+    def test_serial_and_pool_match_get_active_indices(self):
+        serial = extract_sparse_features(self.feature_set, self.positions, max_workers=1, chunk_size=16)
+        self.assertMatchesGetActiveIndices(*serial)
+
+        pool = extract_sparse_features(self.feature_set, iter(self.positions), max_workers=2, chunk_size=16, parallel_threshold=0)
+        self.assertMatchesGetActiveIndices(*pool)
+
+    def test_npy_files_reload(self):
+        with tempfile.TemporaryDirectory() as output_dir:
+            white, black = extract_sparse_features(self.feature_set, self.positions, output_dir=output_dir, max_workers=1, chunk_size=16)
+            self.assertMatchesGetActiveIndices(white, black)
+
+            for perspective, csr in (("white", white), ("black", black)):
+                for name in ("indices", "offsets", "values"):
+                    reloaded = np.load(os.path.join(output_dir, f"{perspective}_{name}.npy"))
+                    self.assertEqual(reloaded.dtype, getattr(csr, name).dtype)
+                    np.testing.assert_array_equal(reloaded, getattr(csr, name))
+            del white, black
+
+
+if __name__ == "__main__":
+    unittest.main()
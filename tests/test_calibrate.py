@@ -0,0 +1,42 @@
+import unittest
+from unittest import mock
+
+import engines.calibrate as calibrate
+
+
+class TestCalibrateEngines(unittest.TestCase):
+    def calibrate(self, profiles, **kwargs):
+        with mock.patch.object(calibrate, "load_engine_profiles", return_value=profiles), \
+                mock.patch.object(calibrate, "save_engine_profiles") as save, \
+                mock.patch.object(calibrate, "get_engine_info_by_index", side_effect=lambda index, debug=False: {"name": f"engine{index}"}), \
+                mock.patch.object(calibrate, "measure_nps", return_value=100000.0):
+            result = calibrate.calibrate_engines([0, 1], **kwargs)
+        save.assert_called_once_with(result, debug=False)
+        return result
+
+    def test_budget_defaults_to_the_reference_move_time(self):
+        profiles = self.calibrate({"reference_movetime": 0.5, "engines": {}})
+        self.assertEqual(profiles["engines"]["engine0"], {"nodes": 50000, "nps": 100000})
+        self.assertEqual(profiles["reference_movetime"], 0.5)
+
+        profiles = self.calibrate({"engines": {}}, reference_movetime=2.0)
+        self.assertEqual(profiles["engines"]["engine1"]["nodes"], 200000)
+        self.assertEqual(profiles["reference_movetime"], 2.0)
+
+    def test_budget_comes_from_a_given_target_move_time(self):
+        profiles = self.calibrate({"reference_movetime": 1.0, "engines": {}}, target_movetime=0.02)
+        self.assertEqual(profiles["engines"]["engine0"], {"nodes": 2000, "nps": 100000})
+        self.assertNotIn("target_movetime", profiles)
+
+    def test_keeps_depth_and_movetime_limits(self):
+        profiles = self.calibrate({"engines": {"engine0": {"depth": 3, "nodes": 5}, "engine1": {"movetime": 0.1}}}, target_movetime=0.01)
+        self.assertEqual(profiles["engines"]["engine0"], {"depth": 3, "nodes": 1000, "nps": 100000})
+        self.assertEqual(profiles["engines"]["engine1"], {"movetime": 0.1, "nodes": 1000, "nps": 100000})
+
+    def test_rejects_a_target_that_is_not_positive(self):
+        with self.assertRaises(ValueError):
+            calibrate.calibrate_engines([0], reference_movetime=0.5, target_movetime=0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+
+import torch
+
+from neural_network.checkpoint_writer import CheckpointWriter
+from neural_network.model import NNUEModel
+from neural_network.serialize import serialize_state_dict
+
+
+class TestCheckpointWriter(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_state_dict_serializes_like_the_model(self):
+        for model in (NNUEModel(512, [16, 8], 1), NNUEModel(41024, [16, 8], 1, sparse_input=True)):
+            self.assertEqual(serialize_state_dict(model.state_snapshot()), model.serialize_stockfish_format())
+
+    def test_snapshot_is_serialized_on_the_writer_thread(self):
+        model = NNUEModel(512, [16, 8], 1)
+        expected = bytes(model.serialize_stockfish_format())
+        file_path = os.path.join(self.directory.name, "generation0", "model0.nnue")
+
+        with CheckpointWriter() as writer:
+            writer.submit([(file_path, lambda snapshot=model.state_snapshot(): serialize_state_dict(snapshot))])
+            # Training goes on while the snapshot waits to be written
+            with torch.no_grad():
+                for parameter in model.parameters():
+                    parameter.add_(1.0)
+
+        with open(file_path, "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_errors_are_raised_on_the_caller_thread(self):
+        def fail():
+            raise OSError("disk full")
+
+        writer = CheckpointWriter()
+        writer.submit([(os.path.join(self.directory.name, "model0.nnue"), fail)])
+        with self.assertRaises(RuntimeError):
+            writer.flush()
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
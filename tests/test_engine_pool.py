@@ -0,0 +1,94 @@
+import unittest
+from unittest import mock
+
+import chess.engine
+
+from engines.engine_pool import EnginePool
+
+
+class FakeEngine:
+    """Engine process stand-in that can be made to stop responding."""
+
+    def __init__(self):
+        self.alive = True
+        self.quit_calls = 0
+
+    def ping(self):
+        if not self.alive:
+            raise chess.engine.EngineTerminatedError("engine process died")
+
+    def quit(self):
+        self.quit_calls += 1
+        if not self.alive:
+            raise chess.engine.EngineTerminatedError("engine process died")
+
+    def close(self):
+        pass
+
+
+class TestEnginePool(unittest.TestCase):
+    def setUp(self):
+        self.started = []
+
+        def load_engine_by_index(index, debug=False):
+            engine = FakeEngine()
+            self.started.append((index, engine))
+            return engine
+
+        patcher = mock.patch("engines.engine_pool.load_engine_by_index", side_effect=load_engine_by_index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = EnginePool()
+        self.addCleanup(self.pool.close)
+
+    def test_released_engines_are_reused(self):
+        engine = self.pool.checkout(0)
+        self.pool.release(0, engine)
+        self.assertIs(self.pool.checkout(0), engine)
+        # Engines are kept per index
+        self.assertIsNot(self.pool.checkout(1), engine)
+        self.assertEqual([index for index, _ in self.started], [0, 1])
+        self.assertEqual(self.pool.stats()["hits"], 1)
+        self.assertEqual(self.pool.stats()["misses"], 2)
+
+    def test_checked_out_engines_are_not_shared(self):
+        first = self.pool.checkout(0)
+        second = self.pool.checkout(0)
+        self.assertIsNot(first, second)
+
+    def test_dead_idle_engine_is_replaced(self):
+        engine = self.pool.checkout(0)
+        self.pool.release(0, engine)
+        engine.alive = False
+
+        replacement = self.pool.checkout(0)
+        self.assertIsNot(replacement, engine)
+        self.assertTrue(replacement.alive)
+        self.assertEqual(self.pool.stats()["restarts"], 1)
+
+    def test_engine_that_crashed_during_a_game_is_restarted(self):
+        with self.assertRaises(chess.engine.EngineError):
+            with self.pool.engine(0) as engine:
+                engine.alive = False
+                raise chess.engine.EngineError("engine crashed")
+
+        self.assertEqual(engine.quit_calls, 1)
+        self.assertEqual(self.pool.stats()["idle"], 0)
+        self.assertIsNot(self.pool.checkout(0), engine)
+        self.assertEqual(self.pool.stats()["restarts"], 1)
+
+    def test_close_quits_idle_engines_and_later_releases(self):
+        idle = self.pool.checkout(0)
+        busy = self.pool.checkout(0)
+        self.pool.release(0, idle)
+        self.pool.close()
+        self.assertEqual(idle.quit_calls, 1)
+
+        self.pool.release(0, busy)
+        self.assertEqual(busy.quit_calls, 1)
+        with self.assertRaises(RuntimeError):
+            self.pool.checkout(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
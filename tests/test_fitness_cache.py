@@ -0,0 +1,53 @@
+import unittest
+
+import torch
+
+from neural_network.model import NNUEModel
+from neural_network.neural_network import PopulationModel
+from tournaments.fitness_cache import FitnessCache
+
+
+class TestFitnessCache(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.survivor = NNUEModel(512, [16, 8], 1)
+        self.child = NNUEModel(512, [16, 8], 1)
+
+    def play_generation(self, cache, population, results):
+        """Record the results of the models that play, like main.py, and return the names that played."""
+        to_evaluate, weights_hashes = cache.split(population)
+        for weights_hash, model in to_evaluate.items():
+            cache.record(weights_hash, *results[model.name])
+        for model, weights_hash in zip(population, weights_hashes):
+            model.score, model.level = cache.fitness(weights_hash)
+        return [model.name for model in to_evaluate.values()]
+
+    def test_survivors_reuse_their_result(self):
+        cache = FitnessCache()
+        results = {"model1": (12.0, 2), "model2": (4.0, 1), "model3": (7.0, 1)}
+
+        self.assertEqual(self.play_generation(cache, [PopulationModel(self.survivor, "model1")], results), ["model1"])
+        # A survivor, an identical copy of it and a new child
+        population = [PopulationModel(self.survivor, "model1"), PopulationModel(self.child, "model2")]
+        copy = NNUEModel(512, [16, 8], 1)
+        copy.load_state_dict(self.survivor.state_dict())
+        population.append(PopulationModel(copy, "model3"))
+
+        self.assertEqual(self.play_generation(cache, population, results), ["model2"])
+        self.assertEqual([(model.score, model.level) for model in population], [(12.0, 2), (4.0, 1), (12.0, 2)])
+        self.assertEqual(cache.stats()["hits"], 2)
+
+    def test_reevaluations_budget(self):
+        cache = FitnessCache(reevaluations=2)
+        population = [PopulationModel(self.survivor, "model1")]
+        played = [self.play_generation(cache, population, {"model1": (score, level)}) for score, level in ((10.0, 1), (20.0, 2), (0.0, 2), (50.0, 5))]
+
+        # The first tournament and two reevaluations, then the average is reused
+        self.assertEqual(played, [["model1"], ["model1"], ["model1"], []])
+        self.assertEqual((population[0].score, population[0].level), (10.0, 2))
+        self.assertEqual(cache.stats()["misses"], 3)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import random
+import unittest
+
+import chess
+import torch
+
+from neural_network.features import get_feature_set_from_name
+from neural_network.features.halfka_v2_hm import (
+    HALFKA_V2_HM_INDEX_TABLE,
+    NUM_INPUTS,
+    NUM_PLANES_VIRTUAL,
+    FactorizedFeatures,
+    Features,
+    halfka_idx,
+)
+
+
+class TestHalfKAv2hm(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.boards = [chess.Board()]
+        for _ in range(20):
+            board = chess.Board()
+            for _ in range(random.randint(1, 120)):
+                legal_moves = list(board.legal_moves)
+                if not legal_moves:
+                    break
+                board.push(random.choice(legal_moves))
+            self.boards.append(board)
+
+    def test_index_table_matches_halfka_idx(self):
+        for king_sq in (chess.A1, chess.E1, chess.H8, chess.C5):
+            for sq in range(64):
+                for piece in range(12):
+                    p = chess.Piece(piece // 2 + 1, chess.WHITE if piece % 2 == 0 else chess.BLACK)
+                    for perspective, is_white_pov in enumerate((True, False)):
+                        self.assertEqual(HALFKA_V2_HM_INDEX_TABLE[perspective, king_sq, piece, sq], halfka_idx(is_white_pov, king_sq, sq, p))
+        self.assertEqual(HALFKA_V2_HM_INDEX_TABLE.max(), NUM_INPUTS - 1)
+
+    def test_mirrored_boards_have_the_same_features(self):
+        block = Features()
+        for board in self.boards:
+            (white, _), (black, _) = block.get_active_indices(board)
+            (mirrored_white, _), _ = block.get_active_indices(board.transform(chess.flip_horizontal))
+            _, (flipped_black, _) = block.get_active_indices(board.mirror())
+            self.assertEqual(sorted(white.tolist()), sorted(mirrored_white.tolist()))
+            self.assertEqual(sorted(white.tolist()), sorted(flipped_black.tolist()))
+            self.assertEqual(len(white), len(board.piece_map()))
+
+    def test_sparse_features_match_dense_features(self):
+        block = FactorizedFeatures()
+        for board in self.boards:
+            for dense, (indices, values) in zip(block.get_active_features(board), block.get_active_indices(board)):
+                sparse = torch.zeros(block.num_features)
+                sparse[indices] = values
+                self.assertTrue(torch.equal(sparse, dense))
+
+    def test_factors_and_psqt_features(self):
+        feature_set = get_feature_set_from_name("HalfKAv2_hm^")
+        factors = feature_set.get_virtual_to_real_features_gather_array()
+        for index in range(0, NUM_INPUTS, 101):
+            self.assertEqual(factors[index].tolist(), feature_set.features[0].get_feature_factors(index))
+        self.assertEqual(len(feature_set.get_initial_psqt_features()), NUM_INPUTS + NUM_PLANES_VIRTUAL)
+
+        # The start position is balanced from both perspectives
+        psqt = torch.tensor(get_feature_set_from_name("HalfKAv2_hm").get_initial_psqt_features())
+        for indices, _ in Features().get_active_indices(chess.Board()):
+            self.assertEqual(int(psqt[indices].sum()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
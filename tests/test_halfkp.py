@@ -0,0 +1,67 @@
+import random
+import unittest
+
+import chess
+import torch
+
+from neural_network.features import get_feature_set_from_name
+from neural_network.features.halfkp import Features, FactorizedFeatures
+
+
+def densify(indices, values, size):
+    dense = torch.zeros(size)
+    dense.index_put_((indices,), values, accumulate=True)
+    return dense
+
+
+class TestSparseHalfKP(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.boards = [chess.Board(), chess.Board("4k3/8/8/8/8/8/8/4K3 w - - 0 1")]
+        for _ in range(20):
+            board = chess.Board()
+            for _ in range(random.randint(1, 120)):
+                legal_moves = list(board.legal_moves)
+                if not legal_moves:
+                    break
+                board.push(random.choice(legal_moves))
+            self.boards.append(board)
+
+    def test_sparse_features_match_dense_features(self):
+        for block in (Features(), FactorizedFeatures()):
+            for board in self.boards:
+                dense = block.get_active_features(board)
+                sparse = block.get_active_indices(board)
+                for dense_perspective, (indices, values) in zip(dense, sparse):
+                    self.assertTrue(torch.equal(densify(indices, values, block.num_features), dense_perspective))
+
+    def test_one_index_per_piece_and_perspective(self):
+        (white, _), (black, _) = Features().get_active_indices(chess.Board())
+        self.assertEqual(len(white), 30)
+        self.assertEqual(len(black), 30)
+        self.assertEqual(white.dtype, torch.int64)
+
+
+class TestFactorCoalescing(unittest.TestCase):
+    def test_vectorized_factors_match_feature_factors(self):
+        block = FactorizedFeatures()
+        factors = block.get_feature_factors_array()
+        for index in (0, 1, 641, 20000, block.num_real_features - 1):
+            self.assertEqual(factors[index].tolist(), block.get_feature_factors(index))
+
+    def test_coalesced_weights_evaluate_like_factorized_weights(self):
+        factorized = get_feature_set_from_name("HalfKP^")
+        real = get_feature_set_from_name("HalfKP")
+        weight = torch.randn(8, factorized.num_features, dtype=torch.float64)
+        coalesced = factorized.coalesce_ft_weights(weight)
+        self.assertEqual(coalesced.shape, (8, real.num_features))
+
+        board = chess.Board("r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3")
+        for (real_indices, real_values), (indices, values) in zip(real.get_active_indices(board), factorized.get_active_indices(board)):
+            expected = weight @ densify(indices, values, factorized.num_features).double()
+            actual = coalesced @ densify(real_indices, real_values, real.num_features).double()
+            self.assertTrue(torch.allclose(actual, expected))
+
+
+if __name__ == "__main__":
+    unittest.main()
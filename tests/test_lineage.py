@@ -0,0 +1,34 @@
+import unittest
+
+import torch
+
+from neural_network.lineage import LineageRegistry
+
+
+class TestLineageRegistry(unittest.TestCase):
+    def plan(self, seed, num_children=200, mutation_rate=0.5, num_parents=30):
+        generator = torch.Generator()
+        generator.manual_seed(seed)
+        return LineageRegistry.plan_offspring(num_children, mutation_rate, num_parents, generator)
+
+    def test_same_seed_gives_the_same_plan(self):
+        plan = self.plan(7)
+        self.assertEqual(plan, self.plan(7))
+        self.assertNotEqual(plan, self.plan(8))
+        self.assertEqual(set(plan), {"mutation", "breeding"})
+
+    def test_breedings_are_capped_at_the_number_of_parent_pairs(self):
+        plan = self.plan(7, num_children=20, mutation_rate=0.0, num_parents=4)
+        self.assertEqual(plan.count("breeding"), 6)
+        self.assertEqual(plan[6:], ["mutation"] * 14)
+
+    def test_a_pair_is_claimed_once_in_either_order(self):
+        lineage = LineageRegistry()
+        self.assertTrue(lineage.claim_pair("model1", "model2"))
+        self.assertFalse(lineage.claim_pair("model2", "model1"))
+        lineage.start_generation()
+        self.assertTrue(lineage.claim_pair("model2", "model1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import random
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import chess
+import chess.engine
+import torch
+
+from engines.engine_pool import EnginePool
+from neural_network.accumulator import Accumulator
+from neural_network.model import NNUEModel
+from neural_network.neural_network import PopulationModel
+from tournaments.adjudication import AdjudicationConfig
+from tournaments.lockstep import LockstepTournament, StackedModels
+from tournaments.tournament import convert_board_to_features
+
+
+class FakeEngine:
+    """Engine that plays the first legal move and counts how many engines are searching at once."""
+
+    lock = threading.Lock()
+    started = 0
+    searching = 0
+    max_searching = 0
+
+    def __init__(self):
+        with FakeEngine.lock:
+            FakeEngine.started += 1
+
+    def play(self, board, limit, game=None, info=None):
+        with FakeEngine.lock:
+            FakeEngine.searching += 1
+            FakeEngine.max_searching = max(FakeEngine.max_searching, FakeEngine.searching)
+        try:
+            return SimpleNamespace(move=next(iter(board.legal_moves)), info={})
+        finally:
+            with FakeEngine.lock:
+                FakeEngine.searching -= 1
+
+    def ping(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+class TestStackedModels(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.models = [NNUEModel(512, [16, 8], 1) for _ in range(3)]
+        for model in self.models:
+            for parameter in model.parameters():
+                torch.nn.init.normal_(parameter, 0.0, 0.5)
+
+    def test_scores_children_like_select_move(self):
+        rng = random.Random(0)
+        boards = []
+        for _ in range(6):
+            board = chess.Board()
+            for _ in range(rng.randint(0, 40)):
+                board.push(rng.choice(list(board.legal_moves)))
+            if not board.is_game_over():
+                boards.append(board)
+
+        model_indices = [i % len(self.models) for i in range(len(boards))]
+        legal_moves = [list(board.legal_moves) for board in boards]
+        children = [
+            Accumulator.from_layer(self.models[i].model[0], board).children(board, moves)
+            for i, board, moves in zip(model_indices, boards, legal_moves)
+        ]
+        best_children = StackedModels(self.models).score_children(model_indices, children)
+
+        for i, board, moves, best_child in zip(model_indices, boards, legal_moves, best_children):
+            self.assertEqual(moves[best_child], self.models[i].select_move(board, convert_board_to_features, moves))
+
+    def test_rejects_quantized_models(self):
+        self.models[1].set_inference("quantized")
+        with self.assertRaises(ValueError):
+            StackedModels(self.models)
+
+    def test_rejects_models_without_the_square_encoding(self):
+        with self.assertRaises(ValueError):
+            StackedModels([NNUEModel(41024, [16, 8], 1, sparse_input=True) for _ in range(2)])
+
+
+class TestLockstepTournament(unittest.TestCase):
+    def test_engines_are_bounded_by_max_workers(self):
+        FakeEngine.started = FakeEngine.max_searching = 0
+        population = [PopulationModel(NNUEModel(512, [16, 8], 1), f"model{i}") for i in range(8)]
+        records = []
+
+        with mock.patch("tournaments.lockstep.get_max_index", return_value=0), \
+                mock.patch("tournaments.lockstep.get_engine_info_by_index", return_value={"name": "fake"}), \
+                mock.patch("tournaments.lockstep.get_engine_limit_by_index", return_value=chess.engine.Limit(nodes=1)), \
+                mock.patch("engines.engine_pool.load_engine_by_index", side_effect=lambda index, debug=False: FakeEngine()):
+            with EnginePool() as engine_pool:
+                results = LockstepTournament(
+                    population, 0, engine_pool, adjudication=AdjudicationConfig(max_plies=20), max_workers=2,
+                    record_game=lambda pgn_path, pgn_text: records.append(pgn_path),
+                ).run()
+
+        self.assertEqual(len(results), len(population))
+        self.assertTrue(records)
+        self.assertLessEqual(FakeEngine.started, 2)
+        self.assertLessEqual(FakeEngine.max_searching, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import io
+import random
+import unittest
+from contextlib import redirect_stdout
+
+import chess
+import torch
+
+from neural_network.features import get_feature_set_from_name
+from neural_network.model import NNUEModel, position_key
+from tournaments.tournament import GameState, convert_board_to_features, print_eval_cache_stats
+
+
+class TestEvalCache(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = NNUEModel(512, [16, 8], 1)
+        for parameter in self.model.parameters():
+            torch.nn.init.normal_(parameter, 0.0, 0.5)
+
+    def test_positions_with_colliding_hashes_have_different_keys(self):
+        # A bitboard of 2**62 wraps to 2 in Python's hash: a queen on g8 hashes like a queen on b1
+        g8 = chess.Board("4k1Q1/8/8/8/8/8/8/4K3 b - - 1 1")
+        b1 = chess.Board("4k3/8/8/8/8/8/8/1Q2K3 b - - 1 1")
+        self.assertEqual(hash(g8.queens), hash(b1.queens))
+        self.assertNotEqual(position_key(g8), position_key(b1))
+
+    def test_cached_scores_match_uncached_scores(self):
+        parents = [
+            (chess.Board("4k3/6Q1/8/8/8/8/8/4K3 w - - 0 1"), chess.Move.from_uci("g7g8")),
+            (chess.Board("4k3/8/8/8/8/8/Q7/4K3 w - - 0 1"), chess.Move.from_uci("a2b1")),
+        ]
+        cached = [float(self.model.score_moves(board, [move], convert_board_to_features)[0]) for board, move in parents]
+
+        uncached = []
+        for board, move in parents:
+            self.model.invalidate_eval_cache()
+            uncached.append(float(self.model.score_moves(board, [move], convert_board_to_features)[0]))
+
+        self.assertEqual(cached, uncached)
+        self.assertNotEqual(cached[0], cached[1])
+
+    def test_stats_are_only_printed_for_models_that_use_the_cache(self):
+        # Tournament games score the moves of this model with an accumulator, which skips the cache
+        game = GameState(self.model, chess.WHITE)
+        game.play_model_move(game.select_move())
+        self.assertEqual(self.model.eval_cache.stats()["misses"], 0)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            print_eval_cache_stats("model1", self.model, debug=True)
+        self.assertEqual(output.getvalue(), "")
+
+        feature_set = get_feature_set_from_name("HalfKP")
+        model = NNUEModel(feature_set.num_features, [8], 1, feature_set)
+        with redirect_stdout(output):
+            print_eval_cache_stats("model2", model, debug=True)
+        self.assertIn("Eval cache statistics for model2", output.getvalue())
+
+
+class TestAccumulator(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = NNUEModel(512, [16, 8], 1)
+        for parameter in self.model.parameters():
+            torch.nn.init.normal_(parameter, 0.0, 0.5)
+        # Castling, en passant and promotions, then random games
+        self.boards = [
+            chess.Board("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1"),
+            chess.Board("4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2"),
+            chess.Board("1n2k3/P7/8/8/8/8/7p/4K1N1 w - - 0 1"),
+        ]
+        rng = random.Random(0)
+        for _ in range(10):
+            board = chess.Board()
+            for _ in range(rng.randint(1, 100)):
+                legal_moves = list(board.legal_moves)
+                if not legal_moves:
+                    break
+                board.push(rng.choice(legal_moves))
+            self.boards.append(board)
+
+    def full_evaluation(self, board):
+        return self.model.evaluate_boards(torch.tensor([convert_board_to_features(board)], dtype=torch.float32))
+
+    def test_incremental_scores_match_full_recompute(self):
+        for board in self.boards:
+            moves = list(board.legal_moves)
+            accumulator = self.model.create_accumulator(board)
+            expected = self.model.score_moves(board, moves, convert_board_to_features)
+            self.assertTrue(torch.allclose(self.model.score_moves_incremental(board, moves, accumulator), expected, atol=1e-4))
+
+            # Pushing every move keeps the accumulator equal to a fresh one
+            for move in moves:
+                accumulator.push(board, move)
+                self.assertTrue(torch.allclose(self.model.model[1:](accumulator.value), self.full_evaluation(board), atol=1e-4))
+                accumulator.pop(board)
+
+    def test_rejects_models_with_other_inputs(self):
+        feature_set = get_feature_set_from_name("HalfKP")
+        for model in (NNUEModel(feature_set.num_features, [8], 1, feature_set), NNUEModel(feature_set.num_features, [8], 1, sparse_input=True)):
+            self.assertFalse(model.supports_accumulator())
+            with self.assertRaises(ValueError):
+                model.create_accumulator(chess.Board())
+        self.assertTrue(self.model.supports_accumulator())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import unittest
+import zlib
+
+import torch
+
+from neural_network.checkpoint_writer import CheckpointWriter
+from neural_network.model import NNUEModel
+from neural_network.model_store import ModelStore
+from neural_network.neural_network import PopulationModel
+
+
+class TestModelStore(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.models = [NNUEModel(512, [16, 8], 1), NNUEModel(41024, [16, 8], 1, sparse_input=True)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def population(self):
+        return [
+            PopulationModel(self.models[0], "model0", 2.5, 3, {"parent": "base_nnue"}),
+            PopulationModel(self.models[1], "model1", 1.0, 2, {"parents": ["model0", "model2"]}),
+        ]
+
+    def blob_files(self):
+        return sorted(
+            os.path.join(directory, file_name)
+            for directory, _, file_names in os.walk(os.path.join(self.root, "blobs"))
+            for file_name in file_names
+        )
+
+    def test_manifest_round_trip(self):
+        for compression in ("zlib", "lzma"):
+            with self.subTest(compression=compression):
+                store = ModelStore(os.path.join(self.root, compression), compression)
+                store.save_generation(0, self.population())
+                loaded = store.load_generation(0)
+
+                for expected, model in zip(self.population(), loaded):
+                    self.assertEqual((model.name, model.score, model.level, model.metadata), (expected.name, expected.score, expected.level, expected.metadata))
+                    self.assertEqual(model.model.serialize_stockfish_format(), expected.model.serialize_stockfish_format())
+
+    def test_survivors_are_stored_once(self):
+        with CheckpointWriter() as writer:
+            store = ModelStore(self.root, checkpoint_writer=writer)
+            store.save_generation(0, self.population())
+            writer.flush()
+            blobs = self.blob_files()
+            modified = [os.path.getmtime(blob) for blob in blobs]
+
+            # The next generation keeps model0 and replaces model1 by a mutation
+            mutated = NNUEModel(512, [16, 8], 1)
+            store.save_generation(1, [self.population()[0], PopulationModel(mutated, "model2")])
+
+        self.assertEqual(len(blobs), 2)
+        self.assertEqual(len(self.blob_files()), 3)
+        self.assertEqual([os.path.getmtime(blob) for blob in blobs], modified)
+        # A new store finds the blobs already on disk
+        ModelStore(self.root).save_generation(2, [PopulationModel(mutated, "model2")])
+        self.assertEqual(len(self.blob_files()), 3)
+        self.assertEqual(store.load_generation(1)[0].model.weights_hash(), self.models[0].weights_hash())
+
+    def test_snapshot_is_taken_when_the_generation_is_saved(self):
+        expected = bytes(self.models[0].serialize_stockfish_format())
+        with CheckpointWriter() as writer:
+            store = ModelStore(self.root, checkpoint_writer=writer)
+            store.save_generation(0, self.population()[:1])
+            with torch.no_grad():
+                for parameter in self.models[0].parameters():
+                    parameter.add_(1.0)
+
+        self.assertEqual(store.load_generation(0)[0].model.serialize_stockfish_format(), expected)
+
+    def test_rejects_corrupted_blobs(self):
+        store = ModelStore(self.root)
+        store.save_generation(0, self.population()[:1])
+        blob_path = self.blob_files()[0]
+        with open(blob_path, "rb") as blob_file:
+            data = bytearray(blob_file.read())
+
+        corruptions = {
+            "flipped byte": data[:len(data) // 2] + bytes([data[len(data) // 2] ^ 0xFF]) + data[len(data) // 2 + 1:],
+            "truncated": data[:len(data) // 2],
+            "other network": zlib.compress(NNUEModel(512, [16, 8], 1).serialize_stockfish_format()),
+        }
+        for corruption, corrupted in corruptions.items():
+            with self.subTest(corruption=corruption):
+                with open(blob_path, "wb") as blob_file:
+                    blob_file.write(corrupted)
+                with self.assertRaises(ValueError):
+                    store.load_generation(0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+
+import torch
+
+from neural_network.features import get_feature_set_from_name
+from neural_network.model import NNUEModel
+from neural_network.neural_network import PopulationModel, create_new_generation
+from neural_network.population_store import PopulationStore
+
+
+class TestPopulationStore(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.population = [
+            PopulationModel(NNUEModel(512, [16, 8], 1), f"model{i}", score=float(i), level=i, metadata={"parent": "base_nnue"})
+            for i in range(1, 6)
+        ]
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertSamePopulation(self, population, expected):
+        self.assertEqual([(m.name, m.score, m.level, m.metadata) for m in population], [(m.name, m.score, m.level, m.metadata) for m in expected])
+        for model, expected_model in zip(population, expected):
+            self.assertEqual(model.model.weights_hash(), expected_model.model.weights_hash())
+
+    def test_population_round_trip(self):
+        store = PopulationStore.from_population(self.population)
+        self.assertSamePopulation(store.population(), self.population)
+
+    def test_save_load_round_trip(self):
+        feature_set = get_feature_set_from_name("HalfKP")
+        population = [PopulationModel(NNUEModel(feature_set.num_features, [8], 1, feature_set, sparse_input=True), f"model{i}") for i in range(2)]
+        file_path = os.path.join(self.directory.name, "population.pt")
+        PopulationStore.from_population(population).save(file_path)
+
+        loaded = PopulationStore.load(file_path)
+        self.assertSamePopulation(loaded.population(), population)
+        self.assertEqual(loaded.model(0).feature_set.name, feature_set.name)
+        self.assertTrue(loaded.sparse_input)
+
+    def test_views_follow_their_row(self):
+        store = PopulationStore.from_population(self.population)
+        view = store.model(1)
+        store.copy(torch.tensor([0]), torch.tensor([1]))
+        self.assertEqual(view.weights_hash(), self.population[0].model.weights_hash())
+        self.assertEqual(store.slot(view), 1)
+        with self.assertRaises(ValueError):
+            store.slot(self.population[1].model)
+
+    def breed(self, crossover, seed=1):
+        # The children overwrite their own parents
+        store = PopulationStore.from_population(self.population)
+        store.breed(torch.tensor([0, 1, 2]), torch.tensor([1, 2, 3]), torch.tensor([0, 1, 2]), crossover, torch.Generator().manual_seed(seed))
+        return store
+
+    def test_breed_crossover_modes(self):
+        for crossover in ("average", "uniform", "layer", "neuron"):
+            with self.subTest(crossover=crossover):
+                store = self.breed(crossover)
+                for child, (parent1, parent2) in enumerate(((0, 1), (1, 2), (2, 3))):
+                    layers = zip(store.model(child).model, self.population[parent1].model.model, self.population[parent2].model.model)
+                    for layer, layer1, layer2 in layers:
+                        if not isinstance(layer, torch.nn.Linear):
+                            continue
+                        if crossover == "average":
+                            self.assertTrue(torch.equal(layer.weight, (layer1.weight + layer2.weight) / 2))
+                            self.assertTrue(torch.equal(layer.bias, (layer1.bias + layer2.bias) / 2))
+                            continue
+
+                        weight_mask = layer.weight == layer1.weight
+                        bias_mask = layer.bias == layer1.bias
+                        # Every weight comes from one of the parents
+                        self.assertTrue(torch.equal(torch.where(weight_mask, layer1.weight, layer2.weight), layer.weight))
+                        self.assertTrue(torch.equal(torch.where(bias_mask, layer1.bias, layer2.bias), layer.bias))
+                        if crossover == "layer":
+                            self.assertIn(int(weight_mask.sum()) + int(bias_mask.sum()), (0, weight_mask.numel() + bias_mask.numel()))
+                        elif crossover == "neuron":
+                            # A node takes its weights and bias from the same parent
+                            self.assertTrue(torch.equal(weight_mask.all(dim=1), bias_mask))
+                            self.assertTrue(torch.equal(weight_mask.any(dim=1), bias_mask))
+                        else:
+                            self.assertTrue(0 < int(weight_mask.sum()) < weight_mask.numel())
+
+                # The crossover is reproducible
+                hashes = [store.model(slot).weights_hash() for slot in range(3)]
+                self.assertEqual([self.breed(crossover).model(slot).weights_hash() for slot in range(3)], hashes)
+
+    def test_breed_rejects_unknown_crossover_modes(self):
+        with self.assertRaises(ValueError):
+            self.breed("random")
+
+    def test_advance_builds_the_next_generation(self):
+        store = PopulationStore.from_population(self.population)
+        views = [store.model(slot) for slot in range(store.size)]
+        survivor_cache = views[3].eval_cache
+
+        store.advance([3, 0], [1, 1], [(2, 4)], temperature=0.25)
+
+        self.assertEqual(store.size, 5)
+        self.assertEqual(store.model(0).weights_hash(), self.population[3].model.weights_hash())
+        self.assertIs(store.model(0).eval_cache, survivor_cache)
+        self.assertEqual(store.model(1).weights_hash(), self.population[0].model.weights_hash())
+        for slot in (2, 3):
+            # max(1, 0.25 * out_features) nodes of every layer are mutated
+            changed = (store.model(slot).model[0].weight != self.population[1].model.model[0].weight).any(dim=1)
+            self.assertEqual(int(changed.sum()), 4)
+        average = (self.population[2].model.model[0].weight + self.population[4].model.model[0].weight) / 2
+        self.assertTrue(torch.equal(store.model(4).model[0].weight, average))
+        # Models handed out before keep the previous generation
+        self.assertEqual(views[1].weights_hash(), self.population[1].model.weights_hash())
+
+    def test_create_new_generation_in_the_store(self):
+        store = PopulationStore.from_population(self.population)
+        population = store.population()
+        working_directory = os.getcwd()
+        os.chdir(self.directory.name)
+        try:
+            new_generation, _, _ = create_new_generation(
+                population, 0.4, 0.5, 5, 0.25, 0.05, 0, generator=torch.Generator().manual_seed(0), population_store=store,
+            )
+        finally:
+            os.chdir(working_directory)
+
+        self.assertEqual(len(new_generation), 5)
+        self.assertEqual(len({model.name for model in new_generation}), 5)
+        self.assertEqual([store.slot(model.model) for model in new_generation], list(range(5)))
+        self.assertEqual([model.name for model in store.population()], [model.name for model in new_generation])
+        survivors = {model.name: model for model in self.population}
+        for model in new_generation[:2]:
+            self.assertEqual(model.model.weights_hash(), survivors[model.name].model.weights_hash())
+
+
+if __name__ == "__main__":
+    unittest.main()
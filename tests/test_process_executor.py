@@ -0,0 +1,34 @@
+import unittest
+
+import torch
+
+from neural_network.features import get_feature_set_from_name
+from neural_network.model import NNUEModel, SparseLinear
+from neural_network.quantize import QuantizationConfig
+from tournaments.process_executor import pack_model, unpack_model
+
+
+class TestPackModel(unittest.TestCase):
+    def test_round_trip_keeps_the_weights(self):
+        model = NNUEModel(512, [16], 1)
+        unpacked = unpack_model(pack_model(model))
+        self.assertEqual(unpacked.weights_hash(), model.weights_hash())
+        self.assertEqual(unpacked.inference, "float")
+        self.assertIsNone(unpacked.feature_set)
+
+    def test_round_trip_keeps_inference_feature_set_and_sparse_input(self):
+        feature_set = get_feature_set_from_name("HalfKP")
+        model = NNUEModel(feature_set.num_features, [8], 1, feature_set, sparse_input=True)
+        config = QuantizationConfig(activation_ranges=[2.0])
+        model.set_inference("quantized", config)
+
+        unpacked = unpack_model(pack_model(model))
+        self.assertIsInstance(unpacked.model[0], SparseLinear)
+        self.assertEqual(unpacked.feature_set.name, "HalfKP")
+        self.assertEqual(unpacked.inference, "quantized")
+        self.assertEqual(unpacked.get_quantized_network().config, config)
+        self.assertTrue(torch.equal(unpacked.get_quantized_network().ft_weight, model.get_quantized_network().ft_weight))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+
+import numpy as np
+import torch
+from torch import nn
+
+from neural_network.model import NNUEModel
+from neural_network.quantize import QuantizationConfig, calibrate_activation_ranges
+from neural_network.quantized_inference import QuantizedNetwork, _affine, calibration_positions, clipped_float_forward
+from tournaments.tournament import convert_board_to_features
+
+
+def random_model(std: float) -> NNUEModel:
+    model = NNUEModel(512, [64, 16], 1)
+    for layer in model.model:
+        if isinstance(layer, nn.Linear):
+            layer.weight.data = torch.randn_like(layer.weight) * std
+            layer.bias.data = torch.randn_like(layer.bias) * std
+    return model
+
+
+class TestQuantizedNetwork(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        boards = calibration_positions(200, seed=1)
+        self.features = torch.tensor([convert_board_to_features(board) for board in boards], dtype=torch.float32)
+        self.calibration_inputs = torch.tensor([convert_board_to_features(board) for board in calibration_positions(200, seed=2)], dtype=torch.float32)
+
+    def mean_error_cp(self, network, reference):
+        return float(np.abs(network.evaluate(self.features.numpy()) - reference.view(-1).double().numpy()).mean()) * network.config.nnue2score
+
+    def test_matches_the_clipped_float_reference(self):
+        model = random_model(0.05)
+        network = QuantizedNetwork(model)
+        with torch.no_grad():
+            reference = clipped_float_forward(model, self.features)
+        self.assertLess(self.mean_error_cp(network, reference), 10.0)
+
+    def test_calibrated_ranges_follow_the_float_model(self):
+        model = random_model(0.1)
+        config = QuantizationConfig(activation_ranges=calibrate_activation_ranges(model, self.calibration_inputs))
+        with torch.no_grad():
+            float_scores = model.model(self.features)
+            # Ranges above every activation leave the network unchanged
+            unclipped = QuantizationConfig(activation_ranges=calibrate_activation_ranges(model, self.features, percentile=1.0))
+            self.assertTrue(torch.allclose(clipped_float_forward(model, self.features, unclipped), float_scores, atol=1e-5))
+
+        default_error = self.mean_error_cp(QuantizedNetwork(model), float_scores)
+        calibrated_error = self.mean_error_cp(QuantizedNetwork(model, config), float_scores)
+        self.assertLess(calibrated_error, default_error / 2)
+
+    def test_float32_affine_matches_the_integer_kernel(self):
+        network = QuantizedNetwork(random_model(0.1))
+        weight, bias, _ = network.hidden_layers[0]
+        self.assertEqual(weight.dtype, np.float32)
+        activations = np.random.default_rng(0).integers(0, 128, size=(32, weight.shape[0]), dtype=np.uint8)
+        expected = _affine(activations, np.ascontiguousarray(weight.T).astype(np.int8), bias)
+        self.assertTrue(np.array_equal(network._affine_transform(activations, weight, bias), expected))
+
+    def test_model_calibrates_when_quantizing(self):
+        model = random_model(0.1)
+        model.set_inference("quantized", calibration_inputs=self.calibration_inputs)
+        self.assertEqual(model.get_quantized_network().config.activation_ranges, calibrate_activation_ranges(model, self.calibration_inputs))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import io
+import struct
+import unittest
+
+import numpy as np
+import torch
+
+from neural_network.model import NNUEModel
+from neural_network.quantize import QuantizedNNUEWriter, feature_transformer_hash, network_hash
+from neural_network.serialize import DEFAULT_DESCRIPTION, VERSION
+
+
+class TestQuantizedNNUEWriter(unittest.TestCase):
+    def test_hashes_are_computed_like_stockfish(self):
+        # The layers after the feature transformer of Stockfish 12 are 512 -> 32 -> 32 -> 1
+        with torch.device("meta"):
+            model = NNUEModel(41024, [512, 32, 32], 1)
+        self.assertEqual(network_hash(model), 0x63337156)
+        # The feature transformer hash combines the HalfKP hash with the output size
+        self.assertEqual(feature_transformer_hash(model), 0x5D69D7B8)
+        with torch.device("meta"):
+            model = NNUEModel(41024, [256, 32, 32], 1)
+        self.assertEqual(feature_transformer_hash(model), 0x5D69D7B8 ^ 512 ^ 256)
+
+    def test_file_layout(self):
+        model = NNUEModel(40, [8, 4], 1)
+        with torch.no_grad():
+            for layer, (weight, bias) in zip((model.model[0], model.model[2], model.model[4]), ((0.5, 0.25), (0.25, -0.5), (0.5, 0.1))):
+                layer.weight.fill_(weight)
+                layer.bias.fill_(bias)
+        stream = io.BytesIO()
+        QuantizedNNUEWriter(model).serialize(stream)
+        data = stream.getvalue()
+
+        description = DEFAULT_DESCRIPTION.encode("utf-8")
+        ft_hash, fc_hash = feature_transformer_hash(model), network_hash(model)
+        self.assertEqual(struct.unpack_from("<III", data), (VERSION, ft_hash ^ fc_hash, len(description)))
+        offset = 12 + len(description)
+        self.assertEqual(data[12:offset], description)
+
+        def read(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(data, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+
+        # Feature transformer: int16 biases and weights scaled by 127, one row of 8 outputs per feature
+        self.assertEqual(read("<u4", 1)[0], ft_hash)
+        np.testing.assert_array_equal(read("<i2", 8), np.full(8, 32))
+        np.testing.assert_array_equal(read("<i2", 40 * 8), np.full(40 * 8, 64))
+
+        # Hidden layer: int32 biases scaled by 64 * 127, int8 weights scaled by 64 with the inputs padded to 32
+        self.assertEqual(read("<u4", 1)[0], fc_hash)
+        np.testing.assert_array_equal(read("<i4", 4), np.full(4, -4064))
+        weights = read("i1", 4 * 32).reshape(4, 32)
+        np.testing.assert_array_equal(weights[:, :8], np.full((4, 8), 16))
+        np.testing.assert_array_equal(weights[:, 8:], np.zeros((4, 24)))
+
+        # Output layer: scaled by 600 * 16 for the biases and 600 * 16 / 127 for the weights
+        np.testing.assert_array_equal(read("<i4", 1), [960])
+        weights = read("i1", 32)
+        np.testing.assert_array_equal(weights[:4], np.full(4, 38))
+        np.testing.assert_array_equal(weights[4:], np.zeros(28))
+        self.assertEqual(offset, len(data))
+
+
+if __name__ == "__main__":
+    unittest.main()
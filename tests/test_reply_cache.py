@@ -0,0 +1,104 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import chess
+import chess.engine
+
+from engines.reply_cache import EngineReplyCache, is_cacheable
+
+
+class TestEngineReplyCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "replies.sqlite")
+        self.limit = chess.engine.Limit(nodes=1000)
+        self.boards = [chess.Board()]
+        for uci in ("e2e4", "e7e5", "g1f3"):
+            board = self.boards[-1].copy()
+            board.push_uci(uci)
+            self.boards.append(board)
+        self.moves = [chess.Move.from_uci(uci) for uci in ("e2e4", "e7e5", "g1f3", "b8c6")]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_memory_evicts_least_recently_used(self):
+        with EngineReplyCache(self.path, max_memory_entries=2) as cache:
+            cache.put("engine", self.boards[0], self.limit, self.moves[0], 20)
+            cache.put("engine", self.boards[1], self.limit, self.moves[1], -10)
+            # Using the first reply makes the second one the least recently used
+            cache.get("engine", self.boards[0], self.limit)
+            cache.put("engine", self.boards[2], self.limit, self.moves[2], 30)
+
+            self.assertEqual(cache.get("engine", self.boards[0], self.limit), (self.moves[0], 20))
+            self.assertEqual(cache.get("engine", self.boards[2], self.limit), (self.moves[2], 30))
+            self.assertEqual(cache.stats()["memory_hits"], 3)
+            # The evicted reply is still found on disk
+            self.assertEqual(cache.get("engine", self.boards[1], self.limit), (self.moves[1], -10))
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+
+    def test_replies_persist_across_instances(self):
+        with EngineReplyCache(self.path) as cache:
+            cache.put("engine", self.boards[3], self.limit, self.moves[3], None)
+
+        with EngineReplyCache(self.path) as cache:
+            self.assertEqual(cache.get("engine", self.boards[3], self.limit), (self.moves[3], None))
+            # Replies are keyed by engine and search limit
+            self.assertIsNone(cache.get("other", self.boards[3], self.limit))
+            self.assertIsNone(cache.get("engine", self.boards[3], chess.engine.Limit(nodes=2000)))
+            self.assertEqual(cache.stats()["disk_hits"], 1)
+            self.assertEqual(cache.stats()["misses"], 2)
+
+    def test_two_writers_share_one_file(self):
+        # Like the workers of the process executor, each with its own connection
+        with EngineReplyCache(self.path) as first, EngineReplyCache(self.path) as second:
+            first._connection.execute("PRAGMA busy_timeout = 100")
+            second._connection.execute("PRAGMA busy_timeout = 100")
+            first.put("engine", self.boards[0], self.limit, self.moves[0], 20)
+            second.put("engine", self.boards[1], self.limit, self.moves[1], -10)
+            first.put("engine", self.boards[2], self.limit, self.moves[2], 30)
+
+            # Each writer sees the replies of the other without closing it
+            self.assertEqual(second.get("engine", self.boards[0], self.limit), (self.moves[0], 20))
+            self.assertEqual(first.get("engine", self.boards[1], self.limit), (self.moves[1], -10))
+            self.assertEqual(second.get("engine", self.boards[2], self.limit), (self.moves[2], 30))
+
+    def test_time_limits_are_not_cached(self):
+        self.assertTrue(is_cacheable(chess.engine.Limit(depth=5)))
+        self.assertFalse(is_cacheable(chess.engine.Limit(time=0.1)))
+        self.assertFalse(is_cacheable(chess.engine.Limit(nodes=1000, time=0.1)))
+        self.assertFalse(is_cacheable(chess.engine.Limit(white_clock=60, black_clock=60)))
+
+        limit = chess.engine.Limit(time=0.1)
+        with EngineReplyCache(self.path) as cache:
+            cache.put("engine", self.boards[0], limit, self.moves[0], 20)
+            self.assertIsNone(cache.get("engine", self.boards[0], limit))
+            self.assertEqual(cache.stats()["misses"], 0)
+
+        with EngineReplyCache(self.path) as cache:
+            self.assertIsNone(cache.get("engine", self.boards[0], chess.engine.Limit(nodes=1000)))
+
+    def test_uncacheable_engines_are_not_cached(self):
+        with EngineReplyCache(self.path, uncacheable_engines=["random_engine"]) as cache:
+            cache.put("random_engine", self.boards[0], self.limit, self.moves[0], None)
+            cache.put("engine", self.boards[0], self.limit, self.moves[0], 20)
+            self.assertIsNone(cache.get("random_engine", self.boards[0], self.limit))
+            self.assertEqual(cache.get("engine", self.boards[0], self.limit), (self.moves[0], 20))
+            self.assertEqual(cache.stats()["misses"], 0)
+
+        with EngineReplyCache(self.path, uncacheable_engines=[]) as cache:
+            self.assertIsNone(cache.get("random_engine", self.boards[0], self.limit))
+
+    def test_uncacheable_engines_default_to_the_engine_profiles(self):
+        profiles = {"engines": {"random_engine": {"nodes": 1, "cacheable": False}, "engine": {"nodes": 1000}}}
+        with mock.patch("engines.load_engine.load_engine_profiles", return_value=profiles), \
+                EngineReplyCache(self.path) as cache:
+            self.assertEqual(cache.uncacheable_engines, {"random_engine"})
+            self.assertFalse(cache.is_cacheable("random_engine", self.limit))
+            self.assertTrue(cache.is_cacheable("engine", self.limit))
+
+
+if __name__ == "__main__":
+    unittest.main()
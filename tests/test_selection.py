@@ -0,0 +1,49 @@
+import unittest
+
+import torch
+
+from neural_network.selection import SelectionConfig, select, softmax_select, tournament_select
+
+
+class ScoredModel:
+    def __init__(self, score):
+        self.score = score
+
+
+class TestSelection(unittest.TestCase):
+    def setUp(self):
+        self.population = [ScoredModel(score) for score in range(0, 1000, 10)]
+
+    def test_selects_distinct_models_without_changing_population(self):
+        population = list(self.population)
+        for method in ("softmax", "rank", "tournament"):
+            selected = select(population, 40, SelectionConfig(method=method))
+            self.assertEqual(len(selected), 40)
+            self.assertEqual(len({id(model) for model in selected}), 40)
+            self.assertEqual(population, self.population)
+
+    def test_large_scores_do_not_overflow(self):
+        selected = softmax_select(self.population, 3)
+        self.assertEqual([model.score for model in selected], [990, 980, 970])
+
+    def test_selection_is_capped_at_population_size(self):
+        for method in ("softmax", "rank", "tournament"):
+            self.assertEqual(len(select(self.population[:5], 10, SelectionConfig(method=method))), 5)
+
+    def test_generator_makes_selection_reproducible(self):
+        config = SelectionConfig(method="tournament")
+        first = select(self.population, 20, config, torch.Generator().manual_seed(3))
+        second = select(self.population, 20, config, torch.Generator().manual_seed(3))
+        self.assertEqual(first, second)
+
+    def test_tournament_of_whole_population_picks_the_best(self):
+        selected = tournament_select(self.population, 1, tournament_size=10000)
+        self.assertEqual(selected[0].score, 990)
+
+    def test_unknown_method_raises(self):
+        with self.assertRaises(ValueError):
+            select(self.population, 1, SelectionConfig(method="roulette"))
+
+
+if __name__ == "__main__":
+    unittest.main()
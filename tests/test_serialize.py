@@ -0,0 +1,68 @@
+import os
+import struct
+import tempfile
+import unittest
+
+import torch
+
+from neural_network.model import NNUEModel
+from neural_network.serialize import DEFAULT_DESCRIPTION, NNUEReader
+
+
+class TestNNUEReader(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.model = NNUEModel(512, [16, 8], 1)
+        self.data = bytes(self.model.serialize_stockfish_format())
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "model.nnue")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertSameWeights(self, model):
+        self.assertEqual(model.architecture(), self.model.architecture())
+        for parameter, expected in zip(model.parameters(), self.model.parameters()):
+            self.assertTrue(torch.equal(parameter, expected))
+
+    def test_round_trip_from_a_file(self):
+        self.model.save_stockfish_format(self.path)
+        reader = NNUEReader(self.path)
+        model = reader.read()
+        self.assertSameWeights(model)
+        self.assertEqual(reader.description, DEFAULT_DESCRIPTION)
+
+        # The file is mapped copy-on-write
+        with torch.no_grad():
+            next(model.parameters()).add_(1.0)
+        with open(self.path, "rb") as f:
+            self.assertEqual(f.read(), self.data)
+
+    def test_round_trip_from_a_buffer(self):
+        self.assertSameWeights(NNUEReader(buffer=bytearray(self.data)).read())
+
+    def read_corrupted(self, data):
+        with self.assertRaises(ValueError) as context:
+            NNUEReader(buffer=bytearray(data)).read()
+        return str(context.exception)
+
+    def test_rejects_a_bad_version(self):
+        self.assertIn("version", self.read_corrupted(struct.pack("<I", 0x12345678) + self.data[4:]))
+
+    def test_rejects_a_bad_hash(self):
+        stored_hash = struct.unpack_from("<I", self.data, 4)[0]
+        self.assertIn("hash", self.read_corrupted(self.data[:4] + struct.pack("<I", stored_hash ^ 1) + self.data[8:]))
+
+    def test_rejects_a_bad_size(self):
+        self.assertIn("size", self.read_corrupted(self.data[:-4]))
+        self.assertIn("size", self.read_corrupted(self.data + bytes(4)))
+        self.assertIn("header", self.read_corrupted(self.data[:10]))
+
+    def test_rejects_an_empty_file(self):
+        open(self.path, "wb").close()
+        with self.assertRaises(ValueError):
+            NNUEReader(self.path).read()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+import chess
+import torch
+
+from neural_network.features.feature_set import FeatureSet
+from neural_network.features.halfkp import Features
+from neural_network.model import NNUEModel, SparseLinear, sparse_batch
+
+
+class TestSparseLinear(unittest.TestCase):
+    def setUp(self):
+        torch.manual_seed(0)
+        self.sparse_model = NNUEModel(41024, [32, 8], 1, sparse_input=True)
+        self.dense_model = NNUEModel(41024, [32, 8], 1)
+        self.dense_model.load_state_dict(self.sparse_model.state_dict())
+
+    def test_serializes_like_a_dense_model(self):
+        self.assertIsInstance(self.sparse_model.model[0], SparseLinear)
+        self.assertEqual(self.sparse_model.serialize_stockfish_format(), self.dense_model.serialize_stockfish_format())
+
+    def test_sparse_evaluation_matches_dense_evaluation(self):
+        block = Features()
+        boards = [chess.Board(), chess.Board("r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3")]
+        white, black = sparse_batch(FeatureSet([block]), boards)
+        for perspective, sparse in enumerate((white, black)):
+            dense = torch.stack([block.get_active_features(board)[perspective] for board in boards])
+            self.assertTrue(torch.allclose(self.sparse_model.evaluate_sparse(*sparse), self.dense_model.evaluate_boards(dense), atol=1e-6))
+
+
+if __name__ == "__main__":
+    unittest.main()
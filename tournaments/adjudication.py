@@ -0,0 +1,115 @@
+from dataclasses import dataclass
+
+import chess
+
+# Material values in pawns, used for the material resign rule
+PIECE_VALUES = {
+    chess.PAWN: 1,
+    chess.KNIGHT: 3,
+    chess.BISHOP: 3,
+    chess.ROOK: 5,
+    chess.QUEEN: 9,
+}
+
+# Centipawn value used for engine-reported mate scores
+MATE_SCORE = 100000
+
+
+# Rules for ending games whose outcome is already decided, each rule is disabled when None
+@dataclass
+class AdjudicationConfig:
+    resign_score: int = None  # engine score in centipawns
+    resign_material: int = None  # material balance in pawns
+    resign_plies: int = 10  # consecutive moves the resign threshold must hold for
+    max_plies: int = None  # move cap after which the game is drawn
+    no_progress_plies: int = None  # plies without a capture or pawn move after which the game is drawn
+    claim_draw: bool = True  # claim draws by the 50-move and threefold repetition rules
+
+
+def material_balance(board: chess.Board) -> int:
+    """Get the material balance of a position in pawns, from White's point of view."""
+    balance = 0
+    for piece_type, value in PIECE_VALUES.items():
+        balance += value * chess.popcount(board.pieces_mask(piece_type, chess.WHITE))
+        balance -= value * chess.popcount(board.pieces_mask(piece_type, chess.BLACK))
+    return balance
+
+
+def engine_score_from_info(info: dict) -> int:
+    """Get the score an engine reported for its move in centipawns, from White's point of view.
+
+    Returns:
+        int: The score, or None if the engine did not report one.
+    """
+    score = info.get("score")
+    if score is None:
+        return None
+    return score.white().score(mate_score=MATE_SCORE)
+
+
+class Adjudicator:
+    """Decide when a game can be stopped early. Use one adjudicator per game."""
+
+    def __init__(self, config: AdjudicationConfig):
+        self.config = config
+        self.material_plies = 0
+        self.material_sign = 0
+        self.score_plies = 0
+        self.score_sign = 0
+
+    @staticmethod
+    def _update_streak(value, threshold, plies, sign):
+        """Count how long a value has stayed past a threshold on the same side."""
+        if value is None or abs(value) < threshold:
+            return 0, 0
+        value_sign = 1 if value > 0 else -1
+        if value_sign != sign:
+            return 1, value_sign
+        return plies + 1, sign
+
+    def adjudicate(self, board: chess.Board, engine_score: int = None) -> tuple[str, str]:
+        """Check the adjudication rules after a move has been played.
+
+        A game that is already over by the rules of chess is never adjudicated, so its
+        result comes from the board.
+
+        Args:
+            board (chess.Board): The board after the move.
+            engine_score (int, optional): The score the engine reported for the move, in
+                centipawns from White's point of view. Pass None after the network's moves.
+
+        Returns:
+            tuple[str, str]: The adjudicated result and the reason, or None if the game goes on.
+        """
+        if board.is_game_over():
+            return None
+
+        config = self.config
+
+        if config.claim_draw:
+            if board.halfmove_clock >= 100:
+                return "1/2-1/2", "50-move rule"
+            if board.is_repetition(3):
+                return "1/2-1/2", "threefold repetition"
+
+        if config.max_plies is not None and board.ply() >= config.max_plies:
+            return "1/2-1/2", "move cap"
+
+        if config.no_progress_plies is not None and board.halfmove_clock >= config.no_progress_plies:
+            return "1/2-1/2", "no progress"
+
+        if config.resign_material is not None:
+            self.material_plies, self.material_sign = self._update_streak(
+                material_balance(board), config.resign_material, self.material_plies, self.material_sign
+            )
+            if self.material_plies >= config.resign_plies:
+                return ("1-0" if self.material_sign > 0 else "0-1"), "material"
+
+        if config.resign_score is not None and engine_score is not None:
+            self.score_plies, self.score_sign = self._update_streak(
+                engine_score, config.resign_score, self.score_plies, self.score_sign
+            )
+            if self.score_plies >= config.resign_plies:
+                return ("1-0" if self.score_sign > 0 else "0-1"), "engine score"
+
+        return None
@@ -0,0 +1,220 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import chess
+
+from engines.engine_pool import AsyncEnginePool
+from engines.load_engine import get_max_index, get_engine_info_by_index, get_engine_limit_by_index
+from tournaments.adjudication import engine_score_from_info
+from tournaments.tournament import (
+    debug_print,
+    GameState,
+    print_eval_cache_stats,
+    save_game_record,
+    record_finished_game,
+    score_finished_game,
+)
+
+
+class AsyncTournamentRunner:
+    """Run tournaments as asyncio tasks on top of python-chess's coroutine engine API.
+
+    Hundreds of games can be in flight at the same time: engine moves are awaited on the
+    event loop, and the NN side of every game is offloaded to a small thread pool. The number
+    of games played at the same time, and therefore the number of busy engine processes, is
+    bounded by max_concurrency.
+
+    Individual games can be cancelled with cancel_game, or by setting a game_timeout. A
+    cancelled game ends the tournament of its model with the score earned so far.
+
+    The runner starts its own engine pool unless one is passed in. A pool passed in is left
+    open by close, so that its warm engines can serve the next generation on the same event loop.
+    """
+
+    def __init__(self, max_concurrency: int = 32, game_timeout: float = None, nn_workers: int = None, adjudication=None, reply_cache=None, engine_pool: AsyncEnginePool = None, debug: bool = False):
+        self.max_concurrency = max_concurrency
+        self.game_timeout = game_timeout
+        self.adjudication = adjudication
+        self.reply_cache = reply_cache
+        self.debug = debug
+        self.owns_engine_pool = engine_pool is None
+        self.engine_pool = engine_pool if engine_pool is not None else AsyncEnginePool(debug=debug)
+        self.nn_executor = ThreadPoolExecutor(max_workers=nn_workers)
+        self._semaphore = None
+        self._games = {}
+        self._cancelled_games = set()
+
+    def cancel_game(self, nn_name: str) -> bool:
+        """Cancel the game the given model is currently playing.
+
+        Args:
+            nn_name (str): Name of the neural network.
+
+        Returns:
+            bool: Whether a running game was found and cancelled.
+        """
+        game_task = self._games.get(nn_name)
+        if game_task is None or game_task.done():
+            return False
+
+        self._cancelled_games.add(nn_name)
+        return game_task.cancel()
+
+    async def play_game(self, nn_name, generation, model, engine, engine_name, index, color, engine_limit):
+        """Play one game between the model and an engine, like tournament.play_game.
+
+        The network moves and the reply cache lookups block, so they run on threads while
+        other games go on.
+
+        Returns:
+            tuple: The final board, the result and the adjudication reason (None if the game was played out).
+        """
+        loop = asyncio.get_running_loop()
+        game = GameState(model, color, self.adjudication, self.reply_cache, self.debug)
+        # A distinct game key makes python-chess send ucinewgame to a reused engine
+        game_key = (nn_name, generation, index, color)
+
+        while not game.is_over():
+            debug_print(str(game.board), self.debug)
+            if game.model_to_move():
+                game.play_model_move(await loop.run_in_executor(self.nn_executor, game.select_move))
+                continue
+
+            # Cache lookups hit SQLite, they go to the default executor so they never wait behind the network
+            reply = await loop.run_in_executor(None, game.cached_reply, engine_name, engine_limit) if self.reply_cache is not None else None
+            if reply is None:
+                play_result = await engine.play(game.board, engine_limit, game=game_key, info=game.info_flags)
+                reply = (play_result.move, engine_score_from_info(play_result.info))
+                if self.reply_cache is not None:
+                    await loop.run_in_executor(None, game.cache_reply, engine_name, engine_limit, *reply)
+            game.play_engine_move(*reply)
+
+        return game.outcome()
+
+    async def _play_limited_game(self, nn_name, generation, model, engine_name, index, color, engine_limit):
+        async with self._semaphore:
+            async with self.engine_pool.engine(index) as engine:
+                game = self.play_game(nn_name, generation, model, engine, engine_name, index, color, engine_limit)
+                if self.game_timeout is None:
+                    return await game
+                return await asyncio.wait_for(game, self.game_timeout)
+
+    async def run_tournament(self, nn_name, generation, model, start_level=0, record_game=save_game_record):
+        """Run a tournament where the model plays against increasingly harder engines.
+
+        Args:
+            nn_name (str): Name of the neural network.
+            generation (int): Generation number.
+            model (NNUEModel): The NNUE model to evaluate board positions.
+            start_level (int): The starting engine index for the tournament.
+            record_game (Callable): Called with the PGN path and PGN text of every finished game.
+
+        Returns:
+            tuple: Final score and the index of the last engine played against.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        score = 0
+        index = start_level
+        max_index = get_max_index()
+        debug_print(f"Starting tournament for {nn_name} in generation {generation} from level {start_level}...", self.debug)
+
+        while index <= max_index:
+            engine_name = get_engine_info_by_index(index, debug=self.debug)["name"]
+            engine_limit = get_engine_limit_by_index(index, debug=self.debug)
+
+            for color in [chess.WHITE, chess.BLACK]:
+                game_task = asyncio.ensure_future(self._play_limited_game(nn_name, generation, model, engine_name, index, color, engine_limit))
+                self._games[nn_name] = game_task
+                try:
+                    board, result, adjudication_reason = await game_task
+                except asyncio.CancelledError:
+                    if nn_name not in self._cancelled_games:
+                        raise
+                    self._cancelled_games.discard(nn_name)
+                    debug_print(f"Game of {nn_name} against {engine_name} was cancelled.", self.debug)
+                    return score, index
+                except asyncio.TimeoutError:
+                    debug_print(f"Game of {nn_name} against {engine_name} timed out.", self.debug)
+                    return score, index
+                except Exception as e:
+                    debug_print(f"An error occurred: {e}", self.debug)
+                    return score, index
+                finally:
+                    self._games.pop(nn_name, None)
+
+                record_finished_game(board, nn_name, engine_name, generation, color, result, adjudication_reason, record_game, self.debug)
+
+                points = score_finished_game(result, nn_name, color, self.debug)
+                if points is None:
+                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                    print(f"[{timestamp}] {nn_name} lost to engine {engine_name}. Final score: {score}. Tournament over.")
+                    print_eval_cache_stats(nn_name, model, self.debug)
+                    return score, index
+                score += points
+
+            debug_print(f"Current score: {score}", self.debug)
+            index += 1
+
+        print(f"Final score for {nn_name}: {score}")
+        print_eval_cache_stats(nn_name, model, self.debug)
+        return score, index
+
+    async def run_tournaments(self, population, generation):
+        """Run the tournaments of the whole population concurrently.
+
+        Args:
+            population (list[PopulationModel]): The models to evaluate.
+            generation (int): Generation number.
+
+        Returns:
+            list[tuple[int, int]]: The final score and last engine index of every model, in population order.
+        """
+        return await asyncio.gather(
+            *(self.run_tournament(model.name, generation, model.model) for model in population)
+        )
+
+    async def close(self):
+        """Shut down the NN thread pool, and the engines when the runner started them."""
+        if self.owns_engine_pool:
+            await self.engine_pool.close()
+        self.nn_executor.shutdown()
+
+
+def run_tournaments_async(population, generation, max_concurrency=32, game_timeout=None, adjudication=None, reply_cache=None, engine_pool=None, loop=None, debug=False):
+    """Run the tournaments of a population on an event loop and wait for the results.
+
+    Args:
+        population (list[PopulationModel]): The models to evaluate.
+        generation (int): Generation number.
+        max_concurrency (int): The maximum number of games played at the same time.
+        game_timeout (float, optional): Cancel games that take longer than this many seconds.
+        adjudication (AdjudicationConfig, optional): Rules to stop decided games early.
+        reply_cache (EngineReplyCache, optional): Cache of engine replies shared between tournaments.
+        engine_pool (AsyncEnginePool, optional): Pool of warm engines shared between generations. Its
+            engines belong to the event loop they were started on, so it needs a loop.
+        loop (asyncio.AbstractEventLoop, optional): The event loop to run on, the same for every
+            generation that shares the engine pool. Defaults to a fresh event loop.
+        debug (bool): Enable debug mode.
+
+    Raises:
+        ValueError: If an engine pool is given without an event loop.
+
+    Returns:
+        list[tuple[int, int]]: The final score and last engine index of every model, in population order.
+    """
+    if engine_pool is not None and loop is None:
+        raise ValueError("A shared engine pool needs the event loop its engines run on.")
+
+    async def run():
+        runner = AsyncTournamentRunner(max_concurrency, game_timeout, adjudication=adjudication, reply_cache=reply_cache, engine_pool=engine_pool, debug=debug)
+        try:
+            return await runner.run_tournaments(population, generation)
+        finally:
+            await runner.close()
+
+    if loop is None:
+        return asyncio.run(run())
+    return loop.run_until_complete(run())
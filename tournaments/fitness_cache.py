@@ -0,0 +1,72 @@
+class FitnessCache:
+    """Remember tournament results by the content hash of the model weights.
+
+    Survivors carry their weights over to the next generation unchanged, so their tournament
+    does not need to be played again. A model is evaluated up to 1 + reevaluations times
+    over the generations it survives, and its fitness is the average of its results, which
+    evens out the noise of single tournaments.
+    """
+
+    def __init__(self, reevaluations: int = 0):
+        self.reevaluations = reevaluations
+        self.results = {}
+        self.hits = 0
+        self.misses = 0
+
+    def needs_evaluation(self, weights_hash: str) -> bool:
+        """Check whether a model still has to play its tournament."""
+        return len(self.results.get(weights_hash, ())) <= self.reevaluations
+
+    def record(self, weights_hash: str, score: float, level: int):
+        """Store the result of a tournament played by a model."""
+        self.results.setdefault(weights_hash, []).append((score, level))
+
+    def fitness(self, weights_hash: str) -> tuple[float, int]:
+        """Get the average score and level of a model over its recorded tournaments.
+
+        Returns:
+            tuple[float, int]: The average score and the rounded average level, or None if the
+            model never played a tournament.
+        """
+        results = self.results.get(weights_hash)
+        if not results:
+            return None
+        score = sum(score for score, _ in results) / len(results)
+        level = round(sum(level for _, level in results) / len(results))
+        return score, level
+
+    def split(self, population: list) -> tuple[dict, list[str]]:
+        """Split a population into the models that have to play and the hashes of all models.
+
+        Models with identical weights in the same generation only play once.
+
+        Args:
+            population (list[PopulationModel]): The models of the generation.
+
+        Returns:
+            tuple[dict, list[str]]: The models to evaluate by weights hash, and the weights hash of
+            every model in population order.
+        """
+        weights_hashes = []
+        to_evaluate = {}
+        for model in population:
+            weights_hash = model.model.weights_hash()
+            weights_hashes.append(weights_hash)
+            if weights_hash in to_evaluate:
+                continue
+            if self.needs_evaluation(weights_hash):
+                to_evaluate[weights_hash] = model
+                self.misses += 1
+            else:
+                self.hits += 1
+        return to_evaluate, weights_hashes
+
+    def stats(self) -> dict:
+        """Get the number of reused and evaluated models and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.results),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,268 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import chess
+import chess.engine
+import torch
+from torch import nn, Tensor
+from torch.nn.utils.rnn import pad_sequence
+
+from engines.engine_pool import EnginePool
+from engines.load_engine import get_max_index, get_engine_info_by_index, get_engine_limit_by_index
+from neural_network.accumulator import Accumulator
+from neural_network.model import NNUEModel
+from tournaments.adjudication import Adjudicator, engine_score_from_info
+from tournaments.tournament import debug_print, record_finished_game, save_game_record, score_finished_game
+
+
+class StackedModels:
+    """Weights of models with the same architecture stacked into [N, out, in] tensors.
+
+    The first layer of every game is kept up to date by its accumulator. The layers after
+    the first one are evaluated for the candidate positions of all games at once, with one
+    batched matmul per layer over the weights of the model playing each game.
+    """
+
+    def __init__(self, models: list[NNUEModel]):
+        if len({repr(model.architecture()) for model in models}) != 1:
+            raise ValueError("Lockstep evaluation needs models with the same architecture.")
+        # The stacked layers are float, a quantized model would silently play with its float weights
+        if any(model.inference != "float" for model in models):
+            raise ValueError("Lockstep evaluation only supports float inference.")
+        # Every game keeps its first layer up to date with an accumulator
+        if not all(model.supports_accumulator() for model in models):
+            raise ValueError("Lockstep evaluation needs models that take the square encoding, see NNUEModel.supports_accumulator.")
+
+        layers = [[layer for layer in model.model if isinstance(layer, nn.Linear)] for model in models]
+        with torch.no_grad():
+            self.weights = [torch.stack([model_layers[i].weight.detach() for model_layers in layers]) for i in range(1, len(layers[0]))]
+            self.biases = [torch.stack([model_layers[i].bias.detach() for model_layers in layers]) for i in range(1, len(layers[0]))]
+
+    @torch.no_grad()
+    def score_children(self, model_indices: list[int], children: list[Tensor]) -> list[int]:
+        """Pick the best child position of every game.
+
+        Args:
+            model_indices (list[int]): The index of the model playing each game.
+            children (list[Tensor]): The [moves, hidden] first-layer outputs of the child positions of each game.
+
+        Returns:
+            list[int]: The index of the best scoring child of every game. Ties go to the first child.
+        """
+        counts = torch.tensor([len(game_children) for game_children in children])
+        indices = torch.tensor(model_indices, dtype=torch.long)
+
+        # Games have different numbers of legal moves, pad them to a [games, max moves, hidden] batch
+        x = pad_sequence(children, batch_first=True)
+        for i, (weight, bias) in enumerate(zip(self.weights, self.biases)):
+            x = torch.baddbmm(bias[indices].unsqueeze(1), torch.relu(x) if i == 0 else x, weight[indices].transpose(1, 2))
+            if i < len(self.weights) - 1:
+                x = torch.relu(x)
+
+        scores = x.squeeze(2)
+        padding = torch.arange(scores.shape[1]).unsqueeze(0) >= counts.unsqueeze(1)
+        scores = scores.masked_fill(padding, float("-inf"))
+        return torch.argmax(scores, dim=1).tolist()
+
+
+class _Ladder:
+    """Progress of one model through the engine ladder."""
+
+    def __init__(self, slot, nn_name, model, start_level):
+        self.slot = slot
+        self.nn_name = nn_name
+        self.model = model
+        self.score = 0
+        self.index = start_level
+        self.color = chess.WHITE
+        self.result = None
+
+
+class _Game:
+    """A game in progress between a model and an engine."""
+
+    def __init__(self, ladder, engine_name, engine_limit, adjudication, generation):
+        self.ladder = ladder
+        self.engine_name = engine_name
+        self.engine_limit = engine_limit
+        self.board = chess.Board()
+        # The stacked layers are float, so the accumulator is too
+        self.accumulator = Accumulator.from_layer(ladder.model.model[0], self.board)
+        self.adjudicator = Adjudicator(adjudication) if adjudication is not None else None
+        # A distinct game key makes python-chess send ucinewgame to a reused engine
+        self.game_key = (ladder.nn_name, generation, ladder.index, ladder.color)
+        self.outcome = None
+        self.error = None
+
+
+class LockstepTournament:
+    """Run the tournaments of a whole population together, one ply-round at a time.
+
+    Every model climbs the same engine ladder as in tournament.run_tournament, and every
+    model has one game in progress at a time. Each round, the network moves of all games are
+    chosen with one batched evaluation over the stacked model weights, then the engine
+    replies of all games are requested in parallel from a thread pool.
+
+    Engines are checked out of the pool for a single move, not for a whole game, so at most
+    max_workers engine processes are busy at a time whatever the size of the population.
+    An engine that moves in another game than its previous move starts a new game, and
+    searches the move from a clean state.
+    """
+
+    def __init__(self, population: list, generation: int, engine_pool: EnginePool = None, adjudication=None, reply_cache=None,
+                 max_workers: int = None, start_level: int = 0, record_game=save_game_record, debug: bool = False):
+        self.population = population
+        self.generation = generation
+        self.engine_pool = engine_pool
+        self.adjudication = adjudication
+        self.reply_cache = reply_cache
+        self.max_workers = max_workers
+        self.start_level = start_level
+        self.record_game = record_game
+        self.debug = debug
+        self.max_index = get_max_index()
+        # The engine score is only needed by the score-based resign rule and the reply cache
+        needs_score = reply_cache is not None or (adjudication is not None and adjudication.resign_score is not None)
+        self.info_flags = chess.engine.INFO_SCORE if needs_score else chess.engine.INFO_NONE
+
+    def run(self) -> list[tuple[int, int]]:
+        """Play all tournaments to the end.
+
+        Returns:
+            list[tuple[int, int]]: The final score and last engine index of every model, in population order.
+        """
+        owns_pool = self.engine_pool is None
+        if owns_pool:
+            self.engine_pool = EnginePool(debug=self.debug)
+
+        stacked_models = StackedModels([model.model for model in self.population])
+        ladders = [_Ladder(slot, model.name, model.model, self.start_level) for slot, model in enumerate(self.population)]
+        games = [game for game in (self._start_game(ladder) for ladder in ladders) if game is not None]
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while games:
+                    nn_games = [game for game in games if game.board.turn == game.ladder.color]
+                    if nn_games:
+                        self._play_nn_moves(stacked_models, nn_games)
+
+                    engine_games = [game for game in games if game.outcome is None and game.board.turn != game.ladder.color]
+                    list(executor.map(self._play_engine_move, engine_games))
+
+                    next_games = []
+                    for game in games:
+                        if game.outcome is None and game.error is None:
+                            next_games.append(game)
+                            continue
+                        next_game = self._finish_game(game)
+                        if next_game is not None:
+                            next_games.append(next_game)
+                    games = next_games
+        finally:
+            if owns_pool:
+                self.engine_pool.close()
+
+        return [ladder.result for ladder in ladders]
+
+    def _start_game(self, ladder):
+        """Start the next game of a ladder, or finish the ladder when no engine is left."""
+        if ladder.index > self.max_index:
+            print(f"Final score for {ladder.nn_name}: {ladder.score}")
+            ladder.result = (ladder.score, ladder.index)
+            return None
+
+        try:
+            engine_name = get_engine_info_by_index(ladder.index, debug=self.debug)["name"]
+            engine_limit = get_engine_limit_by_index(ladder.index, debug=self.debug)
+        except Exception as e:
+            debug_print(f"An error occurred: {e}", self.debug)
+            ladder.result = (ladder.score, ladder.index)
+            return None
+
+        debug_print(f"{ladder.nn_name} plays against engine at index {ladder.index} ({engine_name}) as {'White' if ladder.color == chess.WHITE else 'Black'}...", self.debug)
+        return _Game(ladder, engine_name, engine_limit, self.adjudication, self.generation)
+
+    def _play_nn_moves(self, stacked_models, games):
+        """Play the network move of every game, evaluating all candidate positions together."""
+        legal_moves = [list(game.board.legal_moves) for game in games]
+        children = [game.accumulator.children(game.board, moves) for game, moves in zip(games, legal_moves)]
+        best_children = stacked_models.score_children([game.ladder.slot for game in games], children)
+
+        for game, moves, best_child in zip(games, legal_moves, best_children):
+            game.accumulator.push(game.board, moves[best_child])
+            self._check_outcome(game, None)
+
+    def _play_engine_move(self, game):
+        """Play the engine move of a game. Runs in a worker thread."""
+        try:
+            reply = self.reply_cache.get(game.engine_name, game.board, game.engine_limit) if self.reply_cache is not None else None
+            if reply is None:
+                with self.engine_pool.engine(game.ladder.index) as engine:
+                    play_result = engine.play(game.board, game.engine_limit, game=game.game_key, info=self.info_flags)
+                reply = (play_result.move, engine_score_from_info(play_result.info))
+                if self.reply_cache is not None:
+                    self.reply_cache.put(game.engine_name, game.board, game.engine_limit, *reply)
+        except Exception as e:
+            game.error = e
+            return
+
+        engine_move, engine_score = reply
+        game.accumulator.push(game.board, engine_move)
+        self._check_outcome(game, engine_score)
+
+    def _check_outcome(self, game, engine_score):
+        if game.adjudicator is not None:
+            verdict = game.adjudicator.adjudicate(game.board, engine_score)
+            if verdict is not None:
+                debug_print(f"Game of {game.ladder.nn_name} adjudicated: {verdict[0]} ({verdict[1]})", self.debug)
+                game.outcome = verdict
+                return
+        if game.board.is_game_over():
+            game.outcome = (game.board.result(), None)
+
+    def _finish_game(self, game):
+        """Record a finished game and move its ladder on. Returns the next game of the ladder, if any."""
+        ladder = game.ladder
+        if game.error is not None:
+            debug_print(f"An error occurred: {game.error}", self.debug)
+            ladder.result = (ladder.score, ladder.index)
+            return None
+
+        result, adjudication_reason = game.outcome
+        record_finished_game(game.board, ladder.nn_name, game.engine_name, self.generation, ladder.color, result, adjudication_reason, self.record_game, self.debug)
+
+        points = score_finished_game(result, ladder.nn_name, ladder.color, self.debug)
+        if points is None:
+            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            print(f"[{timestamp}] {ladder.nn_name} lost to engine {game.engine_name}. Final score: {ladder.score}. Tournament over.")
+            ladder.result = (ladder.score, ladder.index)
+            return None
+        ladder.score += points
+
+        if ladder.color == chess.WHITE:
+            ladder.color = chess.BLACK
+        else:
+            debug_print(f"Current score of {ladder.nn_name}: {ladder.score}", self.debug)
+            ladder.color = chess.WHITE
+            ladder.index += 1
+        return self._start_game(ladder)
+
+
+def run_tournaments_lockstep(population, generation, engine_pool=None, adjudication=None, reply_cache=None, max_workers=None, debug=False):
+    """Run the tournaments of a population in lockstep and wait for the results.
+
+    Args:
+        population (list[PopulationModel]): The models to evaluate. They must share one architecture.
+        generation (int): Generation number.
+        engine_pool (EnginePool, optional): Pool of warm engines shared between generations.
+        adjudication (AdjudicationConfig, optional): Rules to stop decided games early.
+        reply_cache (EngineReplyCache, optional): Cache of engine replies shared between tournaments.
+        max_workers (int, optional): The maximum number of engine moves requested at the same time.
+        debug (bool): Enable debug mode.
+
+    Returns:
+        list[tuple[int, int]]: The final score and last engine index of every model, in population order.
+    """
+    return LockstepTournament(
+        population, generation, engine_pool, adjudication, reply_cache, max_workers, debug=debug
+    ).run()
@@ -0,0 +1,169 @@
+import io
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.util import Finalize
+
+import torch
+
+from engines.engine_pool import EnginePool
+from engines.reply_cache import EngineReplyCache
+from neural_network.features import get_feature_set_from_name
+from neural_network.model import NNUEModel, SparseLinear
+import tournaments.tournament as tournament
+
+# Heavy modules imported once by the forkserver so that every worker starts with them loaded
+PRELOADED_MODULES = [
+    "torch",
+    "chess",
+    "chess.engine",
+    "chess.pgn",
+    "neural_network.model",
+    "tournaments.tournament",
+]
+
+# Engine pool and reply cache of the current worker process, created by _init_worker
+_worker_engine_pool = None
+_worker_reply_cache = None
+
+
+def pack_model(model: NNUEModel) -> tuple:
+    """Pack a model into picklable bytes so that it can be shipped to a worker process.
+
+    Besides the weights, the packed model keeps the feature set, the sparse first layer
+    and the inference backend. A quantized model is packed with the config it was quantized
+    with, including the activation ranges measured on its calibration inputs.
+
+    Args:
+        model (NNUEModel): The model to pack.
+
+    Returns:
+        tuple: The model architecture, its serialized weights, the name of its feature set,
+            whether its first layer is sparse, its inference backend and quantization config.
+    """
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    feature_set_name = model.feature_set.name if model.feature_set is not None else None
+    config = model.get_quantized_network().config if model.inference == "quantized" else model.quantization_config
+    return (
+        model.architecture(), buffer.getvalue(), feature_set_name,
+        isinstance(model.model[0], SparseLinear), model.inference, config,
+    )
+
+
+def unpack_model(packed_model: tuple) -> NNUEModel:
+    """Rebuild a model packed with pack_model.
+
+    Args:
+        packed_model (tuple): The packed model, see pack_model.
+
+    Returns:
+        NNUEModel: The reconstructed model.
+    """
+    (input_size, hidden_sizes, output_size), weights, feature_set_name, sparse_input, inference, config = packed_model
+    feature_set = get_feature_set_from_name(feature_set_name) if feature_set_name is not None else None
+    model = NNUEModel(input_size, hidden_sizes, output_size, feature_set, sparse_input)
+    model.load_state_dict(torch.load(io.BytesIO(weights)))
+    if inference != "float" or config is not None:
+        model.set_inference(inference, config)
+    return model
+
+
+def _init_worker(reply_cache_settings, debug):
+    """Set up a worker process with its own engine pool and reply cache, closed when the worker exits."""
+    global _worker_engine_pool, _worker_reply_cache
+
+    # Every worker plays its own games, intra-op threads would only oversubscribe the cores
+    torch.set_num_threads(1)
+
+    _worker_engine_pool = EnginePool(debug=debug)
+    Finalize(_worker_engine_pool, _worker_engine_pool.close, exitpriority=10)
+
+    if reply_cache_settings is not None:
+        _worker_reply_cache = EngineReplyCache(**reply_cache_settings)
+        Finalize(_worker_reply_cache, _worker_reply_cache.close, exitpriority=10)
+
+
+def _run_tournament_in_worker(nn_name, generation, packed_model, adjudication, debug):
+    """Run one tournament in a worker process.
+
+    Returns:
+        tuple: Final score, the index of the last engine played against and the game records.
+    """
+    game_records = []
+    score, level = tournament.run_tournament(
+        nn_name,
+        generation,
+        unpack_model(packed_model),
+        debug=debug,
+        engine_pool=_worker_engine_pool,
+        record_game=lambda pgn_path, pgn_text: game_records.append((pgn_path, pgn_text)),
+        adjudication=adjudication,
+        reply_cache=_worker_reply_cache,
+    )
+    return score, level, game_records
+
+
+def _get_mp_context():
+    # forkserver is not available on Windows, fall back to spawn there
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(PRELOADED_MODULES)
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+class ProcessTournamentExecutor:
+    """Run the tournaments of a population in worker processes instead of threads.
+
+    The NN side of a game is mostly Python, so threads serialize on the GIL. Worker
+    processes each keep their own warm engine pool for the whole training run. Models are
+    shipped to the workers as bytes, and only the score, level and game records come back.
+    Game records are written to disk by the parent process.
+
+    Each worker opens its own engine reply cache from reply_cache_settings, the keyword
+    arguments of EngineReplyCache, so that all workers share the same store on disk.
+    """
+
+    def __init__(self, max_workers: int = None, adjudication=None, reply_cache_settings: dict = None, debug: bool = False):
+        self.adjudication = adjudication
+        self.debug = debug
+        self.executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=_get_mp_context(),
+            initializer=_init_worker,
+            initargs=(reply_cache_settings, debug),
+        )
+
+    def run_tournaments(self, population: list, generation: int) -> list[tuple[int, int]]:
+        """Run the tournament of every model in the population.
+
+        Args:
+            population (list[PopulationModel]): The models to evaluate.
+            generation (int): Generation number.
+
+        Returns:
+            list[tuple[int, int]]: The final score and last engine index of every model, in population order.
+        """
+        futures = [
+            self.executor.submit(_run_tournament_in_worker, model.name, generation, pack_model(model.model), self.adjudication, self.debug)
+            for model in population
+        ]
+
+        results = []
+        for future in futures:
+            score, level, game_records = future.result()
+            for pgn_path, pgn_text in game_records:
+                tournament.save_game_record(pgn_path, pgn_text)
+            results.append((score, level))
+
+        return results
+
+    def shutdown(self):
+        """Stop the worker processes and their engines."""
+        self.executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
@@ -1,9 +1,12 @@
 import chess
 import chess.engine
 import os
-from engines.load_engine import load_engine_by_index, get_max_index, get_engine_info_by_index
+from contextlib import contextmanager
+from engines.load_engine import load_engine_by_index, get_max_index, get_engine_info_by_index, get_engine_limit_by_index
 from chess.pgn import Game
+from neural_network.accumulator import piece_feature
 from neural_network.model import NNUEModel
+from tournaments.adjudication import Adjudicator, engine_score_from_info
 import torch
 from datetime import datetime
 
@@ -38,15 +41,218 @@ def convert_board_to_features(board):
     features = [0] * 512  # Example: Zero-filled features for HalfKP
 
     # Example: Populate features based on board state
-    for square in chess.SQUARES:
-        piece = board.piece_at(square)
-        if piece:
-            # Example: Encode piece type and color into features
-            features[square] = piece.piece_type * (1 if piece.color == chess.WHITE else -1)
+    for square, piece in board.piece_map().items():
+        # Example: Encode piece type and color into features
+        features[square] = piece_feature(piece)
 
     return features
 
-def run_tournament(nn_name, generation, model, debug=False, start_level=0):
+@contextmanager
+def engine_session(index, engine_pool=None, debug=False):
+    """Provide the engine at the given index for the duration of a with block.
+
+    Args:
+        index (int): The index of the engine in enginelist.csv.
+        engine_pool (EnginePool, optional): Pool to borrow a warm engine from. When omitted a
+            new engine process is started and shut down afterwards.
+        debug (bool): Enable debug mode.
+    """
+    if engine_pool is not None:
+        with engine_pool.engine(index) as engine:
+            yield engine
+        return
+
+    engine = load_engine_by_index(index, debug=debug)
+    try:
+        yield engine
+    finally:
+        engine.quit()
+
+def save_game_record(pgn_path, pgn_text):
+    """Write the PGN of a finished game to disk, creating the result directories as needed."""
+    os.makedirs(os.path.dirname(pgn_path), exist_ok=True)
+    with open(pgn_path, "w") as pgn_file:
+        pgn_file.write(pgn_text)
+
+def record_finished_game(board, nn_name, engine_name, generation, color, result, adjudication_reason=None, record_game=save_game_record, debug=False):
+    """Build the PGN of a finished game and hand it to record_game.
+
+    Args:
+        board (chess.Board): The board at the end of the game.
+        nn_name (str): Name of the neural network.
+        engine_name (str): Name of the engine the network played against.
+        generation (int): Generation number.
+        color (chess.Color): The color the network played.
+        result (str): The result of the game.
+        adjudication_reason (str, optional): Why the game was adjudicated, if it was.
+        record_game (Callable): Called with the PGN path and PGN text of the game.
+        debug (bool): Enable debug mode.
+    """
+    pgn_dir = os.path.join("tournament_results", f"generation{generation}", nn_name)
+
+    # Save the full PGN
+    game = Game.from_board(board)
+    game.headers["Event"] = "Tournament"
+    game.headers["White"] = nn_name if color == chess.WHITE else engine_name
+    game.headers["Black"] = engine_name if color == chess.WHITE else nn_name
+    game.headers["Result"] = result
+    if adjudication_reason is not None:
+        game.headers["Termination"] = "adjudication"
+        game.headers["Adjudication"] = adjudication_reason
+
+    pgn_path = os.path.join(pgn_dir, f"{engine_name}_{'white' if color == chess.WHITE else 'black'}.pgn")
+    record_game(pgn_path, str(game))
+
+    debug_print(f"Game recorded to {pgn_path}", debug)
+
+def score_finished_game(result, nn_name, color, debug=False):
+    """Get the points the network earned in a finished game.
+
+    Returns:
+        int: The points earned, or None when the network lost and the tournament is over.
+    """
+    if result == "1-0" and color == chess.WHITE:
+        debug_print(f"{nn_name} won as White! Now play as Black.", debug)
+        return 10
+    elif result == "1-0" and color == chess.BLACK:
+        debug_print(f"{nn_name} won as Black! Moving to the next engine.", debug)
+        return 10
+    elif result == "1/2-1/2":
+        debug_print(f"It's a draw! {nn_name} earn 1 point.", debug)
+        return 1
+    return None
+
+def print_eval_cache_stats(nn_name, model, debug=False):
+    """Print the evaluation cache statistics of a model, in debug mode.
+
+    Models that take the square encoding score their moves incrementally with an
+    accumulator, which skips the cache, so they have no statistics to print.
+    """
+    if not model.supports_accumulator():
+        debug_print(f"Eval cache statistics for {nn_name}: {model.eval_cache.stats()}", debug)
+
+class GameState:
+    """A game between a model and an engine, between two moves.
+
+    Holds the board, the accumulator of the model and the adjudicator, and plays the moves
+    of both sides on them. The threaded and asyncio tournaments share it, and only differ in
+    how they wait for the network and the engine to move.
+    """
+
+    def __init__(self, model, color, adjudication=None, reply_cache=None, debug=False):
+        """Set up the starting position.
+
+        Args:
+            model (NNUEModel): The NNUE model to evaluate board positions.
+            color (chess.Color): The color the model plays.
+            adjudication (AdjudicationConfig, optional): Rules to stop decided games early.
+            reply_cache (EngineReplyCache, optional): Cache of engine replies to skip the engine on known positions.
+            debug (bool): Enable debug mode.
+        """
+        self.model = model
+        self.color = color
+        self.reply_cache = reply_cache
+        self.debug = debug
+        self.board = chess.Board()
+        # Tracks the first-layer output of the model through the game, so moves are scored incrementally.
+        # Models that do not take the square encoding evaluate every child position in full instead.
+        self.accumulator = model.create_accumulator(self.board) if model.supports_accumulator() else None
+        self.adjudicator = Adjudicator(adjudication) if adjudication is not None else None
+        # The engine score is only needed by the score-based resign rule and the reply cache
+        needs_score = reply_cache is not None or (adjudication is not None and adjudication.resign_score is not None)
+        self.info_flags = chess.engine.INFO_SCORE if needs_score else chess.engine.INFO_NONE
+        self.verdict = None
+
+    def is_over(self):
+        """Check whether the game ended on the board or was adjudicated."""
+        return self.verdict is not None or self.board.is_game_over()
+
+    def model_to_move(self):
+        return self.board.turn == self.color
+
+    def select_move(self):
+        """Pick the move of the model, evaluating all future positions in one batched forward pass."""
+        legal_moves = list(self.board.legal_moves)
+        debug_print(f"Legal moves: {legal_moves}", self.debug)
+        return self.model.select_move(self.board, convert_board_to_features, legal_moves, self.accumulator)
+
+    def cached_reply(self, engine_name, engine_limit):
+        """Get the cached engine reply to the current position.
+
+        Returns:
+            tuple: The move and engine score, or None when the reply is not cached.
+        """
+        if self.reply_cache is None:
+            return None
+        return self.reply_cache.get(engine_name, self.board, engine_limit)
+
+    def cache_reply(self, engine_name, engine_limit, move, engine_score):
+        """Store the engine reply to the current position, before it is played."""
+        if self.reply_cache is not None:
+            self.reply_cache.put(engine_name, self.board, engine_limit, move, engine_score)
+
+    def play_model_move(self, move):
+        debug_print(f"Best move: {move}", self.debug)
+        self._play(move, None)
+
+    def play_engine_move(self, move, engine_score):
+        debug_print(f"Engine plays: {move}", self.debug)
+        self._play(move, engine_score)
+
+    def _play(self, move, engine_score):
+        if self.accumulator is not None:
+            self.accumulator.push(self.board, move)
+        else:
+            self.board.push(move)
+
+        if self.adjudicator is not None:
+            self.verdict = self.adjudicator.adjudicate(self.board, engine_score)
+            if self.verdict is not None:
+                debug_print(f"Game adjudicated: {self.verdict[0]} ({self.verdict[1]})", self.debug)
+
+    def outcome(self):
+        """Get the final board, the result and the adjudication reason (None if the game was played out)."""
+        if self.verdict is not None:
+            return self.board, *self.verdict
+        debug_print("Game over!", self.debug)
+        debug_print(self.board.result(), self.debug)
+        return self.board, self.board.result(), None
+
+def play_game(model, engine, engine_limit, color, game_key, adjudication=None, debug=False, engine_name=None, reply_cache=None):
+    """Play one game between the model and an engine.
+
+    Args:
+        model (NNUEModel): The NNUE model to evaluate board positions.
+        engine (chess.engine.SimpleEngine): The engine to play against.
+        engine_limit (chess.engine.Limit): The search limit of the engine.
+        color (chess.Color): The color the model plays.
+        game_key (object): Key passed to the engine so it knows when a new game starts.
+        adjudication (AdjudicationConfig, optional): Rules to stop decided games early.
+        debug (bool): Enable debug mode.
+        engine_name (str, optional): Name of the engine, used as the reply cache key.
+        reply_cache (EngineReplyCache, optional): Cache of engine replies to skip the engine on known positions.
+
+    Returns:
+        tuple: The final board, the result and the adjudication reason (None if the game was played out).
+    """
+    game = GameState(model, color, adjudication, reply_cache, debug)
+
+    while not game.is_over():
+        debug_print(str(game.board), debug)
+        if game.model_to_move():
+            game.play_model_move(game.select_move())
+            continue
+
+        reply = game.cached_reply(engine_name, engine_limit)
+        if reply is None:
+            play_result = engine.play(game.board, engine_limit, game=game_key, info=game.info_flags)
+            reply = (play_result.move, engine_score_from_info(play_result.info))
+            game.cache_reply(engine_name, engine_limit, *reply)
+        game.play_engine_move(*reply)
+
+    return game.outcome()
+
+def run_tournament(nn_name, generation, model, debug=False, start_level=0, engine_pool=None, record_game=save_game_record, adjudication=None, reply_cache=None):
     """Run a tournament where the user plays against increasingly harder engines.
 
     Args:
@@ -55,6 +261,10 @@ def run_tournament(nn_name, generation, model, debug=False, start_level=0):
         model (NNUEModel): The NNUE model to evaluate board positions.
         debug (bool): Enable debug mode.
         start_level (int): The starting engine index for the tournament.
+        engine_pool (EnginePool, optional): Pool of warm engines shared between tournaments.
+        record_game (Callable): Called with the PGN path and PGN text of every finished game.
+        adjudication (AdjudicationConfig, optional): Rules to stop decided games early.
+        reply_cache (EngineReplyCache, optional): Cache of engine replies shared between tournaments.
 
     Returns:
         tuple: Final score and the index of the last engine played against.
@@ -72,81 +282,32 @@ def run_tournament(nn_name, generation, model, debug=False, start_level=0):
             # Get engine details
             engine_info = get_engine_info_by_index(index, debug=debug)
             engine_name = engine_info["name"]
+            engine_limit = get_engine_limit_by_index(index, debug=debug)
             debug_print(f"Loading engine at index {index} ({engine_name})...", debug)
 
-            engine = load_engine_by_index(index, debug=debug)
-
-            for color in [chess.WHITE, chess.BLACK]:
-                board = chess.Board()
-                debug_print(f"Playing against engine at index {index} ({engine_name}) as {'White' if color == chess.WHITE else 'Black'}...", debug)
-
-                while not board.is_game_over():
-                    debug_print(str(board), debug)
-
-                    if board.turn == color:
-                        # Generate all legal moves
-                        legal_moves = list(board.legal_moves)
-                        debug_print(f"Legal moves: {legal_moves}", debug)
-
-                        # Evaluate all future positions
-                        scored_moves = []
-                        for move in legal_moves:
-                            board.push(move)
-                            board_features = torch.tensor(convert_board_to_features(board), dtype=torch.float32)
-                            evaluation_score = model.evaluate_board(board_features)
-                            scored_moves.append((evaluation_score, move))
-                            board.pop()
-
-                        # Pick the move with the highest score
-                        best_move = max(scored_moves, key=lambda x: x[0])[1]
-                        debug_print(f"Best move: {best_move}", debug)
-
-                        # Play the best move
-                        board.push(best_move)
-                    else:
-                        result = engine.play(board, chess.engine.Limit(time=1.0))
-                        board.push(result.move)
-                        debug_print(f"Engine plays: {result.move}", debug)
-
-                debug_print("Game over!", debug)
-                debug_print(board.result(), debug)
-
-                # Create directory structure for PGN storage
-                pgn_dir = os.path.join("tournament_results", f"generation{generation}", nn_name)
-                os.makedirs(pgn_dir, exist_ok=True)
-
-                # Save the full PGN
-                game = Game.from_board(board)
-                game.headers["Event"] = "Tournament"
-                game.headers["White"] = nn_name if color == chess.WHITE else engine_name
-                game.headers["Black"] = engine_name if color == chess.WHITE else nn_name
-                game.headers["Result"] = board.result()
-
-                pgn_path = os.path.join(pgn_dir, f"{engine_name}_{'white' if color == chess.WHITE else 'black'}.pgn")
-                with open(pgn_path, "w") as pgn_file:
-                    pgn_file.write(str(game))
-
-                debug_print(f"Game saved to {pgn_path}", debug)
-
-                if board.result() == "1-0" and color == chess.WHITE:
-                    debug_print("{nn_name} won as White! Now play as Black.", debug)
-                    score += 10
-                elif board.result() == "1-0" and color == chess.BLACK:
-                    debug_print("{nn_name} won as Black! Moving to the next engine.", debug)
-                    score += 10
-                elif board.result() == "1/2-1/2":
-                    debug_print("It's a draw! {nn_name} earn 1 point.", debug)
-                    score += 1
-                else:
-                    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    print(f"[{timestamp}] {nn_name} lost to engine {engine_name}. Final score: {score}. Tournament over.")
-                    engine.quit()
-                    debug_print(f"Final score for {nn_name}: {score}", debug)
-                    return score, index
-
-            debug_print(f"Current score: {score}", debug)
-            index += 1
-            engine.quit()
+            with engine_session(index, engine_pool, debug) as engine:
+                for color in [chess.WHITE, chess.BLACK]:
+                    debug_print(f"Playing against engine at index {index} ({engine_name}) as {'White' if color == chess.WHITE else 'Black'}...", debug)
+                    # A distinct game key makes python-chess send ucinewgame to a reused engine
+                    game_key = (nn_name, generation, index, color)
+                    board, result, adjudication_reason = play_game(
+                        model, engine, engine_limit, color, game_key, adjudication, debug,
+                        engine_name=engine_name, reply_cache=reply_cache,
+                    )
+
+                    record_finished_game(board, nn_name, engine_name, generation, color, result, adjudication_reason, record_game, debug)
+
+                    points = score_finished_game(result, nn_name, color, debug)
+                    if points is None:
+                        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                        print(f"[{timestamp}] {nn_name} lost to engine {engine_name}. Final score: {score}. Tournament over.")
+                        debug_print(f"Final score for {nn_name}: {score}", debug)
+                        print_eval_cache_stats(nn_name, model, debug)
+                        return score, index
+                    score += points
+
+                debug_print(f"Current score: {score}", debug)
+                index += 1
 
         except IndexError:
             debug_print("No more engines to play against. Tournament complete!", debug)
@@ -156,6 +317,7 @@ def run_tournament(nn_name, generation, model, debug=False, start_level=0):
             break
 
     print(f"Final score for {nn_name}: {score}")
+    print_eval_cache_stats(nn_name, model, debug)
     return score, index
 
 if __name__ == "__main__":